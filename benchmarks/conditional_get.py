@@ -0,0 +1,88 @@
+"""simulate dashboards polling the read endpoints, with and without conditional GETs.
+
+    python benchmarks/conditional_get.py --seed            # scratch database, see query_plans.py --seed
+    python benchmarks/conditional_get.py --clients 30 --rounds 20 --write-every 5
+
+every round each client fetches the teacher's dashboard urls once. plain clients always download the body,
+conditional clients send back the ETag they were given and get a 304 while nothing changed. every
+--write-every rounds a student posts an observation response, so part of the dashboard changes"""
+import argparse, os, sys, time, uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fopd import create_app
+from fopd.models import Teacher, Student, Experiment, Assignment, Observation
+
+from query_plans import seed
+
+
+def dashboard():
+    """urls a teacher's dashboard polls, and the url of a write that changes some of them"""
+    teacher = Teacher.query.order_by(Teacher.id.desc()).first()
+    experiment = Experiment.query.filter_by(teacher_id = teacher.id).first()
+    assignment = Assignment.query.filter_by(teacher_id = teacher.id).first()
+    observation = Observation.query.filter_by(experiment_id = experiment.id).first()
+    student = Student.query.filter_by(teacher_id = teacher.id).first()
+
+    urls = [
+        f'/api/teacher/{teacher.public_id}',
+        f'/api/student/teacher/{teacher.public_id}',
+        f'/api/course/teacher/{teacher.public_id}',
+        f'/api/experiment/teacher/{teacher.public_id}',
+        f'/api/assignment/teacher/{teacher.public_id}',
+        f'/api/assignment/{assignment.public_id}/response',
+        f'/api/observation/experiment/{experiment.public_id}',
+        f'/api/observation/{observation.public_id}/response',
+    ]
+    return urls, f'/api/observation/{observation.public_id}/response', student.public_id
+
+
+def poll(app, clients, rounds, write_every, conditional):
+    """returns (seconds, requests, 304s, body bytes)"""
+    with app.app_context():
+        urls, write_url, student_id = dashboard()
+
+    client = app.test_client()
+    etags = {}
+    requests = not_modified = received = 0
+
+    start = time.perf_counter()
+    for round in range(rounds):
+        if write_every and round and round % write_every == 0:
+            client.post(write_url, json = {'student_id': student_id, 'response': str(uuid.uuid4())})
+
+        for c in range(clients):
+            for url in urls:
+                headers = {'If-None-Match': etags[(c, url)]} if conditional and (c, url) in etags else {}
+                response = client.get(url, headers = headers)
+                requests += 1
+                received += len(response.data)
+                if response.status_code == 304:
+                    not_modified += 1
+                elif response.headers.get('ETag'):
+                    etags[(c, url)] = response.headers['ETag']
+
+    return time.perf_counter() - start, requests, not_modified, received
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', action = 'store_true', help = 'insert synthetic rows first, only on a scratch database')
+    parser.add_argument('--clients', type = int, default = 10, help = 'dashboards polling')
+    parser.add_argument('--rounds', type = int, default = 10, help = 'polls per dashboard')
+    parser.add_argument('--write-every', type = int, default = 5, help = 'rounds between writes, 0 for none')
+    args = parser.parse_args()
+
+    app = create_app()
+    if args.seed:
+        with app.app_context():
+            seed(10, 30)
+
+    for label, conditional in [('plain', False), ('conditional', True)]:
+        elapsed, requests, not_modified, received = poll(app, args.clients, args.rounds, args.write_every, conditional)
+        print(f'{label}: {requests} requests in {elapsed:.2f} s ({requests / elapsed:.0f}/s), '
+              f'{not_modified} not modified, {received / 1024:.0f} KiB of bodies')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""measure how many concurrent logins per second the api sustains, inline hashing against the process pool.
+
+    python benchmarks/login_throughput.py --seed                  # scratch database, creates bench-login-* students
+    python benchmarks/login_throughput.py --workers 1 --workers 0 # compare inline (the default) with one process per cpu
+    python benchmarks/login_throughput.py --url http://localhost:5000 --clients 30
+
+without --url the logins go through the flask test client on threads, the way a threaded server runs them.
+with --url they hit a running server, start it with the PASSWORD_HASH_WORKERS to measure"""
+import argparse, os, statistics, sys, time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fopd import create_app, db, passwords
+from fopd.models import Teacher, Student
+
+USERNAME = 'bench-login-{}'
+PASSWORD = 'bench-password'
+
+
+def seed(app, accounts):
+    """a teacher and `accounts` students sharing one password, hashed with the configured cost"""
+    with app.app_context():
+        teacher = Teacher.query.filter_by(username = 'bench-login-teacher').first()
+        if not teacher:
+            teacher = Teacher(username = 'bench-login-teacher', password = passwords.hash(PASSWORD), public_id = 'bench-login-teacher')
+            db.session.add(teacher)
+            db.session.flush()
+
+        usernames = [USERNAME.format(i) for i in range(accounts)]
+        existing = {row.username for row in Student.query.filter(Student.username.in_(usernames)).with_entities(Student.username)}
+        missing = [username for username in usernames if username not in existing]
+
+        hashed = passwords.hashMany([PASSWORD] * len(missing))
+        db.session.bulk_insert_mappings(Student, [
+            {'username': username, 'password': password, 'public_id': username, 'teacher_id': teacher.id}
+            for username, password in zip(missing, hashed)
+        ])
+        db.session.commit()
+
+
+def login_local(app):
+    def login(username):
+        # a client per call, test clients keep cookies and are not meant to be shared by threads
+        return app.test_client().post('/api/auth/student/login', json = {'username': username, 'password': PASSWORD}).status_code
+    return login
+
+
+def login_remote(url):
+    import requests
+    session = requests.Session()
+    def login(username):
+        return session.post(f'{url}/api/auth/student/login', json = {'username': username, 'password': PASSWORD}).status_code
+    return login
+
+
+def run(login, clients, logins):
+    """fire `logins` logins from `clients` concurrent clients, returns (seconds, latencies in ms, failures)"""
+    def timed(i):
+        start = time.perf_counter()
+        status = login(USERNAME.format(i % clients))
+        return (time.perf_counter() - start) * 1000, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = clients) as executor:
+        results = list(executor.map(timed, range(logins)))
+    elapsed = time.perf_counter() - start
+
+    return elapsed, sorted(ms for ms, _ in results), sum(1 for _, status in results if status != 200)
+
+
+def report(label, elapsed, latencies, failures):
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f'{label}: {len(latencies) / elapsed:.1f} logins/s, p50 {statistics.median(latencies):.0f} ms, '
+          f'p95 {p95:.0f} ms, {failures} failed')
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', action = 'store_true', help = 'create the benchmark accounts first')
+    parser.add_argument('--clients', type = int, default = 30, help = 'concurrent clients, one account each')
+    parser.add_argument('--logins', type = int, default = 120, help = 'logins per measurement')
+    parser.add_argument('--rounds', type = int, default = None, help = 'bcrypt cost, defaults to BCRYPT_LOG_ROUNDS')
+    parser.add_argument('--workers', type = int, action = 'append', help = 'PASSWORD_HASH_WORKERS to measure, repeatable')
+    parser.add_argument('--url', default = None, help = 'measure a running server instead of the test client')
+    args = parser.parse_args()
+
+    app = create_app()
+    if args.rounds:
+        passwords.configure(rounds = args.rounds)
+    if args.seed:
+        seed(app, args.clients)
+
+    if args.url:
+        report(args.url, *run(login_remote(args.url.rstrip('/')), args.clients, args.logins))
+        return
+
+    for workers in args.workers or [app.config['PASSWORD_HASH_WORKERS']]:
+        passwords.configure(maxWorkers = workers or os.cpu_count() or 1)
+        # warm up the pool so process start up is not measured
+        run(login_local(app), min(args.clients, passwords.maxWorkers), passwords.maxWorkers)
+        report(f'{passwords.maxWorkers} worker(s), cost {passwords.rounds}', *run(login_local(app), args.clients, args.logins))
+    passwords.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""print the query plan and timing of the lookups the api makes on every request.
+
+run it against the same database before and after the index migration to compare:
+
+    python benchmarks/query_plans.py --seed > before.txt   # on a scratch database at c81e5b0f7a2d
+    python manage.py db upgrade
+    python benchmarks/query_plans.py > after.txt
+
+--seed fills the database with synthetic rows first, plans of near empty tables say little.
+only seed a scratch database, the rows are real inserts"""
+import argparse, os, sys, time, uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fopd import create_app, db, queries
+from fopd.models import Teacher, Student, Device, Course, Experiment, Assignment, AssignmentResponse, Observation, ObservationResponse
+from fopd.models import student_assignments, student_experiments, collaborators
+
+
+def seed(teachers, students_per_teacher):
+    """insert teachers with their students, courses, devices, experiments, assignments, observations and responses"""
+    def public_id():
+        return str(uuid.uuid4())
+
+    db.session.bulk_insert_mappings(Teacher, [
+        {'username': f'bench-teacher-{t}', 'password': 'x', 'public_id': public_id()} for t in range(teachers)
+    ])
+    teacher_ids = [row.id for row in Teacher.query.filter(Teacher.username.like('bench-teacher-%')).with_entities(Teacher.id)]
+
+    courses, devices, experiments, assignments = [], [], [], []
+    for teacher_id in teacher_ids:
+        courses += [{'name': f'course {c}', 'teacher_id': teacher_id, 'public_id': public_id()} for c in range(5)]
+        devices += [{'name': f'device {d}', 'teacher_id': teacher_id, 'public_id': public_id()} for d in range(2)]
+        assignments += [{'title': f'assignment {a}', 'description': 'x' * 200, 'type': 'text', 'teacher_id': teacher_id, 'public_id': public_id()} for a in range(20)]
+    db.session.bulk_insert_mappings(Course, courses)
+    db.session.bulk_insert_mappings(Device, devices)
+    db.session.bulk_insert_mappings(Assignment, assignments)
+
+    for teacher_id in teacher_ids:
+        course_ids = [row.id for row in Course.query.filter_by(teacher_id = teacher_id).with_entities(Course.id)]
+        db.session.bulk_insert_mappings(Student, [{
+            'username': f'bench-student-{teacher_id}-{s}', 'password': 'x', 'public_id': public_id(),
+            'teacher_id': teacher_id, 'course_id': course_ids[s % len(course_ids)]
+        } for s in range(students_per_teacher)])
+
+        device_ids = [row.id for row in Device.query.filter_by(teacher_id = teacher_id).with_entities(Device.id)]
+        experiments += [{
+            'title': f'experiment {e}', 'description': 'x' * 200, 'plant': 'basil', 'teacher_id': teacher_id,
+            'device_id': device_ids[e % len(device_ids)], 'public_id': public_id()
+        } for e in range(10)]
+    db.session.bulk_insert_mappings(Experiment, experiments)
+
+    for teacher_id in teacher_ids:
+        student_ids = [row.id for row in Student.query.filter_by(teacher_id = teacher_id).with_entities(Student.id)]
+        experiment_ids = [row.id for row in Experiment.query.filter_by(teacher_id = teacher_id).with_entities(Experiment.id)]
+        assignment_ids = [row.id for row in Assignment.query.filter_by(teacher_id = teacher_id).with_entities(Assignment.id)]
+
+        db.session.execute(student_experiments.insert(), [
+            {'experiment_id': e, 'student_id': s} for e in experiment_ids for s in student_ids[:30]
+        ])
+        db.session.execute(student_assignments.insert(), [
+            {'assignment_id': a, 'student_id': s} for a in assignment_ids for s in student_ids
+        ])
+        db.session.bulk_insert_mappings(AssignmentResponse, [
+            {'assignment_id': a, 'student_id': s, 'response': 'x' * 100, 'public_id': public_id()} for a in assignment_ids for s in student_ids[:10]
+        ])
+        db.session.bulk_insert_mappings(Observation, [
+            {'title': f'observation {o}', 'type': 'number', 'description': 'x' * 200, 'units': 'cm', 'experiment_id': e, 'public_id': public_id()}
+            for e in experiment_ids for o in range(10)
+        ])
+
+        observation_ids = [row.id for row in Observation.query.filter(Observation.experiment_id.in_(experiment_ids)).with_entities(Observation.id)]
+        db.session.execute(collaborators.insert(), [
+            {'observation_id': o, 'student_id': s} for o in observation_ids for s in student_ids[:3]
+        ])
+        db.session.bulk_insert_mappings(ObservationResponse, [
+            {'observation_id': o, 'student_id': s, 'response': '1', 'public_id': public_id()} for o in observation_ids for s in student_ids[:3]
+        ])
+
+    db.session.commit()
+
+
+def lookups():
+    """(name, query) of the statements behind the common handlers, eager loads spelled out as their own statements"""
+    teacher = Teacher.query.order_by(Teacher.id.desc()).first()
+    student = Student.query.filter_by(teacher_id = teacher.id).order_by(Student.id.desc()).first()
+    experiment = Experiment.query.filter_by(teacher_id = teacher.id).first()
+    assignment = Assignment.query.filter_by(teacher_id = teacher.id).first()
+    observation = Observation.query.filter_by(experiment_id = experiment.id).first()
+    course_ids = [row.id for row in Course.query.filter_by(teacher_id = teacher.id).with_entities(Course.id)]
+    experiment_ids = [row.id for row in Experiment.query.filter_by(teacher_id = teacher.id).with_entities(Experiment.id)]
+    observation_ids = [row.id for row in Observation.query.filter_by(experiment_id = experiment.id).with_entities(Observation.id)]
+
+    return [
+        ('student by public_id', Student.query.filter_by(public_id = student.public_id)),
+        ('teacher students', queries.teacher_students(teacher)),
+        ('teacher devices', queries.teacher_devices(teacher)),
+        ('teacher courses', queries.teacher_courses(teacher).enable_eagerloads(False)),
+        ('course students (eager load)', Student.query.filter(Student.course_id.in_(course_ids))),
+        ('teacher experiments', queries.teacher_experiments(teacher).enable_eagerloads(False)),
+        ('experiment students (eager load)', db.session.query(student_experiments).filter(student_experiments.c.experiment_id.in_(experiment_ids))),
+        ('student experiments', queries.student_experiment_list(student).enable_eagerloads(False)),
+        ('student assignments', queries.student_assignment_list(student)),
+        ('teacher assignments', queries.teacher_assignments(teacher).enable_eagerloads(False)),
+        ('experiment observations', queries.experiment_observations(experiment).enable_eagerloads(False)),
+        ('observation collaborators (eager load)', db.session.query(collaborators).filter(collaborators.c.observation_id.in_(observation_ids))),
+        ('observation responses', queries.observation_responses(observation).enable_eagerloads(False)),
+        ('assignment responses', queries.assignment_responses(assignment).enable_eagerloads(False)),
+        ('student assignment response', AssignmentResponse.query.filter_by(assignment_id = assignment.id, student_id = student.id)),
+    ]
+
+
+def explain(query, analyze):
+    sql = str(query.statement.compile(dialect = db.engine.dialect, compile_kwargs = {'literal_binds': True}))
+    if db.engine.dialect.name == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS)' if analyze else 'EXPLAIN'
+        return [row[0] for row in db.session.execute(f'{prefix} {sql}')]
+    if db.engine.dialect.name == 'sqlite':
+        return [row[-1] for row in db.session.execute(f'EXPLAIN QUERY PLAN {sql}')]
+    return [f'EXPLAIN is not supported for {db.engine.dialect.name}']
+
+
+def timed(query, runs):
+    """mean wall time in ms of running the query"""
+    start = time.perf_counter()
+    for _ in range(runs):
+        query.all()
+        db.session.expunge_all()
+    return (time.perf_counter() - start) * 1000 / runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', action = 'store_true', help = 'insert synthetic rows before explaining')
+    parser.add_argument('--teachers', type = int, default = 50, help = 'teachers to seed')
+    parser.add_argument('--students', type = int, default = 100, help = 'students per seeded teacher')
+    parser.add_argument('--runs', type = int, default = 20, help = 'timed runs per query')
+    parser.add_argument('--analyze', action = 'store_true', help = 'use EXPLAIN ANALYZE on postgres')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.seed:
+            seed(args.teachers, args.students)
+        # refresh the planner statistics so the plans reflect the data
+        db.session.execute('ANALYZE')
+
+        print(f'database: {db.engine.url.drivername}, teachers: {Teacher.query.count()}, students: {Student.query.count()}')
+        for name, query in lookups():
+            print(f'\n== {name}: {timed(query, args.runs):.2f} ms')
+            for line in explain(query, args.analyze):
+                print('  ', line)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,14 @@ from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 #from flask_migrate import Migrate
 
-from fopd.config import Config
+from fopd.config import Config, DEVELOPMENT_SECRET_KEY
+from fopd import loader
+from fopd.services.password_service import PasswordService
 
 # use same object with different apps
 db = SQLAlchemy()
 bcrypt = Bcrypt()
+passwords = PasswordService() # hashing off the request thread, see fopd/services/password_service.py
 cors = CORS()
 #migrate = Migrate()
 
@@ -16,11 +19,24 @@ def create_app(config_object = Config):
     app = Flask(__name__)
     app.config.from_object(config_object) # flask app configuration in config.py
 
+    if not app.config['SECRET_KEY']:
+        if not (app.debug or app.testing):
+            raise RuntimeError('SECRET_KEY is not set, access tokens would not verify across processes or restarts')
+        app.config['SECRET_KEY'] = DEVELOPMENT_SECRET_KEY
+
     # initialize object
     db.init_app(app)
     #migrate.init_app(app, db)
     cors.init_app(app, resources={r"*": {"origins": "*"}})
     bcrypt.init_app(app)
+    loader.init_app(app)
+    passwords.configure(maxWorkers = app.config['PASSWORD_HASH_WORKERS'], rounds = app.config['BCRYPT_LOG_ROUNDS'])
+
+    from fopd import versions, caching, events, changes
+    versions.init_app(app)
+    caching.init_app(app)
+    events.init_app(app)
+    changes.init_app(app)
 
     from fopd.students.routes import students
     from fopd.teachers.routes import teachers
@@ -31,6 +47,7 @@ def create_app(config_object = Config):
     from fopd.devices.routes import devices
     from fopd.observations.routes import observations
     from fopd.external.routes import externals
+    from fopd.sync.routes import sync
 
     app.register_blueprint(students)
     app.register_blueprint(teachers)
@@ -41,6 +58,7 @@ def create_app(config_object = Config):
     app.register_blueprint(devices)
     app.register_blueprint(observations)
     app.register_blueprint(externals)
+    app.register_blueprint(sync)
 
     return app
 
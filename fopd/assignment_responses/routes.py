@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request
 
 from fopd import db, bcrypt
 from fopd.models import Student, Teacher, Assignment, AssignmentResponse
+from fopd import queries, auth
+from fopd.loader import load
+from fopd import versions, validators, caching
+from fopd.pagination import paginate
+from fopd import serializers
+from fopd.serializers import jsonify
 
 import uuid, datetime
 
@@ -10,18 +16,17 @@ assignment_responses = Blueprint('assignment_responses', __name__)
 ERROR_CODE = 400
 SUCCESS_CODE = 200
 
-
 ### Assignment Responses
 @assignment_responses.route('/api/assignment/<assignment_id>/response/<response_id>', methods = ['DELETE'])
 def delete_response(assignment_id, response_id):
-    assignment = Assignment.query.filter_by(public_id = assignment_id).first()
+    assignment = load(Assignment, assignment_id)
     if not assignment:
         return jsonify({
             'status': 'fail',
             'message': 'Experiment does not exist'
         }), ERROR_CODE
 
-    assignment_response = AssignmentResponse.query.filter_by(public_id = response_id).first()
+    assignment_response = load(AssignmentResponse, response_id)
     if not assignment_response:
         return jsonify({
             'status': 'fail',
@@ -45,59 +50,41 @@ def delete_response(assignment_id, response_id):
 
 
 @assignment_responses.route('/api/assignment/<assignment_id>/response', methods = ['GET'])
+@versions.conditional(validators.get_all_responses_by_assignment)
+@caching.cached(AssignmentResponse, Assignment, Student, Teacher)
 def get_all_responses_by_assignment(assignment_id):
     """get assignment responses from assignment id"""
-    assignment = Assignment.query.filter_by(public_id = assignment_id).first()
+    assignment = load(Assignment, assignment_id)
     if not assignment:
         return jsonify({
             'status': 'fail',
             'message': 'Experiment does not exist'
         }), ERROR_CODE
 
-    output = []
-    for response in assignment.responses:  
-        output.append({
-            'id': response.public_id,
-            'submitted': str(response.submitted),
-            'comments': response.comments or '',
-            'response': response.response,
-            'student': {
-                'fname': response.student.fname,
-                'lname': response.student.lname,
-                'username': response.student.username,
-                'public_id': response.student.public_id,
-            },
-            'assignment': {
-                'id': assignment.public_id,
-                'title': assignment.title,
-                'description': assignment.description,
-                'type': assignment.type
-            },
-            'teacher': {
-                'fname': assignment.teacher.fname,
-                'lname': assignment.teacher.lname,
-                'username': assignment.teacher.username,
-                'public_id': assignment.teacher.public_id,
-            }
-        })
+    query, fields = serializers.assignment_response.select(queries.assignment_responses(assignment))
+    responses, page = paginate(query, AssignmentResponse.id)
+
+    output = serializers.assignment_response.dump_many(responses, fields)
     
     return jsonify({
         'status': 'success',
-        'assignment_response': output
+        'assignment_response': output,
+        **page
     }), SUCCESS_CODE
 
 
 @assignment_responses.route('/api/assignment/<assignment_id>/response/student/<student_id>', methods = ['GET'])
+@versions.conditional(validators.get_student_assignment_responses_by_assignment_id)
 def get_student_assignment_responses_by_assignment_id(student_id, assignment_id):
     """get student's assigment response"""
-    student = Student.query.filter_by(public_id = student_id).first()
+    student = load(Student, student_id)
     if not student:
         return jsonify({
             'status': 'fail',
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    assignment = Assignment.query.filter_by(public_id = assignment_id).first()
+    assignment = load(Assignment, assignment_id)
     if not assignment:
         return jsonify({
             'status': 'fail',
@@ -116,19 +103,8 @@ def get_student_assignment_responses_by_assignment_id(student_id, assignment_id)
         'submitted': str(assignment_response.submitted),
         'response': assignment_response.response,
         'comments': assignment_response.comments,
-        'assignment': {
-            'id': assignment.public_id,
-            'title': assignment.title,
-            'description': assignment.description,
-            'type': assignment.type,
-            'due_date': assignment.due_date
-        },
-        'student': {
-            'id': student.public_id,
-            'fname': student.fname,
-            'lname': student.lname,
-            'username': student.username
-        }
+        'assignment': serializers.assignment_summary.dump(assignment),
+        'student': serializers.student.dump(student)
     }
 
     return jsonify({
@@ -140,7 +116,7 @@ def get_student_assignment_responses_by_assignment_id(student_id, assignment_id)
 @assignment_responses.route('/api/assignment/<assignment_id>/response', methods = ['POST'])
 def create_assignment_response(assignment_id):
     """create an assignment response"""
-    assignment = Assignment.query.filter_by(public_id = assignment_id).first()
+    assignment = load(Assignment, assignment_id)
     if not assignment:
         return jsonify({
             'status': 'fail',
@@ -161,7 +137,7 @@ def create_assignment_response(assignment_id):
             'message': 'No student id provided. Cannot create assignment response without student'
         }), ERROR_CODE
 
-    student = Student.query.filter_by(public_id = student_id).first()
+    student = load(Student, student_id)
     if not student:
         return jsonify({
             'status': 'fail',
@@ -186,11 +162,7 @@ def create_assignment_response(assignment_id):
                 'id': response.public_id,
                 'comments': response.comments,
                 'response': response.response,
-                'student': {
-                    'id': student.public_id,
-                    'username': student.username,
-                    'fname': student.fname
-                }
+                'student': serializers.student.dump(student, ('id', 'username', 'fname'))
             }
         }), SUCCESS_CODE
     except Exception as e:
@@ -202,16 +174,17 @@ def create_assignment_response(assignment_id):
 
 
 @assignment_responses.route('/api/assignment/<assignment_id>/response/<assignment_response_id>/student/<student_id>', methods = ['PUT', 'POST'])
+@auth.identified
 def update_student_response(assignment_id, student_id, assignment_response_id):
     """update student assignment response"""
-    assignment = Assignment.query.filter_by(public_id = assignment_id).first()
+    assignment = load(Assignment, assignment_id)
     if not assignment:
         return jsonify({
             'status': 'fail',
             'message': 'Experiment does not exist'
         }), ERROR_CODE
 
-    student = Student.query.filter_by(public_id = student_id).first()
+    student = auth.account(Student, student_id, verify = True)
     if not student:
         return jsonify({
             'status': 'fail',
@@ -260,23 +233,24 @@ def update_student_response(assignment_id, student_id, assignment_response_id):
         }), ERROR_CODE
 
 @assignment_responses.route('/api/assignment/<assignment_id>/response/<assignment_response_id>/teacher/<teacher_id>', methods = ['PUT', 'POST'])
+@auth.identified
 def add_comment_to_assignment_response(teacher_id, assignment_id, assignment_response_id):
     """add comments to assignment response"""
-    assignment = Assignment.query.filter_by(public_id = assignment_id).first()
+    assignment = load(Assignment, assignment_id)
     if not assignment:
         return jsonify({
             'status': 'fail',
             'message': f'Assignment id `{assignment_id}` does not exist'
         }), ERROR_CODE
 
-    assignment_response = AssignmentResponse.query.filter_by(public_id = assignment_response_id).first()
+    assignment_response = load(AssignmentResponse, assignment_response_id)
     if not assignment_response:
         return jsonify({
             'status': 'fail',
             'message': f'Assignment response id `{assignment_response_id}` does not exist'
         }), ERROR_CODE
 
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = auth.account(Teacher, teacher_id, verify = True)
     if not teacher:
         return jsonify({
             'status': 'fail',
@@ -302,12 +276,7 @@ def add_comment_to_assignment_response(teacher_id, assignment_id, assignment_res
                 'response': assignment_response.response,
                 'comments': assignment_response.comments,
                 'submitted': str(assignment_response.submitted),
-                'student': {
-                    'id': assignment_response.student.public_id,
-                    'fname': assignment_response.student.fname,
-                    'lname': assignment_response.student.lname,
-                    'username': assignment_response.student.username
-                }
+                'student': serializers.student.dump(assignment_response.student)
             }
         }), SUCCESS_CODE
     except Exception as e:
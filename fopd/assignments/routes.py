@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request
 
 from fopd import db, bcrypt
 from fopd.models import Student, Teacher, Assignment
+from fopd import queries, auth
+from fopd.loader import load
+from fopd import versions, validators, caching
+from fopd.pagination import paginate
+from fopd import serializers
+from fopd.serializers import jsonify
 
 import uuid, datetime
 
@@ -12,135 +18,80 @@ SUCCESS_CODE = 200
 
 ### Assignments
 @assignments.route('/api/assignment/student/<student_id>', methods = ['GET'])
+@versions.conditional(validators.get_all_student_assignments)
+@caching.cached(Assignment, Student)
 def get_all_student_assignments(student_id):
     """get all student assignments"""
-    student = Student.query.filter_by(public_id = student_id).first()
+    student = load(Student, student_id)
     if not student:
         return jsonify({
             'status': 'fail',
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    assignments = student.assignments
-    assignment_output = []
-    for assignment in assignments:
-        output = {
-            'id': assignment.public_id,
-            'title': assignment.title,
-            'description': assignment.description,
-            'type': assignment.type,
-            'due_date': str(assignment.due_date)
-        }
-    
-        assignment_output.append(output)
+    query, fields = serializers.assignment_summary.select(queries.student_assignment_list(student))
+    assignments, page = paginate(query, Assignment.id)
+    assignment_output = serializers.assignment_summary.dump_many(assignments, fields)
 
     return jsonify({
         'status': 'success',
         'length': len(assignment_output),
         'assignments': assignment_output,
-        'assignees': {
-            'fname': student.fname,
-            'lname': student.lname,
-            'id': student.public_id,
-            'username': student.username
-        }
+        'assignees': serializers.student.dump(student),
+        **page
     }), SUCCESS_CODE
 
     pass
 
 @assignments.route('/api/assignment/teacher/<teacher_id>', methods = ['GET'])
+@versions.conditional(validators.get_all_teacher_assignments)
+@caching.cached(Assignment, Student, Teacher)
 def get_all_teacher_assignments(teacher_id):
     """get all teacher assignments"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
     if not teacher:
         return jsonify({
             'status': 'fail',
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    assignments = teacher.assigned_assignments
-    assignment_output = []
-    for assignment in assignments:
-
-        students_output = []
-        for student in assignment.students:
-            students_output.append({
-                'fname': student.fname,
-                'lname': student.lname,
-                'id': student.public_id,
-                'username': student.username
-            })
-
-        output = {
-            'id': assignment.public_id,
-            'title': assignment.title,
-            'description': assignment.description,
-            'type': assignment.type,
-            'due_date': str(assignment.due_date),
-            'assignees': students_output,
-            'num_assignees': len(students_output)
-        }
-    
-        assignment_output.append(output)
+    query, fields = serializers.assignment.select(queries.teacher_assignments(teacher))
+    assignments, page = paginate(query, Assignment.id)
+    assignment_output = serializers.assignment.dump_many(assignments, fields)
 
     return jsonify({
         'status': 'success',
         'length': len(assignment_output),
         'assignments': assignment_output,
-        'teacher': {
-            'fname': teacher.fname,
-            'lname': teacher.lname,
-            'id': teacher.public_id,
-            'username': teacher.username
-        }
+        'teacher': serializers.teacher.dump(teacher),
+        **page
     }), SUCCESS_CODE
 
 @assignments.route('/api/assignment/<assignment_id>', methods = ['GET'])
+@versions.conditional(validators.get_assignment_by_id)
 def get_assignment_by_id(assignment_id):
     """get assignment by id"""
-    assignment = Assignment.query.filter_by(public_id = assignment_id).first()
+    assignment = load(Assignment, assignment_id)
     if not assignment:
         return jsonify({
             'status': 'fail',
             'message': 'Assignmnet does not exist'
         }), ERROR_CODE
 
-    students = []
-    for student in assignment.students:
-        output = {
-            'fname': student.fname,
-            'lname': student.lname,
-            'id': student.public_id,
-            'username': student.username
-        }
-
-        students.append(output)
-
-    teacher = {
-        'fname': student.fname,
-        'lname': student.lname,
-        'id': student.public_id,
-        'username': student.username
-    }
+    students = serializers.student.dump_many(assignment.students)
 
     return jsonify({
         'status': 'success',
         'num_assignees': len(students),
         'assignees': students,
-        'teacher': teacher,
-        'assignment': {
-            'id': assignment.public_id,
-            'title': assignment.title,
-            'description': assignment.description,
-            'type': assignment.type,
-            'due_date': str(assignment.due_date)
-        }
+        'teacher': serializers.teacher.dump(assignment.teacher),
+        'assignment': serializers.assignment_summary.dump(assignment)
     }), SUCCESS_CODE
 
 @assignments.route('/api/assignment/teacher/<teacher_id>', methods = ['POST'])
 def create_assignment(teacher_id):
     """create new assignment"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
     if not teacher:
         return jsonify({
             'status': 'fail',
@@ -164,21 +115,16 @@ def create_assignment(teacher_id):
 
     assignment.teacher = teacher
     student_list = []
-    student_ids = assignment_info.get('student_ids', [])
-    for student_id in student_ids:
-        student = Student.query.filter_by(public_id = student_id).first()
-        #student.assignments.append(assignment)
-
-        print(student)
-        if student:
-            assignment.students.append(student)
-
-            student_list.append({
-                'fname': student.fname,
-                'lname': student.lname,
-                'id': student.public_id,
-                'username': student.username
-            })
+    try:
+        student_ids = queries.id_list(assignment_info.get('student_ids', None), 'student_ids')
+    except ValueError as e:
+        return jsonify({
+            'status': 'fail',
+            'message': str(e)
+        }), ERROR_CODE
+    students, missing_student_ids = queries.students_by_public_id(student_ids)
+    assignment.students = students
+    student_list = serializers.student.dump_many(students)
 
     try:
         db.session.add(assignment)
@@ -186,21 +132,11 @@ def create_assignment(teacher_id):
 
         return jsonify({
             'status': 'success',
-            'assignment': {
-                'id': assignment.public_id,
-                'title': assignment.title,
-                'description': assignment.description,
-                'type': assignment.type,
-                'due_date': str(assignment.due_date)
-            }, 
+            'assignment': serializers.assignment_summary.dump(assignment),
             'assignees': student_list,
             'num_assignees': len(student_list),
-            'teacher': {
-                'fname': teacher.fname,
-                'lname': teacher.lname,
-                'username': teacher.username,
-                'id': teacher.public_id
-            }
+            'missing_student_ids': missing_student_ids,
+            'teacher': serializers.teacher.dump(teacher)
         }), SUCCESS_CODE
     except Exception as e:
         print(e)
@@ -214,14 +150,14 @@ def create_assignment(teacher_id):
 @assignments.route('/api/assignment/<assignment_id>/teacher/<teacher_id>', methods = ['PUT', 'POST'])
 def update_assignment(teacher_id, assignment_id):
     """update assignment"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
     if not teacher:
         return jsonify({
             'status': 'fail',
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    assignment = Assignment.query.filter_by(public_id = assignment_id).first()
+    assignment = load(Assignment, assignment_id)
     if not assignment:
         return jsonify({
             'status': 'fail',
@@ -259,21 +195,20 @@ def update_assignment(teacher_id, assignment_id):
         assignment.due_date = due_date
 
     student_list = []
-    student_ids = assignment_info.get('student_ids', [])
-
-    for student_id in student_ids:
-        student = Student.query.filter_by(public_id = student_id).first()
+    try:
+        student_ids = queries.id_list(assignment_info.get('student_ids', None), 'student_ids')
+    except ValueError as e:
+        return jsonify({
+            'status': 'fail',
+            'message': str(e)
+        }), ERROR_CODE
+    students, missing_student_ids = queries.students_by_public_id(student_ids)
 
-        if student:
+    existing = set(assignment.students) if students else set()
+    for student in students:
+        if student not in existing:
             assignment.students.append(student)
-
-            output = {
-                'fname': student.fname,
-                'lname': student.lname,
-                'username': student.username,
-                'id': student.public_id
-            }
-            student_list.append(output)
+            student_list.append(serializers.student.dump(student))
 
     try:
         db.session.add(assignment)
@@ -281,21 +216,11 @@ def update_assignment(teacher_id, assignment_id):
 
         return jsonify({
             'status': 'success',
-            'assignment': {
-                'id': assignment.public_id,
-                'title': assignment.title,
-                'description': assignment.description,
-                'type': assignment.type,
-                'due_date': str(assignment.due_date)
-            },
+            'assignment': serializers.assignment_summary.dump(assignment),
             'assignees': student_list, # + assignment.students,
             'num_assignees': len(student_list),
-            'teacher': {
-                'fname': teacher.fname,
-                'lname': teacher.lname,
-                'username': teacher.username,
-                'id': teacher.public_id
-            }
+            'missing_student_ids': missing_student_ids,
+            'teacher': serializers.teacher.dump(teacher)
         }), SUCCESS_CODE
     except Exception as e:
         print(e)
@@ -305,23 +230,24 @@ def update_assignment(teacher_id, assignment_id):
         }), ERROR_CODE
 
 @assignments.route('/api/assignment/<assignment_id>/teacher/<teacher_id>', methods = ['DELETE'])
+@auth.identified
 def delete_assignment(teacher_id, assignment_id):
     """delete assignment"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = auth.account(Teacher, teacher_id, verify = True)
     if not teacher:
         return jsonify({
             'status': 'fail',
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    assignment = Assignment.query.filter_by(public_id = assignment_id).first()
+    assignment = load(Assignment, assignment_id)
     if not assignment:
         return jsonify({
             'status': 'fail',
             'message': 'Assignment does not exist'
         }), ERROR_CODE
 
-    if assignment.teacher != teacher:
+    if assignment.teacher_id != teacher.id:
         return jsonify({
             'status': 'fail',
             'message': 'Teacher not authorized to delete assignment'
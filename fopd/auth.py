@@ -0,0 +1,85 @@
+from functools import wraps
+
+from flask import current_app, request, g
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+from fopd import db
+from fopd.models import Teacher, Student
+from fopd.loader import load
+from fopd.serializers import jsonify
+
+UNAUTHORIZED_CODE = 401
+
+ROLES = {
+    Teacher: 'teacher',
+    Student: 'student'
+}
+
+class Identity(object):
+    """account a verified token was issued to, built from the token alone"""
+    def __init__(self, role, id, public_id):
+        self.role = role
+        self.id = id
+        self.public_id = public_id
+
+    def __repr__(self):
+        return f'<Identity("{self.role}", "{self.public_id}")>'
+
+### Tokens
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt = 'access-token')
+
+def issue_token(account):
+    """signed token carrying the account's primary key, public id and role, valid for ACCESS_TOKEN_SECONDS"""
+    return _serializer().dumps({
+        'role': ROLES[type(account)],
+        'id': account.id,
+        'public_id': account.public_id
+    })
+
+def verify_token(token):
+    """Identity of a token, None when it is forged, malformed or expired"""
+    try:
+        data = _serializer().loads(token, max_age = current_app.config['ACCESS_TOKEN_SECONDS'])
+        return Identity(data['role'], data['id'], data['public_id'])
+    except (BadSignature, KeyError, TypeError):
+        return None
+
+### Request identity
+
+def identified(f):
+    """verify the request's `Authorization: Bearer <token>` into g.identity without touching the database.
+    requests without a token go through with g.identity None, a bad or expired token is refused"""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        g.identity = None
+
+        header = request.headers.get('Authorization', '')
+        if header:
+            scheme, _, token = header.partition(' ')
+            if scheme.lower() == 'bearer':
+                g.identity = verify_token(token.strip())
+
+            if not g.identity:
+                return jsonify({
+                    'status': 'fail',
+                    'message': 'Invalid or expired token'
+                }), UNAUTHORIZED_CODE
+
+        return f(*args, **kwargs)
+    return wrapper
+
+def account(model, public_id, verify = False):
+    """the account behind public_id, for handlers that only need its `id` and `public_id`.
+    returns the token's Identity when the request carries one for that account, so no row is loaded,
+    otherwise loads the row. None when there is no such account.
+    a token outlives the deletion of its account until it expires, so with `verify` a primary key
+    lookup makes sure the account still exists; handlers that write pass it, reads of a deleted
+    account just come back empty"""
+    identity = g.get('identity', None)
+    if identity and identity.role == ROLES[model] and identity.public_id == public_id:
+        if verify and db.session.query(model.id).filter(model.id == identity.id).first() is None:
+            return None
+        return identity
+    return load(model, public_id)
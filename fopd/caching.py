@@ -0,0 +1,71 @@
+from functools import wraps
+
+from flask import current_app, request, make_response, g
+from sqlalchemy import event
+
+from fopd import db, versions
+from fopd.services.cache import makeCache
+from fopd.serializers import jsonify
+
+### Response cache
+# bodies of read endpoints cached by url and the etag versions.conditional computed for the request
+# before the handler ran. once the rendered rows change, in any worker, requests get a new etag and
+# miss. entries are tagged with the tables they render and a commit drops the ones tagged with a table
+# it wrote, to free them before they expire
+
+SUCCESS_CODE = 200
+
+responses = None
+
+def _after_commit(session):
+    tables = versions.written_tables(session)
+    if responses is not None and tables:
+        responses.invalidate(*tables)
+
+def init_app(app):
+    global responses
+    backend = app.config['RESPONSE_CACHE_BACKEND']
+    if backend not in ('memory', 'redis', 'none', None, ''):
+        raise ValueError(f'Unknown response cache backend `{backend}`, use memory, redis or none')
+    responses = makeCache(backend, app.config['RESPONSE_CACHE_SIZE'], url = app.config['RESPONSE_CACHE_URL'])
+
+    if not event.contains(db.session, 'after_commit', _after_commit):
+        event.listen(db.session, 'after_commit', _after_commit)
+
+    app.add_url_rule('/api/cache/stats', 'get_response_cache_stats', get_response_cache_stats, methods = ['GET'])
+
+def cached(*models):
+    """serve the handler's successful response from the cache while the etag of the request is unchanged.
+    goes under versions.conditional, without an etag the handler always runs"""
+    tags = sorted({model.__table__.name for model in models})
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            etag = g.get('etag')
+            if responses is None or etag is None:
+                return f(*args, **kwargs)
+
+            key = ('response', request.full_path, etag)
+            entry = responses.get(key)
+            if entry is not None:
+                return current_app.response_class(entry['body'], mimetype = entry['mimetype'])
+
+            response = make_response(f(*args, **kwargs))
+            # keyed by the etag read before the handler ran: if a commit changed the rows meanwhile,
+            # the next request has a new etag and misses instead of getting this body for it
+            if response.status_code == 200:
+                responses.set(key, {
+                    'body': response.get_data(as_text = True),
+                    'mimetype': response.mimetype
+                }, ttl = current_app.config['RESPONSE_CACHE_TTL'], tags = tags)
+            return response
+        return wrapper
+    return decorator
+
+def get_response_cache_stats():
+    """hit and miss counters of the response cache"""
+    return jsonify({
+        'status': 'success',
+        'cache': responses.stats() if responses is not None else None
+    }), SUCCESS_CODE
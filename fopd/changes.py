@@ -0,0 +1,76 @@
+import datetime
+
+from sqlalchemy import event, inspect
+
+from fopd import db
+from fopd.models import Teacher, Student, Device, Course, Experiment, Assignment, AssignmentResponse, Observation, ObservationResponse, Tombstone
+
+### Change tracking
+# before each flush, rows that changed get a new updated_at, including changes to their collections which
+# write no column of their own. deleted rows of the synced models leave a tombstone for the class of their
+# teacher, and students taken off an experiment or assignment get a tombstone of their own, as do members
+# from another teacher's class when it is deleted (see fopd/sync/routes.py)
+
+STAMPED = (Teacher, Student, Device, Course, Experiment, Assignment, AssignmentResponse, Observation, ObservationResponse)
+
+# model -> (teacher id the row belongs to, student id when only one student syncs it), None when no one syncs it
+TRACKED = {
+    Experiment: lambda experiment: (experiment.teacher_id, None),
+    Assignment: lambda assignment: (assignment.teacher_id, None),
+    Observation: lambda observation: (observation.experiment.teacher_id, None),
+    ObservationResponse: lambda response: (response.student.teacher_id, response.student_id) if response.student else None,
+    AssignmentResponse: lambda response: (response.student.teacher_id, response.student_id) if response.student else None
+}
+
+# memberships whose removal hides the row from the removed students, or whose row's deletion hides it from its members
+MEMBERS = {
+    Experiment: 'students',
+    Assignment: 'students'
+}
+
+def _tombstone(session, obj, now, student_id = None):
+    owner = TRACKED[type(obj)](obj)
+    if owner is None:
+        return
+    teacher_id, owner_id = owner
+    session.add(Tombstone(
+        table_name = obj.__table__.name,
+        public_id = obj.public_id,
+        teacher_id = teacher_id,
+        student_id = student_id or owner_id,
+        deleted_at = now
+    ))
+
+def _before_flush(session, flush_context, instances):
+    now = datetime.datetime.utcnow()
+
+    for obj in list(session.dirty):
+        if not isinstance(obj, STAMPED) or not session.is_modified(obj):
+            continue
+        obj.updated_at = now
+
+        members = MEMBERS.get(type(obj))
+        if members:
+            for student in inspect(obj).attrs[members].history.deleted or ():
+                _tombstone(session, obj, now, student_id = student.id)
+
+    for obj in list(session.deleted):
+        if type(obj) in TRACKED:
+            _tombstone(session, obj, now)
+
+        members = MEMBERS.get(type(obj))
+        if members:
+            # their memberships go with the row, so their syncs no longer look at its teacher's tombstones
+            for student in getattr(obj, members):
+                if student.teacher_id != obj.teacher_id:
+                    _tombstone(session, obj, now, student_id = student.id)
+
+def init_app(app):
+    if not event.contains(db.session, 'before_flush', _before_flush):
+        event.listen(db.session, 'before_flush', _before_flush)
+
+def prune(before):
+    """delete the tombstones older than `before`, returns how many"""
+    count = Tombstone.query.filter(Tombstone.deleted_at < before).delete(synchronize_session = False)
+    db.session.commit()
+    return count
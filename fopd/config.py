@@ -1,4 +1,4 @@
-import os, dotenv, uuid
+import os, dotenv
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 ENV_PATH = os.path.join(basedir, '.env')
@@ -7,7 +7,88 @@ ENV_PATH = os.path.join(basedir, '.env')
 
 dotenv.load_dotenv(verbose = True, dotenv_path = ENV_PATH)
 
+# signs access tokens when SECRET_KEY is unset, only accepted with DEBUG or TESTING on (see create_app)
+DEVELOPMENT_SECRET_KEY = 'fopd-development-secret-key'
+
 class Config:
-    DEBUG = os.getenv('DEBUG', True)
-    SECRET_KEY = os.getenv('SECRET_KEY', str(uuid.uuid1()))
-    SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI', 'postgresql://localhost/flasktestdb2')
\ No newline at end of file
+    DEBUG = os.getenv('DEBUG', 'True').lower() in ('1', 'true', 'yes', 'on')
+    # tokens only verify in processes sharing the key, so it has to be set outside development
+    SECRET_KEY = os.getenv('SECRET_KEY', None)
+    SQLALCHEMY_DATABASE_URI = os.getenv('SQLALCHEMY_DATABASE_URI', 'postgresql://localhost/flasktestdb2')
+
+    # lifetime of the access tokens issued on login
+    ACCESS_TOKEN_SECONDS = int(os.getenv('ACCESS_TOKEN_SECONDS', 24 * 60 * 60))
+
+    # default and largest page size of list endpoints (?limit=&cursor=)
+    PAGE_SIZE = int(os.getenv('PAGE_SIZE', 100))
+    MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 1000))
+
+    # bcrypt cost of new hashes, existing hashes of another cost are replaced on the next login
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    # processes hashing and checking passwords, 1 runs them on the request thread and 0 starts one per cpu.
+    # every server worker starts its own pool, keep server workers x this at or below the cpus of the host,
+    # e.g. 2 with 4 gunicorn workers on 8 cores. 0 only suits a single server worker
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 1))
+
+    # largest roster accepted by the bulk student registration
+    BULK_REGISTER_MAX_ROWS = int(os.getenv('BULK_REGISTER_MAX_ROWS', 2000))
+    # largest batch of observation responses accepted at once
+    BATCH_RESPONSES_MAX_ROWS = int(os.getenv('BATCH_RESPONSES_MAX_ROWS', 1000))
+
+    # cache of read endpoint responses: memory, redis or none. entries are dropped on commits writing their tables,
+    # the ttl bounds how long other processes can serve a stale entry with the memory backend
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+    RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', 512))
+    RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 30))
+    RESPONSE_CACHE_URL = os.getenv('RESPONSE_CACHE_URL', 'redis://localhost:6379/0')
+
+    # fan-out of observation response events to the event streams: memory reaches the streams of this
+    # process only, redis those of every worker. keepalive comments every few seconds keep proxies from closing idle streams.
+    # the last few events of each channel are kept for clients reconnecting with Last-Event-ID
+    EVENT_BROKER_BACKEND = os.getenv('EVENT_BROKER_BACKEND', 'memory')
+    EVENT_BROKER_URL = os.getenv('EVENT_BROKER_URL', 'redis://localhost:6379/0')
+    EVENT_STREAM_KEEPALIVE = int(os.getenv('EVENT_STREAM_KEEPALIVE', 15))
+    EVENT_STREAM_RETRY_MS = int(os.getenv('EVENT_STREAM_RETRY_MS', 3000))
+    EVENT_STREAM_BACKLOG = int(os.getenv('EVENT_STREAM_BACKLOG', 100))
+
+    # offline sync: tombstones of deleted rows are kept this many days, clients that synced before get everything again.
+    # each sync also resends what changed in the seconds before the previous one, for writes committed late
+    SYNC_TOMBSTONE_DAYS = int(os.getenv('SYNC_TOMBSTONE_DAYS', 90))
+    SYNC_OVERLAP_SECONDS = int(os.getenv('SYNC_OVERLAP_SECONDS', 60))
+
+    # seconds before a partially fetched day of device readings is refreshed upstream
+    READINGS_REFRESH_SECONDS = int(os.getenv('READINGS_REFRESH_SECONDS', 300))
+
+    # background ingestion of device readings (python manage.py ingest)
+    INGEST_INTERVAL_SECONDS = int(os.getenv('INGEST_INTERVAL_SECONDS', 300))
+    INGEST_BACKFILL_DAYS = int(os.getenv('INGEST_BACKFILL_DAYS', 7))
+
+    # upper bound on concurrent requests to the fopd server
+    EXTERNAL_MAX_WORKERS = int(os.getenv('EXTERNAL_MAX_WORKERS', 8))
+
+    # fopd server client: keep-alive pool size, timeouts in seconds and retries with exponential backoff
+    EXTERNAL_POOL_SIZE = int(os.getenv('EXTERNAL_POOL_SIZE', 8))
+    EXTERNAL_CONNECT_TIMEOUT = float(os.getenv('EXTERNAL_CONNECT_TIMEOUT', 5))
+    EXTERNAL_READ_TIMEOUT = float(os.getenv('EXTERNAL_READ_TIMEOUT', 30))
+    EXTERNAL_RETRIES = int(os.getenv('EXTERNAL_RETRIES', 3))
+    EXTERNAL_BACKOFF = float(os.getenv('EXTERNAL_BACKOFF', 0.5))
+    EXTERNAL_SESSION_TTL = int(os.getenv('EXTERNAL_SESSION_TTL', 3600)) # seconds before logging in again
+
+    # long observation ranges are fetched upstream in chunks of this many days
+    EXTERNAL_CHUNK_DAYS = int(os.getenv('EXTERNAL_CHUNK_DAYS', 7))
+    EXTERNAL_CHUNK_RETRIES = int(os.getenv('EXTERNAL_CHUNK_RETRIES', 1))
+
+    # cache of upstream observation responses: memory, sqlite or none
+    EXTERNAL_CACHE_BACKEND = os.getenv('EXTERNAL_CACHE_BACKEND', 'memory')
+    EXTERNAL_CACHE_SIZE = int(os.getenv('EXTERNAL_CACHE_SIZE', 1024))
+    EXTERNAL_CACHE_TTL = int(os.getenv('EXTERNAL_CACHE_TTL', 60)) # seconds, for ranges reaching today
+    EXTERNAL_CACHE_PATH = os.getenv('EXTERNAL_CACHE_PATH', os.path.join(basedir, 'cache', 'external.sqlite'))
+
+    # directory for file locks that coalesce identical upstream requests across workers, unset for per-process only
+    EXTERNAL_LOCK_DIR = os.getenv('EXTERNAL_LOCK_DIR', None)
+
+    # on-disk store of device images and their thumbnails
+    IMAGE_STORE_PATH = os.getenv('IMAGE_STORE_PATH', os.path.join(basedir, 'cache', 'images'))
+    IMAGE_STORE_MAX_BYTES = int(os.getenv('IMAGE_STORE_MAX_BYTES', 512 * 1024 * 1024))
+    IMAGE_THUMBNAIL_SIZE = int(os.getenv('IMAGE_THUMBNAIL_SIZE', 320)) # pixels, longest side
+    IMAGE_CACHE_SECONDS = int(os.getenv('IMAGE_CACHE_SECONDS', 24 * 60 * 60))
\ No newline at end of file
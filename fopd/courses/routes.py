@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request
 
 from fopd import db, bcrypt
 from fopd.models import Teacher, Student, Course
+from fopd import queries, auth
+from fopd.loader import load
+from fopd import versions, validators, caching
+from fopd.pagination import paginate
+from fopd import serializers
+from fopd.serializers import jsonify
 
 import uuid
 
@@ -12,57 +18,40 @@ SUCCESS_CODE = 200
 
 ### Courses
 @courses.route('/api/course/teacher/<teacher_id>', methods = ['GET'])
+@auth.identified
+@versions.conditional(validators.get_teacher_courses)
+@caching.cached(Course, Student, Teacher)
 def get_teacher_courses(teacher_id):
     """get a list of teacher's courses by id"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = auth.account(Teacher, teacher_id)
     if not teacher:
         return jsonify({
             'status': 'fail',
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    formatted_courses = []
-    for course in teacher.courses:
-        students = []
-
-        for student in course.students:
-            student_output = {
-                'fname': student.fname,
-                'lname': student.lname,
-                'username': student.username,
-                'id': student.public_id
-            }
-            students.append(student_output)
-        
-        course_output = {
-            'name': course.name,
-            'id': course.public_id,
-            'students': students,
-            'num_students': len(students),
-            'teacher': {
-                'fname': teacher.fname,
-                'lname': teacher.lname,
-                'username': teacher.username,
-                'public_id': teacher.public_id
-            }
-        }
-        formatted_courses.append(course_output)
+    query, fields = serializers.course.select(queries.teacher_courses(teacher))
+    courses, page = paginate(query, Course.id)
+
+    formatted_courses = serializers.course.dump_many(courses, fields)
     return jsonify({
         'status': 'success',
-        'courses': formatted_courses
+        'courses': formatted_courses,
+        **page
     })
 
 @courses.route('/api/course/<course_id>/teacher/<teacher_id>', methods = ['GET'])
+@versions.conditional(validators.get_teacher_course_by_id)
 def  get_teacher_course_by_id(course_id, teacher_id):
     """get teacher's course by teacher_id"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
     if not teacher:
         return jsonify({
             'status': 'fail',
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    course = Course.query.filter_by(public_id = course_id).first()
+    course = load(Course, course_id)
     if not course:
         return jsonify({
             'status': 'fail',
@@ -75,27 +64,7 @@ def  get_teacher_course_by_id(course_id, teacher_id):
             'message': 'Teacher does not have permission to access this course'
         }), ERROR_CODE
 
-    students = []
-    for student in course.students:
-        students.append({
-            'fname': student.fname,
-            'lname': student.lname,
-            'id': student.public_id,
-            'username': student.username
-        })
-
-    output = {
-        'name': course.name,
-        'id': course.public_id,
-        'teacher': {
-            'fname': teacher.fname,
-            'lname': teacher.lname,
-            'username': teacher.username,
-            'id': teacher.public_id
-        },
-        'students': students,
-        'num_students': len(students)
-    }
+    output = serializers.course_detail.dump(course)
 
     return jsonify({
         'status': 'success',
@@ -103,36 +72,17 @@ def  get_teacher_course_by_id(course_id, teacher_id):
     }), SUCCESS_CODE
 
 @courses.route('/api/course/<course_id>', methods = ['GET'])
+@versions.conditional(validators.get_course_by_id)
 def  get_course_by_id(course_id):
     """get course by course_id"""
-    course = Course.query.filter_by(public_id = course_id).first()
+    course = load(Course, course_id)
     if not course:
         return jsonify({
             'status': 'fail',
             'message': 'Course does not exist'
         }), ERROR_CODE    
 
-    students = []
-    for student in course.students:
-        students.append({
-            'fname': student.fname,
-            'lname': student.lname,
-            'id': student.public_id,
-            'username': student.username
-        })
-
-    output = {
-        'name': course.name,
-        'id': course.public_id,
-        'teacher': {
-            'fname': course.teacher.fname,
-            'lname': course.teacher.lname,
-            'username': course.teacher.username,
-            'id': course.teacher.public_id
-        },
-        'students': students,
-        'num_students': len(students)
-    }   
+    output = serializers.course_detail.dump(course)
 
     return jsonify({
         'status': 'success',
@@ -140,22 +90,23 @@ def  get_course_by_id(course_id):
     }), SUCCESS_CODE
 
 @courses.route('/api/course/<course_id>/teacher/<teacher_id>', methods = ['DELETE'])
+@auth.identified
 def delete_course_by_teacher(course_id, teacher_id):
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = auth.account(Teacher, teacher_id, verify = True)
     if not teacher:
         return jsonify({
             'status': 'fail',
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    course = Course.query.filter_by(public_id = course_id).first()
+    course = load(Course, course_id)
     if not course:
         return jsonify({
             'status': 'fail',
             'message': 'Course does not exist'
         }), ERROR_CODE      
 
-    if course.teacher != teacher:
+    if course.teacher_id != teacher.id:
         return jsonify({
             'status': 'fail',
             'message': 'Teacher does not have permission to access this course'
@@ -202,36 +153,20 @@ def register_course():
         public_id = str(uuid.uuid4())
     )
 
-    student_usernames = course_info.get('student_username', [])
+    try:
+        student_usernames = queries.id_list(course_info.get('student_username', None), 'student_username')
+    except ValueError as e:
+        return jsonify({
+            'status': 'fail',
+            'message': str(e)
+        }), ERROR_CODE
 
     course.teacher = teacher
 
 
-    student_output = []
-    if student_usernames:
-        course.students = []
-        for student_username in student_usernames:
-            student = Student.query.filter_by(username = student_username).first()
-
-            if student:
-                course.students.append(student)
-
-                output = {
-                    'fname': student.fname,
-                    'lname': student.lname,
-                    'username': student.username,
-                    'id': student.public_id
-                }
-                student_output.append(output)
-    else:
-        for student in course.students:
-            output = {
-                'fname': student.fname,
-                'lname': student.lname,
-                'username': student.username,
-                'id': student.public_id
-            }
-            student_output.append(output)            
+    students, missing_student_usernames = queries.students_by_username(student_usernames)
+    course.students = students
+    student_output = serializers.student.dump_many(students)
 
     try:
         db.session.add(course)
@@ -242,15 +177,11 @@ def register_course():
             'course': {
                 'name': course.name,
                 'id': course.public_id,
-                'teacher': {
-                    'fname': teacher.fname,
-                    'lname': teacher.lname,
-                    'username': teacher.username,
-                    'id': teacher.public_id
-                },
+                'teacher': serializers.teacher.dump(teacher),
                 'students': student_output,
                 'num_students': len(student_output)
-            }
+            },
+            'missing_student_usernames': missing_student_usernames
         }), SUCCESS_CODE
     except Exception as e:
         print(e)
@@ -260,23 +191,24 @@ def register_course():
         }), ERROR_CODE
 
 @courses.route('/api/course/<course_id>/teacher/<teacher_id>', methods = ['PUT', 'POST'])
+@auth.identified
 def update_course(course_id, teacher_id):
     """updates course information, assume that everything is being updated"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = auth.account(Teacher, teacher_id, verify = True)
     if not teacher:
         return jsonify({
             'status': 'fail',
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    course = Course.query.filter_by(public_id = course_id).first()
+    course = load(Course, course_id)
     if not course:
         return jsonify({
             'status': 'fail',
             'message': 'Course does not exist'
         }), ERROR_CODE      
 
-    if course.teacher != teacher:
+    if course.teacher_id != teacher.id:
         return jsonify({
             'status': 'fail',
             'message': 'Teacher does not have permission to access this course'
@@ -290,23 +222,17 @@ def update_course(course_id, teacher_id):
             'message': f'No course information provided to update course `{course_id}`'
         }), ERROR_CODE
 
-    student_ids = course_info.get('student_ids', [])
-
-    course.students = []
-    student_output = []
-    for student_id in student_ids:
-        student = Student.query.filter_by(public_id = student_id).first()
-
-        if student:
-            course.students.append(student)
+    try:
+        student_ids = queries.id_list(course_info.get('student_ids', None), 'student_ids')
+    except ValueError as e:
+        return jsonify({
+            'status': 'fail',
+            'message': str(e)
+        }), ERROR_CODE
 
-            output = {
-                'fname': student.fname,
-                'lname': student.lname,
-                'username': student.username,
-                'id': student.public_id
-            }
-            student_output.append(output)
+    students, missing_student_ids = queries.students_by_public_id(student_ids)
+    course.students = students
+    student_output = serializers.student.dump_many(students)
 
 
     # if len(student_output) == 0:
@@ -329,7 +255,8 @@ def update_course(course_id, teacher_id):
                 'name': course.name,
                 'id': course.public_id,
                 'students': student_output
-            }
+            },
+            'missing_student_ids': missing_student_ids
         }), SUCCESS_CODE
     except Exception as e:
         print(e)
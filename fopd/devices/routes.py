@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request
 
 from fopd import db
 from fopd.models import Teacher, Experiment, Device
+from fopd import queries, auth
+from fopd.loader import load
+from fopd import versions, validators, caching
+from fopd.pagination import paginate
+from fopd import serializers
+from fopd.serializers import jsonify
 
 import uuid, datetime
 
@@ -15,39 +21,42 @@ SUCCESS_CODE = 200
 #     pass
 
 @devices.route('/api/device/teacher/<teacher_id>', methods = ['GET'])
+@auth.identified
+@versions.conditional(validators.get_all_teacher_devices)
+@caching.cached(Device, Teacher)
 def get_all_teacher_devices(teacher_id):
     """get a list of teacher's devices"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = auth.account(Teacher, teacher_id)
     if not teacher:
         return jsonify({
             'status': 'fail',
             'message': f'Account with id {teacher_id} does not exist'
         }), ERROR_CODE
 
-    devices = []
-    for device in teacher.devices:
-        devices.append({
-            'name': device.name,
-            'id': device.public_id
-        })
+    query, fields = serializers.device.select(queries.teacher_devices(teacher))
+    teacher_devices, page = paginate(query, Device.id)
+
+    devices = serializers.device.dump_many(teacher_devices, fields)
 
     return jsonify({
         'status': 'success',
         'num_devices': len(devices),
-        'devices': devices
+        'devices': devices,
+        **page
     }), SUCCESS_CODE
 
 @devices.route('/api/device/<device_id>/teacher/<teacher_id>', methods = ['GET'])
+@versions.conditional(validators.get_specific_teacher_device)
 def get_specific_teacher_device(teacher_id, device_id):
     """get a spefic device belonging to a specific teacher"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
     if not teacher:
         return jsonify({
             'status': 'fail',
             'message': f'Account with id {teacher_id} does not exist'
         }), ERROR_CODE
 
-    device = Device.query.filter_by(public_id = device_id).first()
+    device = load(Device, device_id)
     if not device:
         return jsonify({
             'status': 'fail',
@@ -55,20 +64,14 @@ def get_specific_teacher_device(teacher_id, device_id):
         }), ERROR_CODE  
 
     return jsonify({
-        'name': device.name,
-        'id': device.public_id,
-        'teacher': {
-            'fname': teacher.fname,
-            'lname': teacher.lname,
-            'username': teacher.username,
-            'public_id': teacher.public_id
-        }
+        **serializers.device.dump(device),
+        'teacher': serializers.teacher_public_id.dump(teacher)
     }), SUCCESS_CODE     
 
 @devices.route('/api/device/<device_id>', methods = ['PUT', 'POST'])
 def remove_teacher_ownership(device_id):
     """remove teacher's ownership over device"""
-    device = Device.query.filter_by(public_id = device_id).first()
+    device = load(Device, device_id)
     if not device:
         return jsonify({
             'status': 'fail',
@@ -110,7 +113,7 @@ def register_device():
             'message': 'Cannot register device without teacher'
         }), ERROR_CODE
 
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
     if not teacher:
         return jsonify({
             'status': 'fail',
@@ -120,7 +123,8 @@ def register_device():
     device = Device(
         name = device_info.get('name', ''),
         teacher = teacher,
-        public_id = str(uuid.uuid4())
+        public_id = str(uuid.uuid4()),
+        external_id = device_info.get('external_id', None)
     )
 
     try:
@@ -129,16 +133,7 @@ def register_device():
         return jsonify({
             'status': 'success',
             'message': f'Successfully created',
-            'device': {
-                'name': device.name,
-                'id': device.public_id,
-                'teacher': {
-                    'fname': teacher.fname,
-                    'lname': teacher.lname,
-                    'username': teacher.username,
-                    'id': teacher.public_id
-                }
-            }
+            'device': serializers.device_detail.dump(device)
         }), SUCCESS_CODE
     except Exception as e:
         print(e)
@@ -157,14 +152,14 @@ def update_device(device_id, teacher_id):
             'message': 'No information provided'
         }), ERROR_CODE
 
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
     if not teacher:
         return jsonify({
             'status': 'fail',
             'message': f'Account with id {teacher_id} does not exist'
         }), ERROR_CODE
 
-    device = Device.query.filter_by(public_id = device_id).first()
+    device = load(Device, device_id)
     if not device:
         return jsonify({
             'status': 'fail',
@@ -179,22 +174,16 @@ def update_device(device_id, teacher_id):
 
     device.name = device_info.get('name', '')
 
+    if device_info.get('external_id', None):
+        device.external_id = device_info['external_id']
+
     try:
         db.session.add(device)
         db.session.commit()
         return jsonify({
             'status': 'success',
             'message': f'Successfully updated',
-            'device': {
-                'name': device.name,
-                'id': device.public_id,
-                'teacher': {
-                    'fname': teacher.fname,
-                    'lname': teacher.lname,
-                    'username': teacher.username,
-                    'id': teacher.public_id
-                }
-            }
+            'device': serializers.device_detail.dump(device)
         }), SUCCESS_CODE
     except Exception as e:
         print(e)
@@ -208,7 +197,7 @@ def update_device(device_id, teacher_id):
 @devices.route('/api/device/<device_id>', methods = ['DELETE'])
 def delete_device(device_id):
     """delete a device"""
-    device = Device.query.filter_by(public_id = device_id).first()
+    device = load(Device, device_id)
     if not device:
         return jsonify({
             'status': 'fail',
@@ -0,0 +1,150 @@
+import json
+
+from flask import current_app, request
+from sqlalchemy import event, inspect
+
+from fopd import db
+from fopd.models import ObservationResponse
+from fopd.services.broker import makeBroker
+from fopd import serializers
+
+### Observation response events
+# flushes record which observation responses were created, edited, locked or deleted. the events are
+# published once their transaction commits, to the channels of the observation and of its experiment,
+# and a rollback drops them. with the redis broker they reach the streams of every worker. each channel
+# numbers its events, so a reconnecting client gets what it missed from the broker's backlog
+
+broker = None
+
+def observation_channel(public_id):
+    return f'observation:{public_id}'
+
+def experiment_channel(public_id):
+    return f'experiment:{public_id}'
+
+def frame(name, data):
+    """a server-sent event, data is json encoded"""
+    return f'event: {name}\ndata: {json.dumps(data, default = str)}\n\n'
+
+def _pending(session):
+    return session.info.setdefault('pending_events', [])
+
+def _response_event(session, response, name):
+    observation = response.observation
+    if observation is None:
+        return
+
+    data = {
+        'observation': observation.public_id,
+        'experiment': observation.experiment.public_id if observation.experiment else None,
+        'response': {'id': response.public_id} if name == 'response.deleted' else serializers.observation_response.dump(response)
+    }
+    message = frame(name, data)
+    _pending(session).append((observation_channel(observation.public_id), message))
+    if data['experiment']:
+        _pending(session).append((experiment_channel(data['experiment']), message))
+
+def _after_flush(session, flush_context):
+    # history is still there in after_flush, so a lock can be told from other edits
+    for obj in session.new:
+        if isinstance(obj, ObservationResponse):
+            _response_event(session, obj, 'response.created')
+
+    for obj in session.dirty:
+        if isinstance(obj, ObservationResponse) and session.is_modified(obj):
+            locked = inspect(obj).attrs.editable.history.has_changes() and not obj.editable
+            _response_event(session, obj, 'response.locked' if locked else 'response.updated')
+
+    for obj in session.deleted:
+        if isinstance(obj, ObservationResponse):
+            _response_event(session, obj, 'response.deleted')
+
+def created(responses):
+    """queue response.created for responses inserted without a flush, e.g. with bulk_insert_mappings"""
+    for response in responses:
+        _response_event(db.session, response, 'response.created')
+
+def _after_commit(session):
+    events = session.info.pop('pending_events', None)
+    if broker is None or not events:
+        return
+    for channel, message in events:
+        try:
+            broker.publish(channel, message)
+        except Exception as e:
+            # the write is committed either way, streams only miss the event
+            print(e)
+
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('pending_events', None)
+
+def init_app(app):
+    global broker
+    backend = app.config['EVENT_BROKER_BACKEND']
+    if backend not in ('memory', 'redis', None, ''):
+        raise ValueError(f'Unknown event broker backend `{backend}`, use memory or redis')
+    broker = makeBroker(backend, url = app.config['EVENT_BROKER_URL'], backlog = app.config['EVENT_STREAM_BACKLOG'])
+
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_transaction_end', _after_transaction_end)
+
+### Streams
+
+def stream(channel):
+    """text/event-stream response of the events published to channel, until the client goes away.
+    a client reconnecting with Last-Event-ID gets the events it missed, or a `resync` event when they
+    are no longer kept and it has to fetch the responses again. a comment is sent every
+    EVENT_STREAM_KEEPALIVE seconds so proxies keep the connection open"""
+    keepalive = current_app.config['EVENT_STREAM_KEEPALIVE']
+    retry = current_app.config['EVENT_STREAM_RETRY_MS']
+
+    # subscribed before reading the backlog so nothing published in between is missed, the events
+    # in both are sent once
+    subscription = broker.subscribe(channel)
+    after, missed = 0, []
+    if 'Last-Event-ID' in request.headers:
+        try:
+            after = int(request.headers['Last-Event-ID'])
+            missed = broker.replay(channel, after)
+        except Exception as e:
+            # a bad id or a broker that cannot be reached, the client starts over
+            print(e)
+            missed = None
+
+    # runs after the request context is gone, so it only uses what was read above
+    def generate():
+        try:
+            yield f'retry: {retry}\n\n'
+            sent = 0
+            if missed is None:
+                yield frame('resync', {})
+            else:
+                for message_id, message in missed:
+                    yield f'id: {message_id}\n{message}'
+                sent = missed[-1][0] if missed else after
+
+            while True:
+                item = subscription.get(timeout = keepalive)
+                if subscription.takeLost():
+                    # the subscription fell behind or the broker reconnected
+                    yield frame('resync', {})
+                if item is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                message_id, message = item
+                if message_id > sent:
+                    sent = message_id
+                    yield f'id: {message_id}\n{message}'
+        finally:
+            # werkzeug closes the generator when the client disconnects
+            subscription.close()
+
+    response = current_app.response_class(generate(), mimetype = 'text/event-stream')
+    # a response that is never iterated does not run the generator's cleanup
+    response.call_on_close(subscription.close)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no' # nginx would buffer the stream otherwise
+    return response
@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request
 
 from fopd import db, bcrypt
 from fopd.models import Student, Teacher, Experiment, Device
+from fopd import queries, auth
+from fopd.loader import load
+from fopd import versions, validators, caching
+from fopd.pagination import paginate
+from fopd import serializers
+from fopd.serializers import jsonify
 
 import uuid, datetime
 
@@ -13,9 +19,12 @@ SUCCESS_CODE = 200
 ### Experiment
 
 @experiments.route('/api/experiment/teacher/<teacher_id>', methods = ['GET'])
+@auth.identified
+@versions.conditional(validators.get_teacher_experiments)
+@caching.cached(Experiment, Student, Device, Teacher)
 def get_teacher_experiments(teacher_id):
     """get teacher's experiments list"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = auth.account(Teacher, teacher_id)
 
     if not teacher:
         return jsonify({
@@ -23,46 +32,23 @@ def get_teacher_experiments(teacher_id):
             'message': 'Account does not exist'
         }), ERROR_CODE
     
-    experiments = []
-    for experiment in teacher.experiments:
-        students = []
-
-        for student in experiment.students:
-            student_output = {
-                'fname': student.fname,
-                'lname': student.lname,
-                'username': student.username,
-                'id': student.public_id
-            }
-
-            students.append(student_output)
-
-        output = {
-            'title': experiment.title,
-            'description': experiment.description,
-            'plant': experiment.plant,
-            'start_date': str(experiment.start_date),
-            'id': experiment.public_id,
-            'students': students,
-            'num_students': len(students),
-            'device': {
-                'id': experiment.device.public_id,
-                'name': experiment.device.name
-            }
-        }
-
-        experiments.append(output)
+    query, fields = serializers.experiment.select(queries.teacher_experiments(teacher))
+    teacher_experiments, page = paginate(query, Experiment.id)
+
+    experiments = serializers.experiment.dump_many(teacher_experiments, fields)
 
     return jsonify({
         'status': 'success',
         'num_experiments': len(experiments),
-        'experiments': experiments
+        'experiments': experiments,
+        **page
     })
 
 @experiments.route('/api/experiment/<experiment_id>/teacher/<teacher_id>', methods = ['GET'])
+@versions.conditional(validators.get_experiment_by_id)
 def get_experiment_by_id(teacher_id, experiment_id):
     """get specific experiment belonging to specific teacher"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
 
     if not teacher:
         return jsonify({
@@ -70,7 +56,7 @@ def get_experiment_by_id(teacher_id, experiment_id):
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    experiment = Experiment.query.filter_by(public_id = experiment_id).first()
+    experiment = load(Experiment, experiment_id)
     if not experiment:
         return jsonify({
             'status': 'fail',
@@ -83,35 +69,7 @@ def get_experiment_by_id(teacher_id, experiment_id):
             'message': 'Teacher does not have permissions to access experiment'
         }), ERROR_CODE
 
-    students = []
-    for student in experiment.students:
-        student_output = {
-            'fname': student.fname,
-            'lname': student.lname,
-            'username': student.username,
-            'id': student.public_id
-        }
-
-        students.append(student_output)
-
-    experiment_output = {
-        'title': experiment.title,
-        'description': experiment.description,
-        'plant': experiment.plant,
-        'start_date': str(experiment.start_date),
-        'id': experiment.public_id,
-        'teacher': {
-            'fname': teacher.fname,
-            'lname': teacher.lname,
-            'id': teacher.public_id,
-            'username': teacher.username
-        },
-        'students': students,
-        'device': {
-            'id': experiment.device.public_id,
-            'name': experiment.device.name
-        }
-    }
+    experiment_output = serializers.experiment_detail.dump(experiment)
 
     return jsonify({
         'status': 'success',
@@ -120,9 +78,10 @@ def get_experiment_by_id(teacher_id, experiment_id):
 
 
 @experiments.route('/api/experiment/<experiment_id>/teacher/<teacher_id>', methods = ['DELETE'])
+@auth.identified
 def delete_experiment(teacher_id, experiment_id):
     """delete experiment"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = auth.account(Teacher, teacher_id, verify = True)
 
     if not teacher:
         return jsonify({
@@ -130,14 +89,14 @@ def delete_experiment(teacher_id, experiment_id):
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    experiment = Experiment.query.filter_by(public_id = experiment_id).first()
+    experiment = load(Experiment, experiment_id)
     if not experiment:
         return jsonify({
             'status': 'fail',
             'message': 'Experiment does not exist'
         }), ERROR_CODE
 
-    if experiment.teacher != teacher:
+    if experiment.teacher_id != teacher.id:
         return jsonify({
             'status': 'fail',
             'message': 'Teacher does not have permissions to access experiment'
@@ -160,7 +119,7 @@ def delete_experiment(teacher_id, experiment_id):
 @experiments.route('/api/experiment/teacher/<teacher_id>', methods = ['POST'])
 def create_experiment(teacher_id):
     """create new experiment"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
 
     if not teacher:
         return jsonify({
@@ -183,7 +142,7 @@ def create_experiment(teacher_id):
             'message': 'Cannot create experiment without a device'
         }), ERROR_CODE
 
-    device = Device.query.filter_by(public_id = device_id).first()
+    device = load(Device, device_id)
     if not device:
         return jsonify({
             'status': 'fail',
@@ -200,25 +159,17 @@ def create_experiment(teacher_id):
     experiment.teacher = teacher
     experiment.device = device
 
-    student_ids = experiment_info.get('student_ids', [])
+    try:
+        student_ids = queries.id_list(experiment_info.get('student_ids', None), 'student_ids')
+    except ValueError as e:
+        return jsonify({
+            'status': 'fail',
+            'message': str(e)
+        }), ERROR_CODE
 
-    experiment.students = []
-    student_output = []
-    if student_ids:
-        for student_id in student_ids:
-            student = Student.query.filter_by(public_id = student_id).first()
-
-            if student:
-                student.experiments.append(experiment)
-                # experiment.students.append(student)
-
-                output = {
-                    'fname': student.fname,
-                    'lname': student.lname,
-                    'username': student.username,
-                    'id': student.public_id
-                }
-                student_output.append(output)
+    students, missing_student_ids = queries.students_by_public_id(student_ids)
+    experiment.students = students
+    student_output = serializers.student.dump_many(students)
 
     try:
         db.session.add(experiment)
@@ -227,22 +178,12 @@ def create_experiment(teacher_id):
             'status': 'success',
             'message': 'Successfully created experiment',
             'experiment': {
-                'title': experiment.title,
-                'description': experiment.description,
-                'plant': experiment.plant,
-                'id': experiment.public_id,
-                'teacher': {
-                    'fname': experiment.teacher.fname,
-                    'lname': experiment.teacher.lname,
-                    'username': experiment.teacher.username,
-                    'id': experiment.teacher.public_id
-                },
-                'students': student_output
+                **serializers.experiment_summary.dump(experiment, ('title', 'description', 'plant', 'id')),
+                'teacher': serializers.teacher.dump(experiment.teacher),
+                'students': student_output,
+                'missing_student_ids': missing_student_ids
             },
-            'device': {
-                'id': experiment.device.public_id,
-                'name': experiment.device.name
-            }
+            'device': serializers.device_summary.dump(experiment.device)
         }), SUCCESS_CODE
     except Exception as e:
         print(e)
@@ -255,7 +196,7 @@ def create_experiment(teacher_id):
 @experiments.route('/api/experiment/<experiment_id>/teacher/<teacher_id>', methods = ['PUT', 'POST'])
 def update_experiment(teacher_id, experiment_id):
     """update experiment"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
 
     if not teacher:
         return jsonify({
@@ -263,7 +204,7 @@ def update_experiment(teacher_id, experiment_id):
             'message': 'Account does not exist'
         }), ERROR_CODE
 
-    experiment = Experiment.query.filter_by(public_id = experiment_id).first()
+    experiment = load(Experiment, experiment_id)
     if not experiment:
         return jsonify({
             'status': 'fail',
@@ -278,23 +219,21 @@ def update_experiment(teacher_id, experiment_id):
             'message': f'No experiment information provided to update experiment `{experiment_id}`'
         }), ERROR_CODE
 
-    student_ids = experiment_info.get('student_ids', [])
+    try:
+        student_ids = queries.id_list(experiment_info.get('student_ids', None), 'student_ids')
+    except ValueError as e:
+        return jsonify({
+            'status': 'fail',
+            'message': str(e)
+        }), ERROR_CODE
     
     student_output = []
-    for student_id in student_ids:
-        student = Student.query.filter_by(public_id = student_id).first()
-
-        if student:
-            # student.experiments.append(experiment)
+    students, missing_student_ids = queries.students_by_public_id(student_ids)
+    existing = set(experiment.students) if students else set()
+    for student in students:
+        if student not in existing:
             experiment.students.append(student)
-
-            output = {
-                'fname': student.fname,
-                'lname': student.lname,
-                'username': student.username,
-                'id': student.public_id
-            }
-            student_output.append(output)
+            student_output.append(serializers.student.dump(student))
 
     if experiment_info.get('title', None):
         experiment.title = experiment_info['title']
@@ -312,22 +251,12 @@ def update_experiment(teacher_id, experiment_id):
             'status': 'success',
             'message': 'Experiment has been updated',
             'experiment': {
-                'title': experiment.title,
-                'description': experiment.description,
-                'plant': experiment.plant,
-                'id': experiment.public_id,
+                **serializers.experiment_summary.dump(experiment, ('title', 'description', 'plant', 'id')),
                 'students': student_output,
-                'teacher': {
-                    'fname': teacher.fname,
-                    'lname': teacher.lname,
-                    'username': teacher.username,
-                    'id': teacher.public_id
-                }
+                'missing_student_ids': missing_student_ids,
+                'teacher': serializers.teacher.dump(teacher)
             },
-            'device': {
-                'id': experiment.device.public_id,
-                'name': experiment.device.name
-            }
+            'device': serializers.device_summary.dump(experiment.device)
         }), SUCCESS_CODE
     except Exception as e:
         print(e)
@@ -337,39 +266,25 @@ def update_experiment(teacher_id, experiment_id):
         }), ERROR_CODE
 
 @experiments.route('/api/experiment/student/<student_id>', methods = ['GET'])
+@versions.conditional(validators.get_all_student_experiments)
+@caching.cached(Experiment, Student, Device, Teacher)
 def get_all_student_experiments(student_id):
     """get all student's experiments"""
-    student = Student.query.filter_by(public_id = student_id).first()
+    student = load(Student, student_id)
     if not student:
         return jsonify({
             'status': 'fail',
             'message': f'Account id `{student_id}` does not exist'
         }), ERROR_CODE
 
-    experiments_output = []
-    for experiment in student.experiments:
-        output = {
-            'id': experiment.public_id,
-            'title': experiment.title,
-            'description': experiment.description,
-            'plant': experiment.plant,
-            'start_date': str(experiment.start_date),
-            'teacher': {
-                'fname': experiment.teacher.fname,
-                'lname': experiment.teacher.lname,
-                'username': experiment.teacher.username,
-                'id': experiment.teacher.public_id
-            },
-            'device': {
-                'id': experiment.device.public_id,
-                'name': experiment.device.name
-            }
-        }
+    query, fields = serializers.student_experiment.select(queries.student_experiment_list(student))
+    student_experiments, page = paginate(query, Experiment.id)
 
-        experiments_output.append(output)
+    experiments_output = serializers.student_experiment.dump_many(student_experiments, fields)
 
     return jsonify({
         'status': 'success',
         'num_experiments': len(experiments_output),
-        'experiments': experiments_output
+        'experiments': experiments_output,
+        **page
     }), SUCCESS_CODE
\ No newline at end of file
@@ -1,15 +1,45 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, current_app, send_file
 
 from fopd.services.http_service import HttpService, TIMEOUT, TOOMANYREDIRECTS
+from fopd.services.reading_store import ReadingStore
+from fopd.services.jsonparser import JsonParser
+from fopd.services.cache import makeCache
+from fopd.services.image_store import ImageStore
+from fopd import serializers
+from fopd.serializers import jsonify
 
-import uuid, datetime
+import uuid, datetime, json, os, requests
 
 externals = Blueprint('externals', __name__)
 
 ERROR_CODE = 400
 SUCCESS_CODE = 200
 
-http = HttpService()
+http = HttpService() # logs in upstream lazily on the first request
+store = ReadingStore(http)
+images = ImageStore(http, None)
+
+@externals.record_once
+def configure_store(state):
+    config = state.app.config
+    http.configure(
+        maxWorkers = config['EXTERNAL_MAX_WORKERS'],
+        chunkDays = config['EXTERNAL_CHUNK_DAYS'],
+        chunkRetries = config['EXTERNAL_CHUNK_RETRIES'],
+        cache = makeCache(config['EXTERNAL_CACHE_BACKEND'], config['EXTERNAL_CACHE_SIZE'], config['EXTERNAL_CACHE_PATH']),
+        cacheTtl = config['EXTERNAL_CACHE_TTL'],
+        lockDir = config['EXTERNAL_LOCK_DIR'],
+        poolSize = config['EXTERNAL_POOL_SIZE'],
+        connectTimeout = config['EXTERNAL_CONNECT_TIMEOUT'],
+        readTimeout = config['EXTERNAL_READ_TIMEOUT'],
+        retries = config['EXTERNAL_RETRIES'],
+        backoff = config['EXTERNAL_BACKOFF'],
+        sessionTtl = config['EXTERNAL_SESSION_TTL']
+    )
+    store.refreshSeconds = config['READINGS_REFRESH_SECONDS']
+    images.root = config['IMAGE_STORE_PATH']
+    images.maxBytes = config['IMAGE_STORE_MAX_BYTES']
+    images.thumbnailSize = config['IMAGE_THUMBNAIL_SIZE']
 
 @externals.route('/api/external/login', methods = ['POST'])
 def get_login_credentials():
@@ -49,6 +79,12 @@ def get_login_credentials():
             'message': 'Too many redirects, bad url'
         }), ERROR_CODE
 
+    if not login_json:
+        return jsonify({
+            'status': 'fail',
+            'message': 'Unable to log in upstream'
+        }), ERROR_CODE
+
     return jsonify({
         'status': 'success',
         'session': login_json['session'],
@@ -57,23 +93,193 @@ def get_login_credentials():
     }), SUCCESS_CODE
 
 
+@externals.route('/api/external/cache/stats', methods = ['GET'])
+def get_cache_stats():
+    """hit and miss counters of the upstream response cache and coalesced requests"""
+    return jsonify({
+        'status': 'success',
+        'cache': http.cache.stats() if http.cache is not None else None,
+        'coalescing': http.flight.stats()
+    }), SUCCESS_CODE
+
 @externals.route('/api/external/observations/<device_id>/<start_date>/<end_date>', methods = ['GET'])
 def get_observations(device_id, start_date, end_date):
-    """get observations from fopd server, dates should be in the format YYYY-MM-DD"""
-    observations, status_code, reason = http.getObservations(device_id, start_date, end_date)
-    if observations[0] == 'N':
-        observations = []
+    """get observations from the local reading store, fetching missing days from the fopd server. dates should be in the format YYYY-MM-DD"""
+    stream_format = request.args.get('stream', None)
+    if stream_format:
+        return stream_observations(device_id, start_date, end_date, stream_format)
 
-    if status_code / 100 != 2:
+    attribute = request.args.get('attribute', None)
+    readings, status_code, reason = store.getReadings(device_id, start_date, end_date, attribute = attribute)
+
+    if status_code // 100 != 2:
         return jsonify({
             'status': 'fail',
             'status_code': status_code,
             'message': reason
         }), ERROR_CODE
 
+    observations = serializers.reading.dump_many(readings)
     return jsonify({
         'status': 'success',
         'num_observations': len(observations),
         'observations': observations
     }), SUCCESS_CODE
 
+def stream_observations(device_id, start_date, end_date, stream_format):
+    """stream observations from the fopd server as they arrive, as ndjson or a json document"""
+    if stream_format not in ('ndjson', 'json'):
+        return jsonify({
+            'status': 'fail',
+            'message': f'Unknown stream format `{stream_format}`, use ndjson or json'
+        }), ERROR_CODE
+
+    try:
+        res = http.streamObservations(device_id, start_date, end_date)
+    except requests.exceptions.RequestException as e:
+        print(e)
+        return jsonify({
+            'status': 'fail',
+            'message': 'Unable to reach the fopd server'
+        }), ERROR_CODE
+
+    if not res:
+        return jsonify({
+            'status': 'fail',
+            'message': 'Invalid device id or date'
+        }), ERROR_CODE
+
+    observations, status_code, reason = res
+    if status_code // 100 != 2:
+        return jsonify({
+            'status': 'fail',
+            'status_code': status_code,
+            'message': reason
+        }), ERROR_CODE
+
+    # the upstream body can break off or turn out malformed after the response has started,
+    # the stream then ends with a failure instead of looking complete
+    failure = []
+
+    def readings():
+        try:
+            for observation in observations:
+                try:
+                    reading = JsonParser.parseReading(observation)
+                except (KeyError, TypeError, ValueError, OverflowError):
+                    continue
+                reading['ts'] = str(reading['ts'])
+                yield reading
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(e)
+            failure.append(f'Observations from the fopd server ended early: {e}')
+
+    def generate_ndjson():
+        for reading in readings():
+            yield json.dumps(reading) + '\n'
+        if failure:
+            yield json.dumps({'status': 'fail', 'message': failure[0]}) + '\n'
+
+    def generate_json():
+        yield '{"observations": ['
+        count = 0
+        for reading in readings():
+            yield (',' if count else '') + json.dumps(reading)
+            count += 1
+        if failure:
+            yield '], "num_observations": %d, "status": "fail", "message": %s}' % (count, json.dumps(failure[0]))
+        else:
+            yield '], "num_observations": %d, "status": "success"}' % count
+
+    if stream_format == 'ndjson':
+        return Response(generate_ndjson(), mimetype = 'application/x-ndjson')
+    return Response(generate_json(), mimetype = 'application/json')
+
+@externals.route('/api/external/observations/batch', methods = ['POST'])
+def get_observations_batch():
+    """get observations for several devices/date ranges at once, missing days are fetched concurrently"""
+    batch_info = request.json
+    items = batch_info.get('requests', None) if isinstance(batch_info, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({
+            'status': 'fail',
+            'message': 'No observation requests provided'
+        }), ERROR_CODE
+
+    # malformed requests are reported in place, the others are served together
+    output, queries, positions = [None] * len(items), [], []
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            message = 'Observation request must be an object'
+        elif not all(isinstance(item.get(key, None), str) and item[key] for key in ('device_id', 'start_date', 'end_date')):
+            message = 'No device_id, start_date or end_date provided'
+        elif not isinstance(item.get('attribute', None), (str, type(None))):
+            message = 'Attribute must be text'
+        else:
+            queries.append((item['device_id'], item['start_date'], item['end_date'], item.get('attribute', None)))
+            positions.append(position)
+            continue
+
+        item = item if isinstance(item, dict) else {}
+        output[position] = {
+            'device_id': item.get('device_id', None),
+            'start_date': item.get('start_date', None),
+            'end_date': item.get('end_date', None),
+            'status': 'fail',
+            'status_code': ERROR_CODE,
+            'message': message
+        }
+
+    results = store.getReadingsBatch(queries, maxWorkers = current_app.config['EXTERNAL_MAX_WORKERS'])
+
+    for position, (device_id, start_date, end_date, attribute), (readings, status_code, reason) in zip(positions, queries, results):
+        result = {
+            'device_id': device_id,
+            'start_date': start_date,
+            'end_date': end_date
+        }
+
+        if status_code // 100 != 2:
+            result.update({
+                'status': 'fail',
+                'status_code': status_code,
+                'message': reason
+            })
+        else:
+            observations = serializers.reading.dump_many(readings)
+            result.update({
+                'status': 'success',
+                'num_observations': len(observations),
+                'observations': observations
+            })
+        output[position] = result
+
+    return jsonify({
+        'status': 'success',
+        'num_requests': len(output),
+        'results': output
+    }), SUCCESS_CODE
+
+@externals.route('/api/external/image/<device_id>/<int:ts>', methods = ['GET'])
+def get_image(device_id, ts):
+    """get the image a device took at ts (epoch milliseconds), add ?size=thumb for a thumbnail"""
+    thumbnail = request.args.get('size', None) == 'thumb'
+    path, digest, status_code, reason = images.get(device_id, ts, thumbnail = thumbnail)
+
+    if not path:
+        return jsonify({
+            'status': 'fail',
+            'status_code': status_code,
+            'message': reason
+        }), ERROR_CODE
+
+    # frames never change, so the content digest is a strong validator
+    response = send_file(
+        path,
+        mimetype = 'image/png',
+        add_etags = False,
+        cache_timeout = current_app.config['IMAGE_CACHE_SECONDS'],
+        last_modified = datetime.datetime.utcfromtimestamp(ts / 1000.0)
+    )
+    response.set_etag(digest + ('-thumb' if path.endswith(images.THUMBNAIL_SUFFIX) else ''))
+    return response.make_conditional(request, accept_ranges = True, complete_length = os.path.getsize(path))
@@ -0,0 +1,19 @@
+from flask import request
+from sqlalchemy.orm import load_only, lazyload
+
+def requested(keys):
+    """keys asked for with ?fields=a,b, every key when the param is missing. unknown keys are ignored"""
+    param = request.args.get('fields')
+    if not param:
+        return list(keys)
+
+    asked = {key.strip() for key in param.split(',')}
+    return [key for key in keys if key in asked]
+
+def project(query, model, columns, skipped_relationships = ()):
+    """load only `columns` of model and switch the relationships nobody asked for to lazy loading"""
+    # the primary key is always loaded, pagination keys on it
+    options = [load_only(*sorted(set(columns) | {'id'}))]
+    for relationship in skipped_relationships:
+        options.append(lazyload(getattr(model, relationship)))
+    return query.options(*options)
@@ -0,0 +1,43 @@
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+### Request scoped loading
+# rows looked up by public id are remembered for the rest of the request, so handlers and
+# helpers can look the same account or experiment up again without another query
+
+def load(model, public_id):
+    """row of model with public_id, None when there is none. queried at most once per request"""
+    loaded = g.setdefault('loaded', {})
+    key = (model, public_id)
+    if key not in loaded:
+        loaded[key] = model.query.filter_by(public_id = public_id).first()
+    return loaded[key]
+
+### Query counts
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+def init_app(app):
+    @app.teardown_request
+    def clear_loaded(exc):
+        g.pop('loaded', None)
+
+    if app.debug:
+        # the number of statements each request ran, as X-Query-Count and in the debug log
+        if not event.contains(Engine, 'before_cursor_execute', _count_query):
+            event.listen(Engine, 'before_cursor_execute', _count_query)
+
+        @app.before_request
+        def reset_query_count():
+            # g outlives the request when the app context was pushed outside of it, e.g. in scripts
+            g.query_count = 0
+
+        @app.after_request
+        def report_query_count(response):
+            count = g.get('query_count', 0)
+            response.headers['X-Query-Count'] = str(count)
+            app.logger.debug(f'{request.method} {request.path}: {count} queries')
+            return response
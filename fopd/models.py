@@ -11,6 +11,7 @@ class Teacher(db.Model):
     fname = db.Column(db.String(25), default = 'No Name')
     lname = db.Column(db.String(25), default = 'No Name')
     public_id = db.Column(db.String(100), unique = True)
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.datetime.utcnow) # see fopd/changes.py
 
     students = db.relationship('Student', backref = 'teacher', lazy = True, cascade = 'all, delete-orphan')  # or instructor
     courses = db.relationship('Course', backref = 'teacher', lazy = True, cascade = 'all, delete-orphan')
@@ -26,14 +27,15 @@ class Teacher(db.Model):
 
 ### Many to many
 ### Student assignments
+# the composite primary key serves lookups by its first column, student_id gets its own index
 student_assignments = db.Table('student_assignments',
-    db.Column('assignment_id', db.Integer, db.ForeignKey('assignment.id'), nullable = False),
-    db.Column('student_id', db.Integer, db.ForeignKey('student.id'), nullable = False)
+    db.Column('assignment_id', db.Integer, db.ForeignKey('assignment.id'), primary_key = True),
+    db.Column('student_id', db.Integer, db.ForeignKey('student.id'), primary_key = True, index = True)
 )
 
 student_experiments = db.Table('student_experiments',
-    db.Column('experiment_id', db.Integer, db.ForeignKey('experiment.id'), nullable = False),
-    db.Column('student_id', db.Integer, db.ForeignKey('student.id'), nullable = False)
+    db.Column('experiment_id', db.Integer, db.ForeignKey('experiment.id'), primary_key = True),
+    db.Column('student_id', db.Integer, db.ForeignKey('student.id'), primary_key = True, index = True)
 )
 
 class Student(db.Model):
@@ -45,15 +47,17 @@ class Student(db.Model):
     fname = db.Column(db.String(25), default = 'No Name')
     lname = db.Column(db.String(25), default = 'No Name')
     public_id = db.Column(db.String(100), unique = True, default = str(uuid.uuid4()))
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.datetime.utcnow)
 
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable = False)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id')) #, nullable = False)  # uncomment later
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable = False, index = True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), index = True) #, nullable = False)  # uncomment later
     # experiment_id = db.Column(db.Integer, db.ForeignKey('experiment.id')) #, nullable = False) # ask
 
-    assignments = db.relationship('Assignment', secondary = student_assignments, lazy = 'subquery', backref = db.backref('students', lazy = True))
+    # collections load on access, list views eager load them explicitly (see fopd/queries.py)
+    assignments = db.relationship('Assignment', secondary = student_assignments, lazy = True, backref = db.backref('students', lazy = True))
     assignment_responses = db.relationship('AssignmentResponse', backref = 'student', lazy = True, cascade = 'all, delete-orphan')
     observation_responses = db.relationship('ObservationResponse', backref = 'student', lazy = True, cascade = 'all, delete-orphan')
-    experiments = db.relationship('Experiment', secondary = student_experiments, lazy = 'subquery', backref = db.backref('students', lazy = True))
+    experiments = db.relationship('Experiment', secondary = student_experiments, lazy = True, backref = db.backref('students', lazy = True))
     # experiments = db.relationship('Experiment', backref = )
 
     def __repr__(self):
@@ -68,8 +72,10 @@ class Device(db.Model):
     id = db.Column(db.Integer, primary_key = True, autoincrement = True)
     name = db.Column(db.String(50), nullable = False)
     public_id = db.Column(db.String(100), unique = True, default = str(uuid.uuid4()))
+    external_id = db.Column(db.String(100)) # fop1 device id, polled by the ingest worker
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.datetime.utcnow)
 
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id')) # can be null
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), index = True) # can be null
 
     experiments = db.relationship('Experiment', backref = 'device', lazy = True, cascade = 'all, delete-orphan')
 
@@ -82,8 +88,9 @@ class Course(db.Model):
     id = db.Column(db.Integer, primary_key = True, autoincrement  = True)
     name = db.Column(db.String(100), nullable = False)
     public_id = db.Column(db.String(100), unique = True, default = str(uuid.uuid4()))
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.datetime.utcnow)
 
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable = False)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable = False, index = True)
 
     students = db.relationship('Student', backref = 'course', lazy = True) #, cascade = 'all, delete-orphan') ask if cascade
 
@@ -100,9 +107,10 @@ class Experiment(db.Model):
     plant = db.Column(db.String(50), nullable = False)
     start_date = db.Column(db.Date, nullable = False, default = datetime.date.today)
     public_id = db.Column(db.String(100), unique = True, default = str(uuid.uuid4()))
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.datetime.utcnow)
 
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable = False)
-    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable = False)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable = False, index = True)
+    device_id = db.Column(db.Integer, db.ForeignKey('device.id'), nullable = False, index = True)
 
     observations = db.relationship('Observation', backref = 'experiment', lazy = True, cascade = 'all, delete-orphan')
     # students = db.relationship('Student', backref = 'experiment', lazy = False)
@@ -120,8 +128,9 @@ class Assignment(db.Model):
     type = db.Column(db.String(50), nullable = False)
     due_date = db.Column(db.Date, nullable = False, default = datetime.date.today)
     public_id = db.Column(db.String(100), unique = True, default = str(uuid.uuid4()))
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.datetime.utcnow)
 
-    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable = False)
+    teacher_id = db.Column(db.Integer, db.ForeignKey('teacher.id'), nullable = False, index = True)
 
     responses = db.relationship('AssignmentResponse', backref = 'assignment', lazy = True, cascade = 'all, delete-orphan')
     # TODO: test many-to-many works
@@ -134,15 +143,19 @@ class Assignment(db.Model):
 
 class AssignmentResponse(db.Model):
     __tablename__ = 'assignment_responses'
+    __table_args__ = (
+        db.Index('ix_assignment_responses_student_updated_at', 'student_id', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key = True, autoincrement = True)
     response = db.Column(db.Text, default = '')
     submitted = db.Column(db.Date)
     comments = db.Column(db.Text, default = '')
     public_id = db.Column(db.String(100), unique = True, default = str(uuid.uuid4()))
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.datetime.utcnow)
 
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable = False)
-    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable = False)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable = False, index = True)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignment.id'), nullable = False, index = True)
 
     def __repr__(self):
         return f'<AssignmentResponse("{self.response}", "{self.student.username}", "{self.public_id}")>'
@@ -154,12 +167,15 @@ class AssignmentResponse(db.Model):
 # )
 
 collaborators = db.Table('collaborators', 
-    db.Column('observation_id', db.Integer, db.ForeignKey('observation.id'), nullable = False),
-    db.Column('student_id', db.Integer, db.ForeignKey('student.id'), nullable = False)
+    db.Column('observation_id', db.Integer, db.ForeignKey('observation.id'), primary_key = True),
+    db.Column('student_id', db.Integer, db.ForeignKey('student.id'), primary_key = True, index = True)
 )
 
 class Observation(db.Model):
     __tablename__ = 'observation'
+    __table_args__ = (
+        db.Index('ix_observation_experiment_updated_at', 'experiment_id', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key = True, autoincrement = True)
     title = db.Column(db.String(50), nullable = False)
@@ -168,20 +184,94 @@ class Observation(db.Model):
     units = db.Column(db.String(30), nullable = False)
     updated = db.Column(db.Date, nullable = False, default = datetime.date.today)
     public_id = db.Column(db.String(100), unique = True, default = str(uuid.uuid4()))
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.datetime.utcnow)
 
-    experiment_id = db.Column(db.Integer, db.ForeignKey('experiment.id'), nullable = False)
+    experiment_id = db.Column(db.Integer, db.ForeignKey('experiment.id'), nullable = False, index = True)
 
-    student_collaborators = db.relationship('Student', secondary = collaborators, lazy = 'subquery', backref = db.backref('observations', lazy = True))
+    student_collaborators = db.relationship('Student', secondary = collaborators, lazy = True, backref = db.backref('observations', lazy = True))
     observation_responses = db.relationship('ObservationResponse', backref = 'observation', lazy = True)
 
 class ObservationResponse(db.Model):
     __tablename__ = 'observation_response'
+    __table_args__ = (
+        db.Index('ix_observation_response_student_updated_at', 'student_id', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key = True, autoincrement = True)
     response = db.Column(db.Text)
     submitted = db.Column(db.Date, nullable = True)
     editable = db.Column(db.Boolean, nullable = False, default = True)
     public_id = db.Column(db.String(100), unique = True, default = str(uuid.uuid4()))
+    updated_at = db.Column(db.DateTime, nullable = False, default = datetime.datetime.utcnow)
 
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'))
-    observation_id = db.Column(db.Integer, db.ForeignKey('observation.id'), nullable = False)
\ No newline at end of file
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), index = True)
+    observation_id = db.Column(db.Integer, db.ForeignKey('observation.id'), nullable = False, index = True)
+
+
+### External device readings
+class Reading(db.Model):
+    __tablename__ = 'reading'
+    __table_args__ = (
+        db.Index('ix_reading_device_attribute_ts', 'device_id', 'attribute', 'ts'),
+        db.Index('ix_reading_device_ts', 'device_id', 'ts'),
+        # a reading stored twice by concurrent fetches of the same window fails the insert instead
+        db.UniqueConstraint('device_id', 'ts', 'attribute', 'subject_location_id', name = 'uq_reading_device_ts_attribute_location'),
+    )
+
+    id = db.Column(db.Integer, primary_key = True, autoincrement = True)
+    device_id = db.Column(db.String(100), nullable = False) # fop1 device id
+    device_name = db.Column(db.String(100))
+    ts = db.Column(db.DateTime, nullable = False)
+    subject = db.Column(db.String(100))
+    subject_location_id = db.Column(db.String(100), nullable = False, default = '') # '' when the reading has no location
+    attribute = db.Column(db.String(100), nullable = False)
+    value = db.Column(db.String(100))
+    units = db.Column(db.String(30))
+
+    def __repr__(self):
+        return f'<Reading("{self.device_id}", "{self.ts}", "{self.attribute}", "{self.value}")>'
+
+class ReadingDay(db.Model):
+    """marks a day of readings for a device as fetched from upstream"""
+    __tablename__ = 'reading_day'
+
+    device_id = db.Column(db.String(100), primary_key = True)
+    day = db.Column(db.Date, primary_key = True)
+    complete = db.Column(db.Boolean, nullable = False, default = False) # day was over when fetched
+    fetched_at = db.Column(db.DateTime, nullable = False, default = datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ReadingDay("{self.device_id}", "{self.day}", "{self.complete}")>'
+
+class IngestState(db.Model):
+    """per-device high-water mark of the background ingest worker"""
+    __tablename__ = 'ingest_state'
+
+    device_id = db.Column(db.String(100), primary_key = True) # fop1 device id
+    high_water = db.Column(db.DateTime) # newest reading ingested
+    last_run = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<IngestState("{self.device_id}", "{self.high_water}")>'
+
+### Offline sync
+# every row the api renders carries updated_at, set on every change (see fopd/changes.py) and read by the
+# sync and the conditional GETs (see fopd/validators.py). a sync reaches the experiments and assignments of a student through the membership tables, the
+# observations and responses through the (experiment_id | student_id, updated_at) indexes
+class Tombstone(db.Model):
+    """a deleted row, or a row one student lost access to, kept so sync clients drop their copy"""
+    __tablename__ = 'tombstone'
+    __table_args__ = (
+        db.Index('ix_tombstone_teacher_deleted_at', 'teacher_id', 'deleted_at'),
+        db.Index('ix_tombstone_student_deleted_at', 'student_id', 'deleted_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key = True, autoincrement = True)
+    table_name = db.Column(db.String(64), nullable = False)
+    public_id = db.Column(db.String(100), nullable = False)
+    teacher_id = db.Column(db.Integer, nullable = False) # whose class saw the row, no foreign key so it outlives the teacher
+    student_id = db.Column(db.Integer) # the only student it concerns, null for everyone of the teacher
+    deleted_at = db.Column(db.DateTime, nullable = False, default = datetime.datetime.utcnow)
+
+    def __repr__(self):
+        return f'<Tombstone("{self.table_name}", "{self.public_id}", "{self.deleted_at}")>'
@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, current_app
 
 from fopd import db
 from fopd.models import Student, Teacher, Experiment, Observation, ObservationResponse
+from fopd import queries
+from fopd.loader import load
+from fopd import versions, validators, caching, events
+from fopd.pagination import paginate
+from fopd import serializers
+from fopd.serializers import jsonify
 
 import uuid, datetime
 
@@ -10,98 +16,75 @@ observations = Blueprint('observations', __name__)
 ERROR_CODE = 400
 SUCCESS_CODE = 200
 
-
 ### Observations
 @observations.route('/api/observation/experiment/<experiment_id>', methods = ['GET'])
+@versions.conditional(validators.get_all_observations_by_experiment)
+@caching.cached(Observation, Experiment, Student)
 def get_all_observations_by_experiment(experiment_id):
     """get all observations made for a specific experiment"""
-    experiment = Experiment.query.filter_by(public_id = experiment_id).first()
+    experiment = load(Experiment, experiment_id)
     if not experiment:
         return jsonify({
             'status': 'fail',
             'message': f'Experiment id `{experiment_id}` does not exist'
         }), ERROR_CODE
 
-    observations = []
-    for observation in experiment.observations:
-
-        collaborators = []
-        for student in observation.student_collaborators:
-            collaborators.append({
-                'fname': student.fname,
-                'lname': student.lname,
-                'username': student.username,
-                'id': student.public_id
-            })
-
-        experiment = observation.experiment
-        observations.append({
-            'title': observation.title,
-            'id': observation.public_id,
-            'description': observation.description,
-            'units': observation.units,
-            'updated': str(observation.updated),
-            'type': observation.type,
-            'collaborators': collaborators,
-            'experiment': {
-                'title': experiment.title,
-                'description': experiment.description,
-                'plant': experiment.plant,
-                'id': experiment.public_id,
-                'start_date': str(experiment.start_date)
-            }
-        })
+    query, fields = serializers.observation.select(queries.experiment_observations(experiment))
+    experiment_observations, page = paginate(query, Observation.id)
+
+    observations = serializers.observation.dump_many(experiment_observations, fields)
 
     return jsonify({
         'status': 'success',
-        'observations': observations
+        'observations': observations,
+        **page
     }), SUCCESS_CODE
     pass
 
 @observations.route('/api/observation/<observation_id>', methods = ['GET'])
+@versions.conditional(validators.get_observation_by_id)
 def get_observation_by_id(observation_id):
     """get all observations by id"""
-    observation = Observation.query.filter_by(public_id = observation_id).first()
+    observation = load(Observation, observation_id)
     if not observation:
         return jsonify({
             'status': 'fail',
             'message': f'Observation id `{observation_id}` does not exist'
         }), ERROR_CODE
 
-    collaborators = []
-    for student in observation.student_collaborators:
-        collaborators.append({
-            'fname': student.fname,
-            'lname': student.lname,
-            'username': student.username,
-            'id': student.public_id
-        })
-
-    experiment = observation.experiment
     return jsonify({
         'status': 'success',
-        'observation': {
-            'title': observation.title,
-            'id': observation.public_id,
-            'description': observation.description,
-            'units': observation.units,
-            'updated': str(observation.updated),
-            'type': observation.type,
-            'collaborators': collaborators,   
-            'experiment': {
-                'title': experiment.title,
-                'description': experiment.description,
-                'plant': experiment.plant,
-                'id': experiment.public_id,
-                'start_date': str(experiment.start_date)
-            } 
-        }
+        'observation': serializers.observation.dump(observation)
     }), SUCCESS_CODE
 
+@observations.route('/api/observation/<observation_id>/stream', methods = ['GET'])
+def stream_observation_responses(observation_id):
+    """server-sent events for the responses of an observation as they are created, edited, locked or deleted"""
+    observation = load(Observation, observation_id)
+    if not observation:
+        return jsonify({
+            'status': 'fail',
+            'message': f'Observation id `{observation_id}` does not exist'
+        }), ERROR_CODE
+
+    return events.stream(events.observation_channel(observation.public_id))
+
+@observations.route('/api/observation/experiment/<experiment_id>/stream', methods = ['GET'])
+def stream_experiment_observation_responses(experiment_id):
+    """server-sent events for the responses to every observation of an experiment"""
+    experiment = load(Experiment, experiment_id)
+    if not experiment:
+        return jsonify({
+            'status': 'fail',
+            'message': f'Experiment id `{experiment_id}` does not exist'
+        }), ERROR_CODE
+
+    return events.stream(events.experiment_channel(experiment.public_id))
+
 @observations.route('/api/observation/<observation_id>', methods = ['DELETE'])
 def delete_observation(observation_id):
     """delete an observation"""
-    observation = Observation.query.filter_by(public_id = observation_id).first()
+    observation = load(Observation, observation_id)
     if not observation:
         return jsonify({
             'status': 'fail',
@@ -138,28 +121,22 @@ def create_observation():
             'message': f'Cannot create observation without experiment. Provide experiment id'
         }), ERROR_CODE
 
-    student_ids = observation_info.get('student_ids', None)
+    try:
+        student_ids = queries.id_list(observation_info.get('student_ids', None), 'student_ids')
+    except ValueError as e:
+        return jsonify({
+            'status': 'fail',
+            'message': str(e)
+        }), ERROR_CODE
     if not student_ids:
         return jsonify({
             'status': 'fail',
             'message': f'No student collaborator information provided'
         }), ERROR_CODE  
 
-    experiment = Experiment.query.filter_by(public_id = experiment_id).first()
-    student_collaborators = []
-
-    collaborators_output = []
-    for student_id in student_ids:
-        student = Student.query.filter_by(public_id = student_id).first()
-
-        if student:
-            student_collaborators.append(student)
-            collaborators_output.append({
-                'id': student.public_id,
-                'fname': student.fname,
-                'lname': student.lname,
-                'username': student.username
-            })
+    experiment = load(Experiment, experiment_id)
+    student_collaborators, missing_student_ids = queries.students_by_public_id(student_ids)
+    collaborators_output = serializers.student.dump_many(student_collaborators)
 
     observation = Observation(
         title = observation_info.get('title', 'No title'),
@@ -177,20 +154,10 @@ def create_observation():
         db.session.commit()
         return jsonify({
             'status': 'success',
-            'title': observation.title,
-            'description': observation.description,
-            'updated': str(observation.updated),
-            'units': observation.units,
-            'type': observation.type,
-            'id': observation.public_id,
+            **serializers.observation_summary.dump(observation),
             'student_collaborators': collaborators_output,
-            'experiment': {
-                'title': experiment.title,
-                'description': experiment.description,
-                'plant': experiment.plant,
-                'id': experiment.public_id,
-                'start_date': str(experiment.start_date)
-            }
+            'missing_student_ids': missing_student_ids,
+            'experiment': serializers.experiment_summary.dump(experiment)
         }), SUCCESS_CODE
 
     except Exception as e:
@@ -203,7 +170,7 @@ def create_observation():
 @observations.route('/api/observation/<observation_id>', methods = ['PUT', 'POST'])
 def update_observation(observation_id):
     """update observation"""
-    observation = Observation.query.filter_by(public_id = observation_id).first()
+    observation = load(Observation, observation_id)
     if not observation:
         return jsonify({
             'status': 'fail',
@@ -222,7 +189,13 @@ def update_observation(observation_id):
     updated = observation_info.get('updated', datetime.date.today())
     units = observation_info.get('units', None)
     type = observation_info.get('type', None)
-    student_ids = observation_info.get('student_ids', None)
+    try:
+        student_ids = queries.id_list(observation_info.get('student_ids', None), 'student_ids')
+    except ValueError as e:
+        return jsonify({
+            'status': 'fail',
+            'message': str(e)
+        }), ERROR_CODE
 
     if title:
         observation.title = title
@@ -240,18 +213,12 @@ def update_observation(observation_id):
         observation.type = type
     
     student_collaborators = []
-    if student_ids:
-        for student_id in student_ids:
-            student = Student.query.filter_by(public_id = student_id)
-
-            if student:
-                student_collaborators.append({
-                    'id': student.public_id,
-                    'fname': student.fname,
-                    'lname': student.lname,
-                    'username': student.username
-                })
-                observation.append(student)
+    students, missing_student_ids = queries.students_by_public_id(student_ids)
+    existing = set(observation.student_collaborators) if students else set()
+    for student in students:
+        if student not in existing:
+            student_collaborators.append(serializers.student.dump(student))
+            observation.student_collaborators.append(student)
 
     experiment = observation.experiment
     try:
@@ -259,20 +226,10 @@ def update_observation(observation_id):
         db.session.commit()
         return jsonify({
             'status': 'success',
-            'title': observation.title,
-            'description': observation.description,
-            'updated': str(observation.updated),
-            'units': observation.units,
-            'type': observation.type,
-            'id': observation.public_id,
+            **serializers.observation_summary.dump(observation),
             'collaborators': student_collaborators,
-            'experiment': {
-                'title': experiment.title,
-                'description': experiment.description,
-                'plant': experiment.plant,
-                'id': experiment.public_id,
-                'start_date': str(experiment.start_date)
-            }
+            'missing_student_ids': missing_student_ids,
+            'experiment': serializers.experiment_summary.dump(experiment)
         }), SUCCESS_CODE
 
     except Exception as e:
@@ -284,7 +241,7 @@ def update_observation(observation_id):
 
 @observations.route('/api/observation/<observation_id>/response', methods = ['POST'])
 def add_observation_response(observation_id):
-    observation = Observation.query.filter_by(public_id = observation_id).first()
+    observation = load(Observation, observation_id)
     if not observation:
         return jsonify({
             'status': 'fail',
@@ -307,7 +264,7 @@ def add_observation_response(observation_id):
     #     }), ERROR_CODE
 
     if student_id:
-        student = Student.query.filter_by(public_id = student_id).first()
+        student = load(Student, student_id)
         if not student:
             return jsonify({
                 'status': 'fail',
@@ -331,17 +288,7 @@ def add_observation_response(observation_id):
         db.session.commit()
         return jsonify({
             'status': 'success',
-            'response': response.response,
-            'submitted': str(response.submitted),
-            'editable': response.editable,
-            'id': response.public_id,
-            'number': response.id,
-            'student': {
-                'id': student.public_id,
-                'username': student.username,
-                'fname': student.fname,
-                'lname': student.lname
-            }
+            **serializers.observation_response.dump(response)
         }), SUCCESS_CODE
 
     except Exception as e:
@@ -352,20 +299,122 @@ def add_observation_response(observation_id):
             'error': e.message
         }), ERROR_CODE
 
+@observations.route('/api/observation/response/batch', methods = ['POST'])
+def add_observation_responses():
+    """add responses to one or more observations in one transaction, returns a report per item"""
+    info = request.json
+    items = info.get('responses', None) if isinstance(info, dict) else info
+    if not isinstance(items, list) or not items:
+        return jsonify({
+            'status': 'fail',
+            'message': 'No observation responses provided'
+        }), ERROR_CODE
+
+    max_rows = current_app.config['BATCH_RESPONSES_MAX_ROWS']
+    if len(items) > max_rows:
+        return jsonify({
+            'status': 'fail',
+            'message': f'Batch has {len(items)} responses, at most {max_rows} can be added at once'
+        }), ERROR_CODE
+
+    report, dates = [], []
+    for number, item in enumerate(items, 1):
+        if not isinstance(item, dict):
+            item = {}
+        observation_id = item.get('observation_id', None)
+        student_id = item.get('student_id', None)
+        report.append({
+            'item': number,
+            'observation_id': str(observation_id) if observation_id else None,
+            'student_id': str(student_id) if student_id else None,
+            'status': 'fail'
+        })
+
+        submitted = item.get('submitted', None) or datetime.date.today()
+        if isinstance(submitted, str):
+            try:
+                submitted = datetime.date.fromisoformat(submitted)
+            except ValueError:
+                pass
+        if not isinstance(submitted, datetime.date):
+            report[-1]['message'] = f'Submitted date `{submitted}` is not YYYY-MM-DD'
+        dates.append(submitted)
+
+        if not isinstance(item.get('response', ''), (str, type(None))):
+            report[-1]['message'] = 'Response must be text'
+        if not isinstance(item.get('editable', True), bool):
+            report[-1]['message'] = 'Editable must be true or false'
+        if not observation_id:
+            report[-1]['message'] = 'No observation id provided'
+
+    # one query for the observations and one for the students of the whole batch
+    found, _ = queries.observations_by_public_id(entry['observation_id'] for entry in report if 'message' not in entry)
+    observations = {observation.public_id: observation for observation in found}
+    found, _ = queries.students_by_public_id(entry['student_id'] for entry in report if 'message' not in entry and entry['student_id'])
+    students = {student.public_id: student for student in found}
+
+    mappings = []
+    for entry, item, submitted in zip(report, items, dates):
+        if 'message' in entry:
+            continue
+        if entry['observation_id'] not in observations:
+            entry['message'] = f'Observation id `{entry["observation_id"]}` does not exist'
+            continue
+        if entry['student_id'] and entry['student_id'] not in students:
+            entry['message'] = f'Account id `{entry["student_id"]}` does not exist'
+            continue
+
+        entry['id'] = str(uuid.uuid4())
+        mappings.append({
+            'response': item.get('response', ''),
+            'public_id': entry['id'],
+            'submitted': submitted,
+            'editable': item.get('editable', True),
+            'observation_id': observations[entry['observation_id']].id,
+            'student_id': students[entry['student_id']].id if entry['student_id'] else None
+        })
+
+    if mappings:
+        try:
+            db.session.bulk_insert_mappings(ObservationResponse, mappings)
+            versions.touch(ObservationResponse) # bulk inserts skip the flush that records the written tables
+            responses, _ = queries.resolve(ObservationResponse.public_id, [mapping['public_id'] for mapping in mappings])
+            events.created(responses)
+            db.session.commit()
+        except Exception as e:
+            print(e)
+            db.session.rollback()
+            return jsonify({
+                'status': 'fail',
+                'message': 'Unable to create observation responses, none was added'
+            }), ERROR_CODE
+
+    for entry in report:
+        if 'message' not in entry:
+            entry['status'] = 'success'
+
+    return jsonify({
+        'status': 'success' if mappings else 'fail',
+        'message': f'Added {len(mappings)} of {len(items)} observation responses',
+        'num_created': len(mappings),
+        'num_failed': len(items) - len(mappings),
+        'responses': report
+    }), SUCCESS_CODE
+
 def update_observation_response(observation_id, student_id, response_id):
     pass
 
 
 @observations.route('/api/observation/<observation_id>/response/<response_id>', methods = ['DELETE'])
 def delete_observation_response(observation_id, response_id):
-    observation = Observation.query.filter_by(public_id = observation_id).first()
+    observation = load(Observation, observation_id)
     if not observation:
         return jsonify({
             'status': 'fail',
             'message': f'Observation id `{observation_id}` does not exist'
         }), ERROR_CODE
 
-    response = ObservationResponse.query.filter_by(public_id = response_id).first()
+    response = load(ObservationResponse, response_id)
     if not response:
         return jsonify({
             'status': 'fail',
@@ -386,15 +435,16 @@ def delete_observation_response(observation_id, response_id):
         }), ERROR_CODE
 
 @observations.route('/api/observation/<observation_id>/response/<response_id>', methods = ['GET'])
+@versions.conditional(validators.get_observation_response_by_id)
 def get_observation_response_by_id(observation_id, response_id):
-    observation = Observation.query.filter_by(public_id = observation_id).first()
+    observation = load(Observation, observation_id)
     if not observation:
         return jsonify({
             'status': 'fail',
             'message': f'Observation id `{observation_id}` does not exist'
         }), ERROR_CODE
 
-    response = ObservationResponse.query.filter_by(public_id = response_id).first()
+    response = load(ObservationResponse, response_id)
     if not response:
         return jsonify({
             'status': 'fail',
@@ -403,69 +453,42 @@ def get_observation_response_by_id(observation_id, response_id):
 
     return jsonify({
         'status': 'success',
-        'response': {
-            'id': response.public_id,
-            'editable': response.editable,
-            'response': response.response,
-            'number': response.id,
-            'submitted': str(response.submitted),
-            'student': {
-                'id': response.student.public_id,
-                'fname': response.student.fname,
-                'lname': response.student.lname,
-                'username': response.student.username
-            }
-        }
+        'response': serializers.observation_response.dump(response)
     }), SUCCESS_CODE
 
 @observations.route('/api/observation/<observation_id>/response', methods = ['GET'])
+@versions.conditional(validators.get_all_observation_responses_for_observation)
+@caching.cached(ObservationResponse, Observation, Student)
 def get_all_observation_responses_for_observation(observation_id):
-    observation = Observation.query.filter_by(public_id = observation_id).first()
+    observation = load(Observation, observation_id)
     if not observation:
         return jsonify({
             'status': 'fail',
             'message': f'Observation id `{observation_id}` does not exist'
         }), ERROR_CODE
 
-    responses = []
-    for response in observation.observation_responses:
-        responses.append({
-            'id': response.public_id,
-            'editable': response.editable,
-            'response': response.response,
-            'number': response.id,
-            'submitted': str(response.submitted),
-            'student': {
-                'id': response.student.public_id,
-                'fname': response.student.fname,
-                'lname': response.student.lname,
-                'username': response.student.username
-            }
-        })
+    query, fields = serializers.observation_response.select(queries.observation_responses(observation))
+    observation_responses, page = paginate(query, ObservationResponse.id)
+
+    responses = serializers.observation_response.dump_many(observation_responses, fields)
 
     return jsonify({
         'status': 'success',
-        'observation': {
-            'id': observation.public_id,
-            'title': observation.title,
-            'type': observation.type,
-            'description': observation.description,
-            'units': observation.units,
-            'updated': str(observation.updated)
-        },
-        'responses': responses
+        'observation': serializers.observation_summary.dump(observation),
+        'responses': responses,
+        **page
     }), SUCCESS_CODE
 
 @observations.route('/api/observation/<observation_id>/response/<response_id>', methods = ['PUT', 'POST'])
 def update_observation_response_lock(observation_id, response_id):
-    observation = Observation.query.filter_by(public_id = observation_id).first()
+    observation = load(Observation, observation_id)
     if not observation:
         return jsonify({
             'status': 'fail',
             'message': f'Observation id `{observation_id}` does not exist'
         }), ERROR_CODE
 
-    response = ObservationResponse.query.filter_by(public_id = response_id).first()
+    response = load(ObservationResponse, response_id)
     if not response:
         return jsonify({
             'status': 'fail',
@@ -474,24 +497,12 @@ def update_observation_response_lock(observation_id, response_id):
 
     response.editable = False
 
-    student = response.student
-    
     try:
         db.session.add(response)
         db.session.commit()
         return jsonify({
             'status': 'success',
-            'response': response.response,
-            'submitted': str(response.submitted),
-            'editable': response.editable,
-            'id': response.public_id,
-            'number': response.id,
-            'student': {
-                'id': student.public_id,
-                'username': student.username,
-                'fname': student.fname,
-                'lname': student.lname
-            }
+            **serializers.observation_response.dump(response)
         }), SUCCESS_CODE
 
     except Exception as e:
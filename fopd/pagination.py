@@ -0,0 +1,22 @@
+from flask import request, current_app
+
+def paginate(query, column):
+    """keyset pagination on an integer id column, driven by the `limit`, `cursor` and `count` query params.
+    returns the page of items and a dict with `limit`, `next_cursor` and, when ?count=true, `total`"""
+    limit = request.args.get('limit', None, type = int) or current_app.config['PAGE_SIZE']
+    limit = max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+    cursor = request.args.get('cursor', None, type = int)
+
+    page = {
+        'limit': limit
+    }
+    if request.args.get('count', '').lower() in ('1', 'true', 'yes'):
+        page['total'] = query.order_by(None).enable_eagerloads(False).count()
+
+    if cursor is not None:
+        query = query.filter(column > cursor)
+
+    # one extra row tells whether there is a next page
+    items = query.order_by(None).order_by(column).limit(limit + 1).all()
+    page['next_cursor'] = getattr(items[limit - 1], column.key) if len(items) > limit else None
+    return items[:limit], page
@@ -0,0 +1,187 @@
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import joinedload, selectinload, contains_eager
+
+from fopd.models import Teacher, Student, Device, Course, Experiment, Assignment, AssignmentResponse, Observation, ObservationResponse, Tombstone, student_experiments, student_assignments
+
+# keeps IN lists under the bound parameter limit of older sqlite builds
+IN_BATCH_SIZE = 500
+
+### Lookups
+
+def resolve(column, values):
+    """rows whose `column` is one of `values` in a single IN query per batch.
+    returns the rows in the order of `values` with repeats dropped, and the values no row matched"""
+    values = list(dict.fromkeys(values))
+    model = column.class_
+
+    rows = {}
+    for start in range(0, len(values), IN_BATCH_SIZE):
+        batch = values[start:start + IN_BATCH_SIZE]
+        for row in model.query.filter(column.in_(batch)):
+            rows[getattr(row, column.key)] = row
+
+    found = [rows[value] for value in values if value in rows]
+    missing = [value for value in values if value not in rows]
+    return found, missing
+
+def id_list(values, name = 'ids'):
+    """ids sent in a request body as a list of strings, [] when left out or null. raises ValueError otherwise"""
+    if values is None:
+        return []
+    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+        raise ValueError(f'`{name}` must be a list of strings')
+    return values
+
+def students_by_public_id(public_ids):
+    """students for a list of public ids, and the ids that do not exist"""
+    return resolve(Student.public_id, public_ids)
+
+def students_by_username(usernames):
+    """students for a list of usernames, and the usernames that do not exist"""
+    return resolve(Student.username, usernames)
+
+def observations_by_public_id(public_ids):
+    """observations for a list of public ids, and the ids that do not exist"""
+    return resolve(Observation.public_id, public_ids)
+
+### List views
+# each query loads its relationships explicitly so building the output costs a
+# constant number of round trips instead of one query per row
+
+def teachers():
+    """all teachers"""
+    return Teacher.query.order_by(Teacher.id)
+
+def teacher_students(teacher):
+    """students registered by a teacher"""
+    return Student.query \
+        .filter_by(teacher_id = teacher.id) \
+        .order_by(Student.id)
+
+def teacher_devices(teacher):
+    """devices owned by a teacher"""
+    return Device.query \
+        .filter_by(teacher_id = teacher.id) \
+        .order_by(Device.id)
+
+def teacher_courses(teacher):
+    """teacher's courses with their students"""
+    return Course.query \
+        .filter_by(teacher_id = teacher.id) \
+        .options(selectinload(Course.students)) \
+        .order_by(Course.id)
+
+def teacher_experiments(teacher):
+    """teacher's experiments with their students and device"""
+    return Experiment.query \
+        .filter_by(teacher_id = teacher.id) \
+        .options(selectinload(Experiment.students), joinedload(Experiment.device)) \
+        .order_by(Experiment.id)
+
+def teacher_assignments(teacher):
+    """teacher's assignments with their assignees"""
+    return Assignment.query \
+        .filter_by(teacher_id = teacher.id) \
+        .options(selectinload(Assignment.students)) \
+        .order_by(Assignment.id)
+
+def student_experiment_list(student):
+    """experiments a student takes part in with their teacher and device"""
+    return Experiment.query \
+        .join(student_experiments, student_experiments.c.experiment_id == Experiment.id) \
+        .filter(student_experiments.c.student_id == student.id) \
+        .options(joinedload(Experiment.teacher), joinedload(Experiment.device)) \
+        .order_by(Experiment.id)
+
+def student_assignment_list(student):
+    """assignments given to a student"""
+    return Assignment.query \
+        .join(student_assignments, student_assignments.c.assignment_id == Assignment.id) \
+        .filter(student_assignments.c.student_id == student.id) \
+        .order_by(Assignment.id)
+
+def experiment_observations(experiment):
+    """observations of an experiment with their collaborators"""
+    return Observation.query \
+        .filter_by(experiment_id = experiment.id) \
+        .options(selectinload(Observation.student_collaborators)) \
+        .order_by(Observation.id)
+
+def observation_responses(observation):
+    """responses to an observation with the students who gave them"""
+    return ObservationResponse.query \
+        .filter_by(observation_id = observation.id) \
+        .options(joinedload(ObservationResponse.student)) \
+        .order_by(ObservationResponse.id)
+
+def assignment_responses(assignment):
+    """responses to an assignment with the students who gave them"""
+    return AssignmentResponse.query \
+        .filter_by(assignment_id = assignment.id) \
+        .options(joinedload(AssignmentResponse.student)) \
+        .order_by(AssignmentResponse.id)
+
+### Sync
+# rows a student's client has to fetch since a point in time, all of them when `since` is None
+
+def _since(query, column, since):
+    return query if since is None else query.filter(column > since)
+
+def student_experiments_since(student, since):
+    """experiments of a student changed since, membership changes included"""
+    return _since(student_experiment_list(student), Experiment.updated_at, since)
+
+def student_assignments_since(student, since):
+    """assignments of a student changed since"""
+    return _since(student_assignment_list(student), Assignment.updated_at, since)
+
+def student_observations_since(student, since):
+    """observations of a student's experiments changed since, with every observation of an experiment
+    that changed itself, so a student who just joined it gets the observations made before"""
+    query = Observation.query \
+        .join(Observation.experiment) \
+        .join(student_experiments, student_experiments.c.experiment_id == Experiment.id) \
+        .filter(student_experiments.c.student_id == student.id) \
+        .options(contains_eager(Observation.experiment), selectinload(Observation.student_collaborators)) \
+        .order_by(Observation.id)
+    if since is not None:
+        query = query.filter(or_(Observation.updated_at > since, Experiment.updated_at > since))
+    return query
+
+def student_observation_responses_since(student, since):
+    """student's own observation responses changed since"""
+    query = ObservationResponse.query \
+        .filter_by(student_id = student.id) \
+        .options(joinedload(ObservationResponse.observation)) \
+        .order_by(ObservationResponse.id)
+    return _since(query, ObservationResponse.updated_at, since)
+
+def student_assignment_responses_since(student, since):
+    """student's own assignment responses changed since, with their assignment and its teacher"""
+    query = AssignmentResponse.query \
+        .filter_by(student_id = student.id) \
+        .options(joinedload(AssignmentResponse.assignment).joinedload(Assignment.teacher)) \
+        .order_by(AssignmentResponse.id)
+    return _since(query, AssignmentResponse.updated_at, since)
+
+def student_teacher_ids(student):
+    """ids of the teachers whose rows a student syncs: their own and those of their experiments and assignments"""
+    experiments = Experiment.query \
+        .join(student_experiments, student_experiments.c.experiment_id == Experiment.id) \
+        .filter(student_experiments.c.student_id == student.id) \
+        .with_entities(Experiment.teacher_id)
+    assignments = Assignment.query \
+        .join(student_assignments, student_assignments.c.assignment_id == Assignment.id) \
+        .filter(student_assignments.c.student_id == student.id) \
+        .with_entities(Assignment.teacher_id)
+    return {student.teacher_id} | {teacher_id for teacher_id, in experiments.union(assignments)}
+
+def student_tombstones_since(student, since):
+    """(table name, public id) of the rows deleted or taken from the student since"""
+    return Tombstone.query \
+        .filter(Tombstone.deleted_at > since) \
+        .filter(or_(
+            Tombstone.student_id == student.id,
+            and_(Tombstone.student_id == None, Tombstone.teacher_id.in_(student_teacher_ids(student))))) \
+        .with_entities(Tombstone.table_name, Tombstone.public_id) \
+        .order_by(Tombstone.id)
@@ -0,0 +1,319 @@
+import flask
+from flask import current_app
+from sqlalchemy import inspect
+
+from fopd import fieldsets
+from fopd.models import Teacher, Student, Device, Course, Experiment, Assignment, AssignmentResponse, Observation, ObservationResponse, Reading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# orjson writes dates as YYYY-MM-DD itself, the other backends need str()
+NATIVE_DATES = orjson is not None
+
+### Field types
+# a plain string field returns the model attribute of that name as is
+
+class Date(object):
+    """date column, rendered as YYYY-MM-DD"""
+    def __init__(self, attr):
+        self.attr = attr
+
+class Count(object):
+    """number of items in a collection"""
+    def __init__(self, relationship):
+        self.relationship = relationship
+
+class Nested(object):
+    """related row(s) rendered by another serializer"""
+    def __init__(self, relationship, serializer, many = False):
+        self.relationship = relationship
+        self.serializer = serializer
+        self.many = many
+
+class Computed(object):
+    """field built from the row by `get`. `columns` are the model columns it reads and
+    `relationship` the relationship it walks, so both can be skipped when it is not asked for"""
+    def __init__(self, get, *columns, relationship = None):
+        self.get = get
+        self.columns = columns
+        self.relationship = relationship
+
+### Serializer
+
+class Serializer(object):
+    """json shape of a model. every subset of its keys is compiled once into a plain
+    function building the dict, so rendering a row costs one call and no per-field dispatch"""
+    def __init__(self, model, **fields):
+        self.model = model
+        self.fields = fields
+        self._encoders = {}
+
+    def only(self, *keys):
+        return Serializer(self.model, **{key: self.fields[key] for key in keys})
+
+    def encoder(self, keys = None):
+        """compiled function rendering a row with `keys`, all keys when None"""
+        keys = tuple(keys) if keys is not None else tuple(self.fields)
+        encode = self._encoders.get(keys)
+        if encode is None:
+            encode = self._encoders[keys] = self._compile(keys)
+        return encode
+
+    def dump(self, row, keys = None):
+        return self.encoder(keys)(row)
+
+    def dump_many(self, rows, keys = None):
+        encode = self.encoder(keys)
+        return [encode(row) for row in rows]
+
+    def _compile(self, keys):
+        scope = {'_str': str}
+        items = []
+        for i, key in enumerate(keys):
+            field = self.fields[key]
+            if isinstance(field, str):
+                expr = f'row.{field}'
+            elif isinstance(field, Date):
+                # keep str() for nullable dates so a missing date still renders as before
+                nullable = getattr(self.model, field.attr).property.columns[0].nullable
+                expr = f'row.{field.attr}' if NATIVE_DATES and not nullable else f'_str(row.{field.attr})'
+            elif isinstance(field, Count):
+                expr = f'len(row.{field.relationship})'
+            elif isinstance(field, Nested):
+                nested = field.serializer.encoder()
+                scope[f'_f{i}'] = nested if field.many else (lambda value, nested = nested: None if value is None else nested(value))
+                expr = f'[_f{i}(item) for item in row.{field.relationship}]' if field.many else f'_f{i}(row.{field.relationship})'
+            else:
+                scope[f'_f{i}'] = field.get
+                expr = f'_f{i}(row)'
+            items.append(f'{key!r}: {expr}')
+
+        source = 'def encode(row):\n    return {' + ', '.join(items) + '}\n'
+        exec(compile(source, f'<serializer {self.model.__name__}>', 'exec'), scope)
+        return scope['encode']
+
+    def _reads(self, field):
+        """(columns, relationship) a field needs loaded"""
+        if isinstance(field, str):
+            return (field,), None
+        if isinstance(field, Date):
+            return (field.attr,), None
+        if isinstance(field, Count):
+            return (), field.relationship
+        if isinstance(field, Nested):
+            mapper = inspect(self.model)
+            local = mapper.relationships[field.relationship].local_columns
+            columns = () if field.many else tuple(mapper.get_property_by_column(column).key for column in local)
+            return columns, field.relationship
+        return field.columns, field.relationship
+
+    def select(self, query):
+        """project the query down to the fields asked for with ?fields=, returns the query and the field keys"""
+        keys = fieldsets.requested(self.fields)
+        if len(keys) == len(self.fields):
+            return query, keys
+
+        columns, needed, skipped = set(), set(), set()
+        for key in keys:
+            reads, relationship = self._reads(self.fields[key])
+            columns.update(reads)
+            needed.add(relationship)
+
+        for field in self.fields.values():
+            relationship = self._reads(field)[1]
+            if relationship and relationship not in needed:
+                skipped.add(relationship)
+
+        return fieldsets.project(query, self.model, columns, sorted(skipped)), keys
+
+### Registry
+# shapes are registered per model, `default` is the one used for the model unless a handler says otherwise
+
+registry = {}
+
+def register(model, shape = 'default', **fields):
+    serializer = registry[(model, shape)] = Serializer(model, **fields)
+    return serializer
+
+def serializer_for(model, shape = 'default'):
+    return registry[(model, shape)]
+
+student = register(Student,
+    fname = 'fname',
+    lname = 'lname',
+    username = 'username',
+    id = 'public_id'
+)
+
+# older listings name the public id `public_id`
+student_public_id = register(Student, 'public_id',
+    fname = 'fname',
+    lname = 'lname',
+    username = 'username',
+    public_id = 'public_id'
+)
+
+teacher = register(Teacher,
+    fname = 'fname',
+    lname = 'lname',
+    username = 'username',
+    id = 'public_id'
+)
+
+teacher_public_id = register(Teacher, 'public_id',
+    fname = 'fname',
+    lname = 'lname',
+    username = 'username',
+    public_id = 'public_id'
+)
+
+student_detail = register(Student, 'detail', **student.fields,
+    teacher = Nested('teacher', teacher)
+)
+
+device = register(Device,
+    name = 'name',
+    id = 'public_id',
+    external_id = 'external_id'
+)
+
+device_summary = register(Device, 'summary',
+    id = 'public_id',
+    name = 'name'
+)
+
+device_detail = register(Device, 'detail', **device.fields,
+    teacher = Nested('teacher', teacher)
+)
+
+course = register(Course,
+    name = 'name',
+    id = 'public_id',
+    students = Nested('students', student, many = True),
+    num_students = Count('students'),
+    teacher = Nested('teacher', teacher_public_id)
+)
+
+course_detail = register(Course, 'detail', **{
+    **course.fields,
+    'teacher': Nested('teacher', teacher)
+})
+
+experiment_summary = register(Experiment, 'summary',
+    title = 'title',
+    description = 'description',
+    plant = 'plant',
+    id = 'public_id',
+    start_date = Date('start_date')
+)
+
+experiment = register(Experiment, **experiment_summary.fields,
+    students = Nested('students', student, many = True),
+    num_students = Count('students'),
+    device = Nested('device', device_summary)
+)
+
+experiment_detail = register(Experiment, 'detail', **experiment_summary.fields,
+    teacher = Nested('teacher', teacher),
+    students = Nested('students', student, many = True),
+    device = Nested('device', device_summary)
+)
+
+student_experiment = register(Experiment, 'student', **experiment_summary.fields,
+    teacher = Nested('teacher', teacher),
+    device = Nested('device', device_summary)
+)
+
+assignment_summary = register(Assignment, 'summary',
+    id = 'public_id',
+    title = 'title',
+    description = 'description',
+    type = 'type',
+    due_date = Date('due_date')
+)
+
+assignment = register(Assignment, **assignment_summary.fields,
+    assignees = Nested('students', student, many = True),
+    num_assignees = Count('students')
+)
+
+observation_summary = register(Observation, 'summary',
+    title = 'title',
+    id = 'public_id',
+    description = 'description',
+    units = 'units',
+    updated = Date('updated'),
+    type = 'type'
+)
+
+observation = register(Observation, **observation_summary.fields,
+    collaborators = Nested('student_collaborators', student, many = True),
+    experiment = Nested('experiment', experiment_summary)
+)
+
+observation_response = register(ObservationResponse,
+    id = 'public_id',
+    editable = 'editable',
+    response = 'response',
+    number = 'id',
+    submitted = Date('submitted'),
+    student = Nested('student', student)
+)
+
+# responses listed apart from their observation say which one they answer
+observation_response_sync = register(ObservationResponse, 'sync', **observation_response.fields,
+    observation = Nested('observation', observation_summary.only('id'))
+)
+
+assignment_response = register(AssignmentResponse,
+    id = 'public_id',
+    submitted = Date('submitted'),
+    comments = Computed(lambda response: response.comments or '', 'comments'),
+    response = 'response',
+    student = Nested('student', student_public_id),
+    assignment = Nested('assignment', assignment_summary.only('id', 'title', 'description', 'type')),
+    teacher = Computed(lambda response: teacher_public_id.dump(response.assignment.teacher), 'assignment_id')
+)
+
+reading = register(Reading,
+    device_id = 'device_id',
+    device_name = 'device_name',
+    ts = Computed(lambda reading: str(reading.ts), 'ts'),
+    subject = 'subject',
+    subject_location_id = 'subject_location_id',
+    attribute = 'attribute',
+    value = 'value',
+    units = 'units'
+)
+
+### JSON backend
+
+def _dumps(data):
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if current_app.config['JSONIFY_PRETTYPRINT_REGULAR'] or current_app.debug else 0
+        return orjson.dumps(data, option = option)
+    return ujson.dumps(data)
+
+def jsonify(*args, **kwargs):
+    """flask.jsonify encoding with orjson or ujson when one is installed"""
+    if orjson is None and ujson is None:
+        return flask.jsonify(*args, **kwargs)
+
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both args and kwargs')
+    data = args[0] if len(args) == 1 else args or kwargs
+
+    try:
+        body = _dumps(data)
+    except (TypeError, OverflowError):
+        # values only flask's encoder knows, e.g. non string keys
+        return flask.jsonify(data)
+    return current_app.response_class(body, mimetype = current_app.config['JSONIFY_MIMETYPE'])
@@ -0,0 +1,227 @@
+import collections, json, queue, threading, time
+
+try:
+   import redis
+except ImportError:
+   redis = None
+
+
+class Subscription(object):
+   """(id, message) pairs of a channel, read with get(). a subscriber that falls more than maxSize
+   messages behind loses the oldest ones, dropped counts them and takeLost() tells it once"""
+   MAX_SIZE = 256
+
+   def __init__(self, broker, channel, maxSize = MAX_SIZE):
+      self.broker = broker
+      self.channel = channel
+      self._queue = queue.Queue(maxsize = maxSize)
+      self.dropped = 0
+      self.lost = False
+
+   def put(self, item):
+      while True:
+         try:
+            self._queue.put_nowait(item)
+            return
+         except queue.Full:
+            try:
+               self._queue.get_nowait()
+               self.dropped += 1
+               self.lost = True
+            except queue.Empty:
+               pass
+
+   def get(self, timeout = None):
+      """next (id, message), None when none arrived within timeout seconds"""
+      try:
+         return self._queue.get(timeout = timeout)
+      except queue.Empty:
+         return None
+
+   def takeLost(self):
+      """whether messages were lost since the last call"""
+      lost, self.lost = self.lost, False
+      return lost
+
+   def close(self):
+      self.broker.unsubscribe(self)
+
+
+class LocalBroker(object):
+   """in-process publish/subscribe, messages reach the subscribers of this process only.
+   each channel numbers its messages from 1 and keeps the last `backlog` of them for replay()"""
+   BACKLOG = 100
+   MAX_CHANNELS = 1024 # channels whose backlog is kept, the least recently published lose theirs first
+
+   def __init__(self, backlog = BACKLOG):
+      self._lock = threading.Lock()
+      self._subscribers = {} # channel -> subscriptions
+      self._lastIds = {} # channel -> id of its last message
+      self._backlogs = collections.OrderedDict() # channel -> deque of recent (id, message)
+      self.backlog = backlog
+      self.published = 0
+
+   def subscribe(self, channel):
+      subscription = Subscription(self, channel)
+      with self._lock:
+         self._subscribers.setdefault(channel, set()).add(subscription)
+      return subscription
+
+   def unsubscribe(self, subscription):
+      with self._lock:
+         subscribers = self._subscribers.get(subscription.channel)
+         if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+               del self._subscribers[subscription.channel]
+
+   def publish(self, channel, message):
+      """publish message to channel, returns its id"""
+      with self._lock:
+         messageId = self._lastIds.get(channel, 0) + 1
+         self._lastIds[channel] = messageId
+         backlog = self._backlogs.pop(channel, None) or collections.deque(maxlen = self.backlog)
+         backlog.append((messageId, message))
+         self._backlogs[channel] = backlog
+         if len(self._backlogs) > self.MAX_CHANNELS:
+            self._backlogs.popitem(last = False)
+         # delivered under the lock so subscribers get the messages of a channel in id order
+         self._deliverLocked(channel, messageId, message)
+      return messageId
+
+   def replay(self, channel, after):
+      """the (id, message) published to channel after id `after`, None when some of them are no
+      longer kept, or `after` is not an id of this channel, and the subscriber has to resync"""
+      with self._lock:
+         return self._missed(after, self._lastIds.get(channel, 0), list(self._backlogs.get(channel, ())))
+
+   def _missed(self, after, lastId, backlog):
+      # ids of a channel have no gaps, so the backlog is complete when it holds every id after `after`
+      missed = [(messageId, message) for messageId, message in backlog if messageId > after]
+      lastId = max([lastId] + [messageId for messageId, _ in missed])
+      if after > lastId or len(missed) < lastId - after:
+         return None
+      return missed
+
+   def _deliver(self, channel, messageId, message):
+      with self._lock:
+         self._deliverLocked(channel, messageId, message)
+
+   def _deliverLocked(self, channel, messageId, message):
+      self.published += 1
+      for subscription in self._subscribers.get(channel, ()):
+         subscription.put((messageId, message))
+
+   def _loseAll(self):
+      """tell every subscriber it may have missed messages"""
+      with self._lock:
+         for subscribers in self._subscribers.values():
+            for subscription in subscribers:
+               subscription.lost = True
+
+   def stats(self):
+      with self._lock:
+         return {
+            'backend': 'memory',
+            'channels': len(self._subscribers),
+            'subscriptions': sum(len(subscribers) for subscribers in self._subscribers.values()),
+            'published': self.published
+         }
+
+
+class RedisBroker(LocalBroker):
+   """publishes through a redis compatible server so subscribers of every worker and host get the message.
+   ids and backlogs live in redis, each process runs one listener thread relaying the messages to its
+   local subscribers and reconnecting when the connection drops"""
+   PREFIX = "fopd:events:"
+   BACKLOG_TTL = 24 * 60 * 60 # seconds a channel nobody publishes to keeps its backlog
+   RECONNECT_DELAY = 1
+
+   # numbers, keeps and publishes the message in one step so ids, backlog and subscribers agree
+   PUBLISH = """
+      local id = redis.call('INCR', KEYS[1])
+      local payload = cjson.encode({id, ARGV[1]})
+      redis.call('RPUSH', KEYS[2], payload)
+      redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1)
+      redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]))
+      redis.call('PUBLISH', KEYS[3], payload)
+      return id
+   """
+
+   def __init__(self, url, prefix = PREFIX, backlog = LocalBroker.BACKLOG):
+      if redis is None:
+         raise ValueError("The redis broker needs the redis package, pip install redis")
+      super().__init__(backlog = backlog)
+      self.redis = redis.Redis.from_url(url)
+      self.prefix = prefix
+      self._publish = self.redis.register_script(self.PUBLISH)
+      self._listener = None
+      self._listenerLock = threading.Lock()
+      self._listening = threading.Event()
+
+   def _keys(self, channel):
+      # the id counter never expires, a channel whose ids started over would replay the wrong messages
+      return self.prefix + "id:" + channel, self.prefix + "backlog:" + channel
+
+   def subscribe(self, channel):
+      self._listen()
+      return super().subscribe(channel)
+
+   def publish(self, channel, message):
+      idKey, backlogKey = self._keys(channel)
+      return self._publish(keys = [idKey, backlogKey, self.prefix + channel], args = [message, self.backlog, self.BACKLOG_TTL])
+
+   def replay(self, channel, after):
+      idKey, backlogKey = self._keys(channel)
+      pipeline = self.redis.pipeline()
+      pipeline.get(idKey)
+      pipeline.lrange(backlogKey, 0, -1)
+      lastId, backlog = pipeline.execute()
+      return self._missed(after, int(lastId or 0), [tuple(json.loads(payload)) for payload in backlog])
+
+   def _listen(self):
+      # started lazily so forked server workers each get their own thread
+      with self._listenerLock:
+         if self._listener is None or not self._listener.is_alive():
+            self._listener = threading.Thread(target = self._relay, name = "broker-relay", daemon = True)
+            self._listener.start()
+      # a subscriber replays the backlog next, what is published after that has to reach the relay
+      self._listening.wait(self.RECONNECT_DELAY)
+
+   def _relay(self):
+      connected = False
+      while True:
+         pubsub = self.redis.pubsub(ignore_subscribe_messages = True)
+         try:
+            pubsub.psubscribe(self.prefix + "*")
+            self._listening.set()
+            if connected:
+               # whatever was published while reconnecting never reached the subscribers
+               self._loseAll()
+            connected = True
+            for item in pubsub.listen():
+               channel = item["channel"].decode("utf-8")[len(self.prefix):]
+               messageId, message = json.loads(item["data"])
+               self._deliver(channel, messageId, message)
+         except Exception as e:
+            print("Event relay lost its connection, reconnecting:", e)
+            time.sleep(self.RECONNECT_DELAY)
+         finally:
+            try:
+               pubsub.close()
+            except Exception:
+               pass
+
+   def stats(self):
+      stats = super().stats()
+      stats['backend'] = 'redis'
+      return stats
+
+
+def makeBroker(backend, url = None, backlog = LocalBroker.BACKLOG):
+   """build a broker for a backend name: memory or redis"""
+   if not backend or backend == 'memory':
+      return LocalBroker(backlog = backlog)
+   if backend == 'redis':
+      return RedisBroker(url, backlog = backlog)
+   raise ValueError(f"Unknown broker backend `{backend}`")
@@ -0,0 +1,254 @@
+import json, os, sqlite3, threading, time
+
+from collections import OrderedDict
+
+try:
+   import redis
+except ImportError:
+   redis = None
+
+
+class LRUCache(object):
+   """in-process cache of at most maxSize entries, the least recently used entry is evicted first.
+   entries can carry tags, invalidate(tag) drops every entry tagged with it"""
+   MAX_SIZE = 1024
+
+   def __init__(self, maxSize = MAX_SIZE):
+      self.maxSize = maxSize
+      self._entries = OrderedDict()
+      self._tags = {} # tag -> keys
+      self._lock = threading.Lock()
+      self.hits = 0
+      self.misses = 0
+      self.evictions = 0
+      self.invalidations = 0
+
+   def get(self, key):
+      """cached value for key, None when missing or expired"""
+      with self._lock:
+         entry = self._entries.get(key)
+         if entry is not None and entry[1] is not None and entry[1] < time.time():
+            del self._entries[key]
+            self._untag(key, entry)
+            entry = None
+
+         if entry is None:
+            self.misses += 1
+            return None
+
+         self._entries.move_to_end(key)
+         self.hits += 1
+         return entry[0]
+
+   def set(self, key, value, ttl = None, tags = ()):
+      """cache value for ttl seconds, forever when ttl is None"""
+      expires = time.time() + ttl if ttl is not None else None
+      with self._lock:
+         self._untag(key, self._entries.get(key))
+         self._entries[key] = (value, expires, tuple(tags))
+         self._entries.move_to_end(key)
+         for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+         while len(self._entries) > self.maxSize:
+            evicted, entry = self._entries.popitem(last = False)
+            self._untag(evicted, entry)
+            self.evictions += 1
+
+   def _untag(self, key, entry):
+      for tag in (entry[2] if entry is not None else ()):
+         keys = self._tags.get(tag)
+         if keys is not None:
+            keys.discard(key)
+            if not keys:
+               del self._tags[tag]
+
+   def invalidate(self, *tags):
+      """drop the entries tagged with any of tags"""
+      with self._lock:
+         for tag in tags:
+            for key in self._tags.pop(tag, ()):
+               entry = self._entries.pop(key, None)
+               self._untag(key, entry)
+               self.invalidations += entry is not None
+
+   def delete(self, key):
+      with self._lock:
+         self._untag(key, self._entries.pop(key, None))
+
+   def clear(self):
+      with self._lock:
+         self._entries.clear()
+         self._tags.clear()
+
+   def __len__(self):
+      return len(self._entries)
+
+   def stats(self):
+      lookups = self.hits + self.misses
+      return {
+         'backend': 'memory',
+         'size': len(self),
+         'max_size': self.maxSize,
+         'hits': self.hits,
+         'misses': self.misses,
+         'evictions': self.evictions,
+         'invalidations': self.invalidations,
+         'hit_ratio': self.hits / lookups if lookups else 0.0
+      }
+
+
+class SqliteCache(LRUCache):
+   """cache kept in a sqlite file so it is shared by all workers of a host and survives restarts.
+   values have to be json serializable, hit and miss counters are per process"""
+
+   def __init__(self, path, maxSize = LRUCache.MAX_SIZE):
+      super().__init__(maxSize)
+      self.path = path
+      self._local = threading.local()
+
+      directory = os.path.dirname(os.path.abspath(path))
+      if not os.path.isdir(directory):
+         os.makedirs(directory)
+
+      with self._connection() as connection:
+         connection.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL, accessed REAL NOT NULL)")
+         connection.execute("CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache (accessed)")
+
+   def _connection(self):
+      # sqlite connections cannot be shared between threads
+      connection = getattr(self._local, 'connection', None)
+      if connection is None:
+         connection = sqlite3.connect(self.path, timeout = 10)
+         self._local.connection = connection
+      return connection
+
+   def _key(self, key):
+      return json.dumps(key, sort_keys = True, default = str)
+
+   def get(self, key):
+      key = self._key(key)
+      now = time.time()
+      with self._connection() as connection:
+         row = connection.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+         if row is not None and row[1] is not None and row[1] < now:
+            connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            row = None
+
+         if row is not None:
+            connection.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+
+      with self._lock:
+         if row is None:
+            self.misses += 1
+            return None
+         self.hits += 1
+      return json.loads(row[0])
+
+   def set(self, key, value, ttl = None):
+      now = time.time()
+      expires = now + ttl if ttl is not None else None
+      with self._connection() as connection:
+         connection.execute("INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                            (self._key(key), json.dumps(value), expires, now))
+         overflow = len(self) - self.maxSize
+         if overflow > 0:
+            connection.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)", (overflow,))
+            with self._lock:
+               self.evictions += overflow
+
+   def delete(self, key):
+      with self._connection() as connection:
+         connection.execute("DELETE FROM cache WHERE key = ?", (self._key(key),))
+
+   def clear(self):
+      with self._connection() as connection:
+         connection.execute("DELETE FROM cache")
+
+   def __len__(self):
+      return self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+   def stats(self):
+      stats = super().stats()
+      stats['backend'] = 'sqlite'
+      return stats
+
+
+class RedisCache(LRUCache):
+   """cache in a redis compatible server, shared by every worker and host using the same url.
+   values have to be json serializable, the server evicts by its own policy so maxSize is not enforced.
+   hit and miss counters are per process"""
+   PREFIX = "fopd:cache:"
+
+   def __init__(self, url, prefix = PREFIX):
+      if redis is None:
+         raise ValueError("The redis cache backend needs the redis package, pip install redis")
+      super().__init__()
+      self.redis = redis.Redis.from_url(url)
+      self.prefix = prefix
+
+   def _key(self, key):
+      return self.prefix + json.dumps(key, sort_keys = True, default = str)
+
+   def _tagKey(self, tag):
+      return f"{self.prefix}tag:{tag}"
+
+   def get(self, key):
+      value = self.redis.get(self._key(key))
+      with self._lock:
+         if value is None:
+            self.misses += 1
+            return None
+         self.hits += 1
+      return json.loads(value)
+
+   def set(self, key, value, ttl = None, tags = ()):
+      key = self._key(key)
+      pipeline = self.redis.pipeline()
+      pipeline.set(key, json.dumps(value), ex = int(ttl) if ttl else None)
+      for tag in tags:
+         pipeline.sadd(self._tagKey(tag), key)
+      pipeline.execute()
+
+   def invalidate(self, *tags):
+      for tag in tags:
+         tagKey = self._tagKey(tag)
+         # take the members and drop the set in one step so keys tagged meanwhile are not lost
+         pipeline = self.redis.pipeline()
+         pipeline.smembers(tagKey)
+         pipeline.delete(tagKey)
+         keys = pipeline.execute()[0]
+         if keys:
+            deleted = self.redis.delete(*keys)
+            with self._lock:
+               self.invalidations += deleted
+
+   def delete(self, key):
+      self.redis.delete(self._key(key))
+
+   def clear(self):
+      keys = list(self.redis.scan_iter(match = self.prefix + "*"))
+      if keys:
+         self.redis.delete(*keys)
+
+   def __len__(self):
+      return sum(1 for key in self.redis.scan_iter(match = self.prefix + "*") if not key.startswith((self.prefix + "tag:").encode("utf-8")))
+
+   def stats(self):
+      stats = super().stats()
+      stats['backend'] = 'redis'
+      stats['max_size'] = None
+      return stats
+
+
+def makeCache(backend, maxSize = LRUCache.MAX_SIZE, path = None, url = None):
+   """build a cache for a backend name: memory, sqlite, redis or none"""
+   if not backend or backend == 'none':
+      return None
+   if backend == 'memory':
+      return LRUCache(maxSize)
+   if backend == 'sqlite':
+      return SqliteCache(path, maxSize)
+   if backend == 'redis':
+      return RedisCache(url)
+   raise ValueError(f"Unknown cache backend `{backend}`")
@@ -1,4 +1,10 @@
-import requests, datetime, json, time, os
+import requests, datetime, json, time, os, threading, asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib3.util.retry import Retry
+
+from fopd.services.jsonparser import JsonParser
+from fopd.services.singleflight import SingleFlight
 
 TIMEOUT = 600213
 TOOMANYREDIRECTS = 31321
@@ -11,11 +17,82 @@ class HttpService(object):
    IMAGE_URL = "https://fop1.urbanspacefarms.com:5000/api/image/%s?ts=%d"
    ENCODING = "utf-8"
    FILE_PATH = os.path.join(".")
+   DATE_FORMAT = "%Y-%m-%d"
+   MAX_WORKERS = 8
+   POOL_SIZE = 8
+   CONNECT_TIMEOUT = 5
+   READ_TIMEOUT = 30
+   RETRIES = 3
+   BACKOFF = 0.5
+   RETRY_STATUSES = (429, 500, 502, 503, 504)
+   CHUNK_DAYS = 7
+   CHUNK_RETRIES = 1
+   CACHE_TTL = 60
+   SESSION_TTL = 3600
+   LOGIN_RETRY_AFTER = 5
+   STREAM_CHUNK_SIZE = 64 * 1024
 
-   def __init__(self):
+   def __init__(self, maxWorkers = MAX_WORKERS, chunkDays = CHUNK_DAYS, chunkRetries = CHUNK_RETRIES, cache = None, cacheTtl = CACHE_TTL,
+                poolSize = POOL_SIZE, connectTimeout = CONNECT_TIMEOUT, readTimeout = READ_TIMEOUT, retries = RETRIES, backoff = BACKOFF):
       self.session = requests.Session()
+      self.session.headers["Connection"] = "keep-alive"
+      self.cache = cache
+      self.cacheTtl = cacheTtl
+      self.flight = SingleFlight()
+      self.poolSize = poolSize
+      self.retries = retries
+      self.backoff = backoff
+      self.timeout = (connectTimeout, readTimeout)
+      self.configure(maxWorkers = maxWorkers, chunkDays = chunkDays, chunkRetries = chunkRetries)
+      self._mountAdapter()
       self.cookieJar = None
-      self.login()
+      # the upstream session is created on first use, not at import time
+      self.sessionTtl = self.SESSION_TTL
+      self._sessionLock = threading.Lock()
+      self._sessionExpires = 0
+      self._sessionGeneration = 0
+      # after a failed login requests go without a session until then instead of each logging in again
+      self._loginRetryAt = 0
+
+   def configure(self, maxWorkers = None, chunkDays = None, chunkRetries = None, cache = None, cacheTtl = None, lockDir = None,
+                 poolSize = None, connectTimeout = None, readTimeout = None, retries = None, backoff = None, sessionTtl = None):
+      """apply settings after construction, e.g. from the flask app config"""
+      if sessionTtl:
+         self.sessionTtl = sessionTtl
+      if lockDir:
+         self.flight = SingleFlight(lockDir)
+      if cache is not None:
+         self.cache = cache
+      if cacheTtl is not None:
+         self.cacheTtl = cacheTtl
+      if maxWorkers:
+         self.maxWorkers = maxWorkers
+         # caps the upstream requests in flight across batches and range chunks
+         self._slots = threading.BoundedSemaphore(maxWorkers)
+      if chunkDays:
+         self.chunkDays = chunkDays
+      if chunkRetries is not None:
+         self.chunkRetries = chunkRetries
+      if connectTimeout or readTimeout:
+         self.timeout = (connectTimeout or self.timeout[0], readTimeout or self.timeout[1])
+
+      if poolSize or retries is not None or backoff is not None:
+         self.poolSize = poolSize or self.poolSize
+         self.retries = retries if retries is not None else self.retries
+         self.backoff = backoff if backoff is not None else self.backoff
+         self._mountAdapter()
+
+   def _mountAdapter(self):
+      """keep-alive connection pool with exponential backoff retries of idempotent requests"""
+      retry = Retry(
+         total = self.retries,
+         backoff_factor = self.backoff,
+         status_forcelist = self.RETRY_STATUSES,
+         raise_on_status = False
+      )
+      adapter = requests.adapters.HTTPAdapter(pool_connections = self.poolSize, pool_maxsize = self.poolSize, max_retries = retry)
+      self.session.mount("https://", adapter)
+      self.session.mount("http://", adapter)
 
    def _get_credentials(self):
       """return default login credentials"""
@@ -31,24 +108,81 @@ class HttpService(object):
       }
 
       try:
-         response = self.session.post(url, data = credentials, headers = header, verify = False)
+         response = self.session.post(url, data = credentials, headers = header, verify = False, timeout = self.timeout)
          self.cookieJar = self.session.cookies
          # print(self.cookieJar.get_dict())
-         return {
-            'session': self.cookieJar.get_dict().get('session'),
-            'logged_in': response.json()['logged_in'],
-            'organizations': response.json()['organizations']
-         }
+         login_json = response.json()
       except requests.exceptions.Timeout as e:
          print(e)
+         self._loginFailed()
          return TIMEOUT
       except requests.exceptions.TooManyRedirects as ex:
          print(ex)
+         self._loginFailed()
          return TOOMANYREDIRECTS
-      except requests.exceptions.RequestException as exy:
+      except (requests.exceptions.RequestException, ValueError) as exy:
+         # ValueError: the upstream answered with something other than json
          print(exy)
+         self._loginFailed()
          return None
-      
+
+      if not isinstance(login_json, dict):
+         print("Unexpected login response:", login_json)
+         self._loginFailed()
+         return None
+
+      if login_json.get('logged_in'):
+         self._sessionExpires = self._cookieExpiry()
+         self._sessionGeneration += 1
+         self._loginRetryAt = 0
+      else:
+         self._loginFailed()
+      return {
+         'session': self.cookieJar.get_dict().get('session'),
+         'logged_in': login_json.get('logged_in', False),
+         'organizations': login_json.get('organizations', [])
+      }
+
+   def _loginFailed(self):
+      self._loginRetryAt = time.time() + self.LOGIN_RETRY_AFTER
+
+   def _cookieExpiry(self):
+      """when the upstream session runs out: the session cookie expiry, capped at sessionTtl"""
+      expires = time.time() + self.sessionTtl
+      for cookie in self.session.cookies:
+         if cookie.name == "session" and cookie.expires:
+            expires = min(expires, cookie.expires)
+      return expires
+
+   def _ensureSession(self):
+      """log in when there is no live upstream session, only one thread logs in at a time"""
+      if time.time() < self._sessionExpires:
+         return
+
+      with self._sessionLock:
+         if time.time() < self._sessionExpires or time.time() < self._loginRetryAt:
+            return
+         self.login()
+
+   def _renewSession(self, generation):
+      """log in again after a 401, unless another thread already did since generation or a login just failed"""
+      with self._sessionLock:
+         if self._sessionGeneration == generation:
+            self._sessionExpires = 0
+            if time.time() >= self._loginRetryAt:
+               self.login()
+
+   def _get(self, url, **kwargs):
+      """GET through the shared upstream session, re-authenticating once when it has expired"""
+      self._ensureSession()
+      generation = self._sessionGeneration
+      response = self.session.get(url, cookies = self.cookieJar, verify = False, timeout = self.timeout, **kwargs)
+
+      if response.status_code == 401:
+         response.close()
+         self._renewSession(generation)
+         response = self.session.get(url, cookies = self.cookieJar, verify = False, timeout = self.timeout, **kwargs)
+      return response
 
    def _validateDate(self, startDate, endDate):
       start = startDate.split("-")
@@ -69,49 +203,217 @@ class HttpService(object):
 
       return True
 
+   def _fetchObservations(self, deviceId, startDate, endDate, url = OBSERVATIONS_URL):
+      """a single upstream request for the observations between startDate and endDate"""
+      header = { 
+         "Content-Type": "application/json"
+          #   "User-Agent": "curl/7.61.0"
+      }   
+
+      payload = {}
+      url = url % (deviceId, startDate, endDate)
+      with self._slots:
+         response = self._get(url, data = payload, headers = header)
+      response.encoding = self.ENCODING
+      return response.json(), response.status_code, response.reason
+
+   def _cacheTtl(self, endDate):
+      """ranges that ended before today never change upstream, later ones only live for cacheTtl seconds"""
+      if endDate < datetime.date.today().strftime(self.DATE_FORMAT):
+         return None
+      return self.cacheTtl
+
+   def _fetchChunk(self, chunk):
+      """fetch a (deviceId, startDate, endDate, url) chunk through the cache"""
+      key = tuple(chunk[:3])
+      if self.cache is not None:
+         cached = self.cache.get(key)
+         if cached is not None:
+            return tuple(cached)
+
+      # identical requests arriving together share a single upstream call
+      return self.flight.do(key, lambda: self._loadChunk(key, chunk))
+
+   def _loadChunk(self, key, chunk):
+      if self.cache is not None and self.flight.lockDir:
+         # another worker may have fetched the chunk while we waited for the lock
+         cached = self.cache.get(key)
+         if cached is not None:
+            return tuple(cached)
+
+      res = self._fetchChunkUpstream(chunk)
+      if self.cache is not None and res[1] // 100 == 2:
+         self.cache.set(key, list(res), ttl = self._cacheTtl(chunk[2]))
+      return res
+
+   def _fetchChunkUpstream(self, chunk):
+      """fetch a (deviceId, startDate, endDate, url) chunk, retrying it on its own when it fails"""
+      for attempt in range(self.chunkRetries + 1):
+         if attempt:
+            time.sleep(0.5 * 2 ** (attempt - 1))
+
+         try:
+            res = self._fetchObservations(*chunk)
+         except (requests.exceptions.RequestException, ValueError) as e:
+            print(e)
+            res = None, 502, str(e)
+            continue
+
+         status_code = res[1]
+         # client errors will not go away by asking again
+         if status_code // 100 == 2 or (status_code // 100 == 4 and status_code != 429):
+            return res
+      return res
+
+   def _splitRange(self, startDate, endDate):
+      """split a date range into (startDate, endDate) chunks of at most chunkDays days"""
+      try:
+         start = datetime.datetime.strptime(startDate, self.DATE_FORMAT).date()
+         end = datetime.datetime.strptime(endDate, self.DATE_FORMAT).date()
+      except ValueError:
+         return [(startDate, endDate)]
+
+      step = datetime.timedelta(days = self.chunkDays)
+      chunks = []
+      while start + step < end:
+         chunks.append((start.strftime(self.DATE_FORMAT), (start + step).strftime(self.DATE_FORMAT)))
+         start += step
+      chunks.append((start.strftime(self.DATE_FORMAT), endDate))
+      return chunks
+
+   def _stitch(self, results):
+      """concatenate chunk observations in date order, dropping readings repeated at chunk boundaries"""
+      observations = []
+      seen = set()
+      for res in results:
+         # the api answers with a message string instead of a list when there is no data
+         if not isinstance(res[0], list):
+            continue
+
+         for observation in res[0]:
+            if isinstance(observation, dict):
+               key = (observation.get('ts'), observation.get('subject_location_id'), observation.get('attribute'))
+               if key in seen:
+                  continue
+               seen.add(key)
+            observations.append(observation)
+      return observations
+
    def getObservations(self, deviceId, startDate = None, endDate = None,  url = OBSERVATIONS_URL):
       if not deviceId: # illegal
          print("No deviceId in getObservations")
          return None
+
+      # if no dates provided, choose between yesterday and today
+      if not startDate: 
+         startDate = (datetime.date.today() - datetime.timedelta(days = 1)).strftime(self.DATE_FORMAT)
+      if not endDate:
+         endDate = datetime.date.today().strftime(self.DATE_FORMAT)
       
       if not self._validateDate(startDate, endDate):
          print("Invalid date")
          return None
 
-      # if no dates provided, choose between yesterday and today
-      if not startDate: 
-         startDate = datetime.today().strftime('%Y-%m-%d')
-         print(startDate)
-      if not endDate:
-         endDate = datetime.strftime(datetime.today() - datetime.timedelta(days = 1), '%Y-%m-%d')
-         print(endDate)
+      # long ranges go out as concurrent chunks so no single upstream request grows unbounded
+      chunks = [(deviceId, start, end, url) for start, end in self._splitRange(startDate, endDate)]
+      if len(chunks) == 1:
+         return self._fetchChunk(chunks[0])
 
-      header = { 
+      with ThreadPoolExecutor(max_workers = min(self.maxWorkers, len(chunks))) as executor:
+         results = list(executor.map(self._fetchChunk, chunks))
+
+      for res in results:
+         if res[1] // 100 != 2:
+            return None, res[1], res[2]
+
+      return self._stitch(results), results[-1][1], results[-1][2]
+
+   def streamObservations(self, deviceId, startDate, endDate, url = OBSERVATIONS_URL, chunkSize = STREAM_CHUNK_SIZE):
+      """like getObservations but returns a generator over the observations as the response body arrives"""
+      if not deviceId or not self._validateDate(startDate, endDate):
+         return None
+
+      header = {
          "Content-Type": "application/json"
-          #   "User-Agent": "curl/7.61.0"
-      }   
+      }
 
-      payload = {}
       url = url % (deviceId, startDate, endDate)
-      response = self.session.get(url, data = payload, cookies = self.cookieJar, headers = header, verify = False)
-      # print(response.json())
-      #print(response)
-      response.encoding = self.ENCODING
-      return response.json(), response.status_code, response.reason
+      response = self._get(url, headers = header, stream = True)
+      if response.status_code // 100 != 2:
+         response.close()
+         return None, response.status_code, response.reason
+
+      def generate():
+         try:
+            for observation in JsonParser.iterparse(response.iter_content(chunkSize), self.ENCODING):
+               yield observation
+         finally:
+            response.close()
+
+      return generate(), response.status_code, response.reason
+
+   def _getObservationsSafe(self, query):
+      try:
+         return self.getObservations(*query)
+      except (requests.exceptions.RequestException, ValueError) as e:
+         print(e)
+         return None, 502, str(e)
+
+   def getObservationsBatch(self, queries, maxWorkers = None):
+      """fetch (deviceId, startDate, endDate) queries concurrently, results are returned in query order"""
+      if not queries:
+         return []
+
+      workers = min(maxWorkers or self.maxWorkers, len(queries))
+      with ThreadPoolExecutor(max_workers = workers) as executor:
+         return list(executor.map(self._getObservationsSafe, queries))
+
+   def streamImage(self, deviceId, ts, url = IMAGE_URL):
+      """open a streamed response for the image a device took at ts (epoch milliseconds)"""
+      url = url % (deviceId, ts)
+      return self._get(url, stream = True)
 
    def getImage(self, deviceId, ts = None, url = IMAGE_URL, filename = 'testfile.png'):
       if not ts:
-         ts = int(time.time())
+         ts = int(time.time() * 1000)
          print(ts)
       
-      url = url % (deviceId, ts)
-      response = self.session.get(url, cookies = self.cookieJar, stream = True)
+      response = self.streamImage(deviceId, ts, url = url)
       path = os.path.join(self.FILE_PATH, filename)
 
       with open(path, "wb") as f:
-         for chunk in response:
+         for chunk in response.iter_content(self.STREAM_CHUNK_SIZE):
             f.write(chunk)
-      return FILE_PATH
+      response.close()
+      return path
+
+class AsyncHttpService(object):
+   """awaitable facade over HttpService for asyncio servers.
+   blocking calls run on a bounded executor so they never stall the event loop, and share the pooled session"""
+
+   def __init__(self, http = None, maxWorkers = HttpService.MAX_WORKERS):
+      self.http = http or HttpService(maxWorkers = maxWorkers)
+      self.executor = ThreadPoolExecutor(max_workers = maxWorkers)
+
+   def _run(self, fn, *args):
+      return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+   async def login(self, credentials = None):
+      return await self._run(lambda: self.http.login(credentials = credentials))
+
+   async def getObservations(self, deviceId, startDate = None, endDate = None):
+      return await self._run(self.http.getObservations, deviceId, startDate, endDate)
+
+   async def getObservationsBatch(self, queries):
+      """run the queries as concurrent coroutines, results are returned in query order"""
+      return await asyncio.gather(*[self._run(self.http._getObservationsSafe, query) for query in queries])
+
+   async def getImage(self, deviceId, ts = None, filename = 'testfile.png'):
+      return await self._run(lambda: self.http.getImage(deviceId, ts, filename = filename))
+
+   def close(self):
+      self.executor.shutdown(wait = False)
+      self.http.session.close()
 
 if __name__ == "__main__":
    http = HttpService()
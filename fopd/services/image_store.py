@@ -0,0 +1,167 @@
+import hashlib, os, tempfile
+
+import requests
+from PIL import Image
+
+
+class ImageStore(object):
+   """content addressed on-disk store of device images keyed by (device, ts).
+   blobs are named by their sha256 so identical frames are stored once, a downscaled
+   thumbnail is generated next to every blob and the least recently served blobs are
+   evicted once the store grows past maxBytes"""
+   MAX_BYTES = 512 * 1024 * 1024
+   THUMBNAIL_SIZE = 320
+   THUMBNAIL_SUFFIX = ".thumb.png"
+
+   def __init__(self, http, root, maxBytes = MAX_BYTES, thumbnailSize = THUMBNAIL_SIZE):
+      self.http = http
+      self.root = root
+      self.maxBytes = maxBytes
+      self.thumbnailSize = thumbnailSize
+      self._size = None
+
+   def _blobPath(self, digest):
+      return os.path.join(self.root, "blobs", digest[:2], digest)
+
+   def _indexPath(self, deviceId, ts):
+      device = hashlib.sha1(deviceId.encode("utf-8")).hexdigest()
+      return os.path.join(self.root, "index", device, str(ts))
+
+   def lookup(self, deviceId, ts):
+      """digest of the stored image for (deviceId, ts), None when it is not stored"""
+      try:
+         with open(self._indexPath(deviceId, ts)) as f:
+            digest = f.read().strip()
+      except OSError:
+         return None
+
+      path = self._blobPath(digest)
+      if not os.path.exists(path): # evicted
+         return None
+
+      # the blob mtime doubles as its last access time for eviction
+      os.utime(path)
+      return digest
+
+   def get(self, deviceId, ts, thumbnail = False):
+      """return (path, digest, status_code, reason), fetching the image upstream when it is not stored"""
+      digest = self.lookup(deviceId, ts)
+      status_code, reason = 200, "OK"
+
+      if not digest:
+         # concurrent requests for the same frame share one download
+         digest, status_code, reason = self.http.flight.do(("image", deviceId, ts), lambda: self._fetch(deviceId, ts))
+         if not digest:
+            return None, None, status_code, reason
+
+      path = self._blobPath(digest)
+      if thumbnail and os.path.exists(path + self.THUMBNAIL_SUFFIX):
+         path += self.THUMBNAIL_SUFFIX
+      return path, digest, status_code, reason
+
+   def _fetch(self, deviceId, ts):
+      digest = self.lookup(deviceId, ts)
+      if digest:
+         return digest, 200, "OK"
+
+      try:
+         response = self.http.streamImage(deviceId, ts)
+      except requests.exceptions.RequestException as e:
+         print(e)
+         return None, 502, str(e)
+
+      try:
+         if response.status_code // 100 != 2:
+            return None, response.status_code, response.reason
+         digest = self.put(deviceId, ts, response.iter_content(self.http.STREAM_CHUNK_SIZE))
+      except requests.exceptions.RequestException as e:
+         # the connection broke while the body was downloading
+         print(e)
+         return None, 502, str(e)
+      finally:
+         response.close()
+      return digest, response.status_code, response.reason
+
+   def put(self, deviceId, ts, chunks):
+      """store the image bytes from chunks under (deviceId, ts) and return their digest"""
+      tmpDir = os.path.join(self.root, "tmp")
+      os.makedirs(tmpDir, exist_ok = True)
+
+      sha = hashlib.sha256()
+      size = 0
+      fd, tmpPath = tempfile.mkstemp(dir = tmpDir)
+      try:
+         with os.fdopen(fd, "wb") as f:
+            for chunk in chunks:
+               sha.update(chunk)
+               size += len(chunk)
+               f.write(chunk)
+      except BaseException:
+         os.remove(tmpPath)
+         raise
+
+      digest = sha.hexdigest()
+      path = self._blobPath(digest)
+      if os.path.exists(path):
+         os.remove(tmpPath)
+      else:
+         os.makedirs(os.path.dirname(path), exist_ok = True)
+         os.replace(tmpPath, path)
+         size += self._makeThumbnail(path)
+         if self._size is not None:
+            self._size += size
+
+      indexPath = self._indexPath(deviceId, ts)
+      os.makedirs(os.path.dirname(indexPath), exist_ok = True)
+      with open(indexPath, "w") as f:
+         f.write(digest)
+
+      self.evict()
+      return digest
+
+   def _makeThumbnail(self, path):
+      """write a downscaled copy of the image next to it, returns its size in bytes"""
+      try:
+         with Image.open(path) as image:
+            image.thumbnail((self.thumbnailSize, self.thumbnailSize))
+            image.save(path + self.THUMBNAIL_SUFFIX, "PNG", optimize = True)
+      except (OSError, ValueError) as e:
+         print("Unable to create thumbnail:", e)
+         return 0
+      return os.path.getsize(path + self.THUMBNAIL_SUFFIX)
+
+   def _blobs(self):
+      """(mtime, size, path) of every blob including its thumbnail"""
+      blobs = []
+      for directory, _, names in os.walk(os.path.join(self.root, "blobs")):
+         for name in names:
+            if name.endswith(self.THUMBNAIL_SUFFIX):
+               continue
+            path = os.path.join(directory, name)
+            try:
+               stat = os.stat(path)
+               size = stat.st_size
+               if os.path.exists(path + self.THUMBNAIL_SUFFIX):
+                  size += os.path.getsize(path + self.THUMBNAIL_SUFFIX)
+            except OSError:
+               continue
+            blobs.append((stat.st_mtime, size, path))
+      return blobs
+
+   def evict(self):
+      """remove the least recently served blobs until the store fits maxBytes"""
+      if self._size is not None and self._size <= self.maxBytes:
+         return
+
+      # other workers share the directory, recount before deleting anything
+      blobs = sorted(self._blobs())
+      self._size = sum(size for _, size, _ in blobs)
+      for mtime, size, path in blobs:
+         if self._size <= self.maxBytes:
+            break
+         for victim in (path, path + self.THUMBNAIL_SUFFIX):
+            try:
+               os.remove(victim)
+            except OSError:
+               pass
+         self._size -= size
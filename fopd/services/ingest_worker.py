@@ -0,0 +1,69 @@
+import datetime, time
+
+from sqlalchemy import func
+
+from fopd import db
+from fopd.models import Device, IngestState, Reading
+
+
+class IngestWorker(object):
+   """polls the fopd server for new readings of every registered device"""
+   INTERVAL = 300
+   BACKFILL_DAYS = 7
+
+   def __init__(self, store, interval = INTERVAL, backfillDays = BACKFILL_DAYS):
+      self.store = store
+      self.interval = interval
+      self.backfillDays = backfillDays
+
+   def devices(self):
+      """fop1 ids of the registered devices"""
+      rows = db.session.query(Device.external_id).filter(Device.external_id != None).distinct().all()
+      return [row.external_id for row in rows]
+
+   def ingestDevice(self, deviceId):
+      """fetch the window after the device's high-water mark, returns the number of new readings"""
+      state = IngestState.query.get(deviceId) or IngestState(device_id = deviceId)
+      today = datetime.datetime.utcnow().date() # reading days are utc, see ReadingStore
+
+      if state.high_water:
+         start = state.high_water.date()
+      else:
+         start = today - datetime.timedelta(days = self.backfillDays)
+
+      count = 0
+      for windowStart, windowEnd in self.store.missingWindows(deviceId, start, today):
+         inserted, status_code, reason = self.store.fetchWindow(deviceId, windowStart, windowEnd)
+         if status_code // 100 != 2:
+            print(f"Ingest of device {deviceId} failed: {status_code} {reason}")
+            break
+         count += inserted
+
+      lower = datetime.datetime.combine(start, datetime.time.min)
+      state.high_water = db.session.query(func.max(Reading.ts)).filter(
+         Reading.device_id == deviceId,
+         Reading.ts >= lower
+      ).scalar() or state.high_water
+      state.last_run = datetime.datetime.utcnow()
+
+      db.session.add(state)
+      db.session.commit()
+      return count
+
+   def runOnce(self):
+      """run a single ingestion pass over all devices"""
+      results = {}
+      for deviceId in self.devices():
+         try:
+            results[deviceId] = self.ingestDevice(deviceId)
+         except Exception as e:
+            print(f"Ingest of device {deviceId} failed:", e)
+            db.session.rollback()
+            results[deviceId] = None
+      return results
+
+   def run(self):
+      while True:
+         started = time.time()
+         print("Ingested readings:", self.runOnce())
+         time.sleep(max(0, self.interval - (time.time() - started)))
@@ -1,35 +1,129 @@
-import json
+import json, datetime, codecs
 
-from fopd.services.http_service import HttpService
+from dateutil import parser as dateparser, tz
+
+WHITESPACE = " \t\r\n"
+NUMBER = "0123456789+-.eE"
 
 class JsonParser(object):
+   MAX_ITEM_SIZE = 1024 * 1024 # characters an array item may take before iterparse gives up on it
+
    def __init__(self):
       pass
 
+   @staticmethod
+   def parseTimestamp(ts):
+      """convert an upstream timestamp into a naive utc datetime"""
+      if isinstance(ts, (int, float)):
+         # epoch timestamps from the fop1 api are in milliseconds
+         if ts > 1e11:
+            ts = ts / 1000.0
+         return datetime.datetime.utcfromtimestamp(ts)
+
+      parsed = dateparser.parse(ts)
+      if parsed.tzinfo:
+         parsed = parsed.astimezone(tz.UTC).replace(tzinfo = None)
+      return parsed
+
+   @staticmethod
+   def parseReading(parsed):
+      """pull the reading fields out of a single upstream observation"""
+      return {
+         'device_id': parsed['device_id'],
+         'device_name': parsed.get('device_name'),
+         'ts': JsonParser.parseTimestamp(parsed['ts']),
+         'subject': parsed.get('subject'),
+         # '' rather than null, readings are unique per location and null would never match
+         'subject_location_id': '' if parsed.get('subject_location_id') is None else str(parsed['subject_location_id']),
+         'attribute': parsed['attribute'],
+         'value': None if parsed.get('value') is None else str(parsed['value']),
+         'units': parsed.get('units')
+      }
+
    @staticmethod
    def parse(resJson):
+      """parse the upstream observations json into a list of readings"""
       observations = []
-      # data = json.load(fileObj)
+      # the api answers with a message string instead of a list when there is no data
+      if not isinstance(resJson, list):
+         return observations
+
       for parsed in resJson:
-         deviceId = parsed['device_id']
-         deviceName = parsed['device_name']
-         timestamp = parsed['ts']
-         subject = parsed['subject']
-         subjectId = parsed['subject_location_id']
-         attribute = parsed['attribute']
-         value = parsed['value']
-         units = parsed['units']
-      #    observation = Observation(deviceId, timestamp, subject, attribute, value, units, deviceName, subjectId)
-      #    observations.append(observation)
-      #    #print(observation)
-      # return observations
+         try:
+            observations.append(JsonParser.parseReading(parsed))
+         except (KeyError, TypeError, ValueError, OverflowError) as e:
+            print("Skipping malformed observation:", e)
+      return observations
+
+   @staticmethod
+   def iterparse(chunks, encoding = "utf-8", maxItemSize = MAX_ITEM_SIZE):
+      """yield the items of a json array while its chunks arrive, holding at most one item in memory.
+      raises ValueError on malformed json, when an item is still incomplete after maxItemSize characters
+      or when the chunks end before the closing bracket"""
+      decoder = json.JSONDecoder()
+      textDecoder = codecs.getincrementaldecoder(encoding)()
+      buffer = ""
+      pos = 0
+      started = False
+
+      for chunk in chunks:
+         buffer = buffer[pos:] + textDecoder.decode(chunk)
+         pos = 0
+
+         if not started:
+            stripped = buffer.lstrip()
+            if not stripped:
+               buffer = ""
+               continue
+            # the api answers with a message string instead of a list when there is no data
+            if stripped[0] != "[":
+               return
+            pos = len(buffer) - len(stripped) + 1
+            started = True
+
+         while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACE:
+               pos += 1
+            if pos >= len(buffer):
+               break
+            if buffer[pos] == "]":
+               return
+            if buffer[pos] == ",":
+               raise ValueError(f"Malformed observations at {buffer[pos:pos + 40]!r}")
+
+            try:
+               item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+               break # item is cut off, wait for the next chunk
+
+            # an item is only complete once what follows it has arrived: `1.` decodes as 1 before the `5` does
+            after = end
+            while after < len(buffer) and buffer[after] in WHITESPACE:
+               after += 1
+            if after >= len(buffer):
+               break
+            if buffer[after] not in ",]":
+               if isinstance(item, (int, float)) and after == end and all(c in NUMBER for c in buffer[end:]):
+                  break
+               raise ValueError(f"Malformed observations at {buffer[pos:pos + 40]!r}")
+
+            yield item
+            pos = after + 1 if buffer[after] == "," else after
+
+         if len(buffer) - pos > maxItemSize:
+            raise ValueError(f"Observation longer than {maxItemSize} characters or malformed at {buffer[pos:pos + 40]!r}")
+
+      textDecoder.decode(b"", final = True)
+      if started:
+         raise ValueError("Observations end before the closing ]")
 
       
 if __name__ == "__main__":
+   from fopd.services.http_service import HttpService
+
    http = HttpService()
    deviceId = "8a0118e3-a6bf-4ace-85c4-a7c824da3f0c" 
    startDate = "2020-01-23"
    endDate = "2020-01-24"
-   res = http.getObservations(deviceId, startDate, endDate) 
-   JsonParser.parse(res)
-
+   res, status_code, reason = http.getObservations(deviceId, startDate, endDate) 
+   print(JsonParser.parse(res)[:5])
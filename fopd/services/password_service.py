@@ -0,0 +1,99 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import repeat
+
+import bcrypt
+
+
+# the functions below run in the worker processes, hashes match flask_bcrypt's generate_password_hash
+
+def _hash(password, rounds):
+   return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+def _verify(password, hashed, rounds):
+   try:
+      matches = bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+   except ValueError: # not a bcrypt hash
+      return False, None
+
+   # rehash in the same call while the plain password is at hand
+   if matches and cost(hashed) != rounds:
+      return True, _hash(password, rounds)
+   return matches, None
+
+def cost(hashed):
+   """log rounds a bcrypt hash was made with, e.g. 12 for $2b$12$..."""
+   try:
+      return int(hashed.split("$")[2])
+   except (IndexError, ValueError):
+      return None
+
+
+class PasswordService(object):
+   """bcrypt hashing and verification off the request thread.
+   with more than one worker, work is sent to a pool of processes so concurrent logins use more cores.
+   the pool is started on first use so forked server workers get their own, and its processes are
+   spawned rather than forked from a server process that already runs threads. with one worker,
+   the default, everything runs inline"""
+   ROUNDS = 12
+   INLINE_BATCH = 4 # smaller batches of hashMany are hashed on the calling thread
+
+   def __init__(self, maxWorkers = 1, rounds = ROUNDS):
+      self.maxWorkers = maxWorkers or os.cpu_count() or 1
+      self.rounds = rounds
+      self._executor = None
+      self._pid = None
+
+   def configure(self, maxWorkers = None, rounds = None):
+      self.shutdown()
+      if maxWorkers is not None: # 0 for one per cpu
+         self.maxWorkers = maxWorkers or os.cpu_count() or 1
+      if rounds:
+         self.rounds = rounds
+
+   def _pool(self):
+      # a pool inherited through fork belongs to the parent process
+      if self._executor is None or self._pid != os.getpid():
+         self._executor = ProcessPoolExecutor(max_workers = self.maxWorkers, mp_context = multiprocessing.get_context("spawn"))
+         self._pid = os.getpid()
+      return self._executor
+
+   def _run(self, fn, *args):
+      if self.maxWorkers == 1:
+         return fn(*args)
+      try:
+         return self._pool().submit(fn, *args).result()
+      except BrokenProcessPool:
+         # a worker died, run this call here and rebuild the pool next time
+         self._executor = None
+         return fn(*args)
+
+   def hash(self, password):
+      return self._run(_hash, password, self.rounds)
+
+   def verify(self, password, hashed):
+      """(matches, new hash), the new hash is set when the password matches a hash made with a different cost"""
+      return self._run(_verify, password, hashed, self.rounds)
+
+   def check(self, password, hashed):
+      return self.verify(password, hashed)[0]
+
+   def hashMany(self, passwords):
+      """hashes in the order of passwords"""
+      passwords = list(passwords)
+      if len(passwords) <= self.INLINE_BATCH or self.maxWorkers == 1:
+         return [_hash(password, self.rounds) for password in passwords]
+
+      chunksize = max(1, len(passwords) // (self.maxWorkers * 4))
+      try:
+         return list(self._pool().map(_hash, passwords, repeat(self.rounds), chunksize = chunksize))
+      except BrokenProcessPool:
+         self._executor = None
+         return [_hash(password, self.rounds) for password in passwords]
+
+   def shutdown(self):
+      if self._executor is not None and self._pid == os.getpid():
+         self._executor.shutdown(wait = False)
+      self._executor = None
@@ -0,0 +1,226 @@
+import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from fopd import db
+from fopd.models import Reading, ReadingDay
+from fopd.services.jsonparser import JsonParser
+
+ONE_DAY = datetime.timedelta(days = 1)
+
+
+class ReadingStore(object):
+   """local append-only store of device readings, filled from upstream one day window at a time"""
+   REFRESH_SECONDS = 300
+   DATE_FORMAT = "%Y-%m-%d"
+   STORE_ATTEMPTS = 3
+
+   def __init__(self, http, refreshSeconds = REFRESH_SECONDS):
+      self.http = http
+      self.refreshSeconds = refreshSeconds
+
+   def _parseDay(self, date):
+      return datetime.datetime.strptime(date, self.DATE_FORMAT).date()
+
+   def _bounds(self, startDay, endDay):
+      """datetime bounds [lower, upper) covering the days startDay..endDay"""
+      lower = datetime.datetime.combine(startDay, datetime.time.min)
+      upper = datetime.datetime.combine(endDay + ONE_DAY, datetime.time.min)
+      return lower, upper
+
+   def _fetchedDays(self, deviceId, startDay, endDay):
+      return ReadingDay.query.filter(
+         ReadingDay.device_id == deviceId,
+         ReadingDay.day >= startDay,
+         ReadingDay.day <= endDay
+      ).all()
+
+   def missingWindows(self, deviceId, startDay, endDay):
+      """return the contiguous (start, end) day windows that have to be fetched upstream"""
+      stale = datetime.datetime.utcnow() - datetime.timedelta(seconds = self.refreshSeconds)
+      fresh = set(row.day for row in self._fetchedDays(deviceId, startDay, endDay)
+                  if row.complete or row.fetched_at >= stale)
+
+      windows = []
+      day = startDay
+      while day <= endDay:
+         if day in fresh:
+            day += ONE_DAY
+            continue
+
+         start = day
+         while day <= endDay and day not in fresh:
+            day += ONE_DAY
+         windows.append((start, day - ONE_DAY))
+      return windows
+
+   def _windowQuery(self, deviceId, startDay, endDay):
+      """upstream (deviceId, startDate, endDate) query for the days startDay..endDay"""
+      return deviceId, startDay.strftime(self.DATE_FORMAT), (endDay + ONE_DAY).strftime(self.DATE_FORMAT)
+
+   def _storeResult(self, deviceId, startDay, endDay, res):
+      if not res:
+         return 0, 400, "Invalid request"
+
+      observations, status_code, reason = res
+      if status_code // 100 != 2:
+         return 0, status_code, reason
+
+      return self.storeWindow(deviceId, startDay, endDay, observations), status_code, reason
+
+   def _windowKey(self, deviceId, startDay, endDay):
+      return ("window", deviceId, startDay, endDay)
+
+   def fetchWindow(self, deviceId, startDay, endDay):
+      """fetch the days startDay..endDay upstream and append the new readings.
+      concurrent callers of the same window share one fetch and only the first one writes"""
+      def fetch():
+         res = self.http.getObservations(*self._windowQuery(deviceId, startDay, endDay))
+         return self._storeResult(deviceId, startDay, endDay, res)
+
+      return self.http.flight.do(self._windowKey(deviceId, startDay, endDay), fetch)
+
+   def storeWindow(self, deviceId, startDay, endDay, observations):
+      """append upstream observations for a window and mark its days as fetched.
+      safe to run concurrently for the same window: a writer that loses the race rolls back and
+      stores only what the winner did not. returns the number of readings inserted"""
+      for attempt in range(self.STORE_ATTEMPTS):
+         try:
+            return self._storeWindow(deviceId, startDay, endDay, observations, checkExisting = attempt > 0)
+         except IntegrityError as e:
+            print("Window stored concurrently, retrying:", e.orig)
+            db.session.rollback()
+      return 0
+
+   def _storeWindow(self, deviceId, startDay, endDay, observations, checkExisting = False):
+      lower, upper = self._bounds(startDay, endDay)
+      fetched = self._fetchedDays(deviceId, startDay, endDay)
+
+      # days fetched before are incomplete ones (e.g. today), skip the readings already stored for them
+      existing = set()
+      if fetched or checkExisting:
+         existing = set(db.session.query(Reading.ts, Reading.attribute, Reading.subject_location_id).filter(
+            Reading.device_id == deviceId,
+            Reading.ts >= lower,
+            Reading.ts < upper
+         ).all())
+
+      readings = []
+      for reading in JsonParser.parse(observations):
+         key = (reading['ts'], reading['attribute'], reading['subject_location_id'])
+         if not lower <= reading['ts'] < upper or key in existing:
+            continue
+
+         existing.add(key)
+         reading['device_id'] = deviceId
+         readings.append(reading)
+
+      db.session.bulk_insert_mappings(Reading, readings)
+
+      # only days that are over can never change upstream. days are utc like the readings' ts
+      now = datetime.datetime.utcnow()
+      today = now.date()
+      fetched = dict((row.day, row) for row in fetched)
+      day = startDay
+      while day <= endDay:
+         row = fetched.get(day) or ReadingDay(device_id = deviceId, day = day)
+         row.complete = day < today
+         row.fetched_at = now
+         db.session.add(row)
+         day += ONE_DAY
+
+      # a concurrent writer that marked the same days first makes the commit fail on the primary key
+      db.session.commit()
+      return len(readings)
+
+   def query(self, deviceId, startDay, endDay, attribute = None):
+      """stored readings for the days startDay..endDay in timestamp order"""
+      lower, upper = self._bounds(startDay, endDay)
+      query = Reading.query.filter(
+         Reading.device_id == deviceId,
+         Reading.ts >= lower,
+         Reading.ts < upper
+      )
+      if attribute:
+         query = query.filter(Reading.attribute == attribute)
+      return query.order_by(Reading.ts).all()
+
+   def getReadings(self, deviceId, startDate, endDate, attribute = None):
+      """serve readings from the local store, fetching only the missing windows upstream"""
+      try:
+         startDay = self._parseDay(startDate)
+         endDay = self._parseDay(endDate)
+      except (TypeError, ValueError):
+         return [], 400, "Invalid date"
+
+      if endDay < startDay:
+         return [], 400, "Invalid date range"
+
+      status_code, reason = 200, "OK"
+      for start, end in self.missingWindows(deviceId, startDay, endDay):
+         count, status_code, reason = self.fetchWindow(deviceId, start, end)
+         if status_code // 100 != 2:
+            return [], status_code, reason
+
+      return self.query(deviceId, startDay, endDay, attribute = attribute), status_code, reason
+
+   def _mergeRanges(self, ranges):
+      """(start, end) day ranges in order with the overlapping and adjacent ones joined"""
+      merged = []
+      for start, end in sorted(ranges):
+         if merged and start <= merged[-1][1] + ONE_DAY:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+         else:
+            merged.append((start, end))
+      return merged
+
+   def getReadingsBatch(self, queries, maxWorkers = None):
+      """serve several (deviceId, startDate, endDate, attribute) queries, fetching all missing windows concurrently.
+      returns one (readings, status_code, reason) tuple per query in query order"""
+      results = [None] * len(queries)
+      ranges = [None] * len(queries)
+      spans = {} # deviceId -> day ranges queried
+
+      for index, (deviceId, startDate, endDate, attribute) in enumerate(queries):
+         try:
+            startDay = self._parseDay(startDate)
+            endDay = self._parseDay(endDate)
+         except (TypeError, ValueError):
+            results[index] = ([], 400, "Invalid date")
+            continue
+
+         if endDay < startDay:
+            results[index] = ([], 400, "Invalid date range")
+            continue
+
+         ranges[index] = (startDay, endDay)
+         spans.setdefault(deviceId, []).append((startDay, endDay))
+
+      # several queries may share a device, overlapping ranges are fetched as one so each day is fetched once
+      windows = []
+      for deviceId, deviceRanges in spans.items():
+         for startDay, endDay in self._mergeRanges(deviceRanges):
+            windows.extend((deviceId, start, end) for start, end in self.missingWindows(deviceId, startDay, endDay))
+
+      fetched = self.http.getObservationsBatch([self._windowQuery(*window) for window in windows], maxWorkers = maxWorkers)
+
+      failures = {}
+      for (deviceId, start, end), res in zip(windows, fetched):
+         # a request already fetching the window stores it, wait for that instead of writing the same rows
+         count, status_code, reason = self.http.flight.do(self._windowKey(deviceId, start, end),
+                                                          lambda: self._storeResult(deviceId, start, end, res))
+         if status_code // 100 != 2:
+            failures.setdefault(deviceId, []).append((start, end, status_code, reason))
+
+      for index, (deviceId, startDate, endDate, attribute) in enumerate(queries):
+         if results[index]:
+            continue
+
+         startDay, endDay = ranges[index]
+         failed = [failure for failure in failures.get(deviceId, []) if failure[0] <= endDay and failure[1] >= startDay]
+         if failed:
+            start, end, status_code, reason = failed[0]
+            results[index] = ([], status_code, reason)
+         else:
+            results[index] = (self.query(deviceId, startDay, endDay, attribute = attribute), 200, "OK")
+      return results
@@ -0,0 +1,77 @@
+import hashlib, os, threading
+
+try:
+   import fcntl
+except ImportError: # not available on windows, locking stays per process
+   fcntl = None
+
+
+class _Call(object):
+   def __init__(self):
+      self.done = threading.Event()
+      self.result = None
+      self.error = None
+
+
+class SingleFlight(object):
+   """runs one call per key at a time, concurrent callers of the same key wait for and share its result.
+   with a lockDir the leader also holds a file lock so workers on the same host take turns"""
+
+   def __init__(self, lockDir = None):
+      self.lockDir = lockDir
+      self._lock = threading.Lock()
+      self._calls = {}
+      self.calls = 0
+      self.shared = 0
+
+      if lockDir and not os.path.isdir(lockDir):
+         os.makedirs(lockDir)
+
+   def do(self, key, fn):
+      """return fn(), or the result of the call already in flight for key"""
+      with self._lock:
+         call = self._calls.get(key)
+         leader = call is None
+         if leader:
+            call = _Call()
+            self._calls[key] = call
+            self.calls += 1
+         else:
+            self.shared += 1
+
+      if not leader:
+         call.done.wait()
+         if call.error is not None:
+            raise call.error
+         return call.result
+
+      try:
+         call.result = self._run(key, fn)
+         return call.result
+      except Exception as e:
+         call.error = e
+         raise
+      finally:
+         with self._lock:
+            del self._calls[key]
+         call.done.set()
+
+   def _run(self, key, fn):
+      if not self.lockDir or fcntl is None:
+         return fn()
+
+      name = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+      with open(os.path.join(self.lockDir, name + ".lock"), "a") as lockFile:
+         fcntl.flock(lockFile, fcntl.LOCK_EX)
+         try:
+            return fn()
+         finally:
+            fcntl.flock(lockFile, fcntl.LOCK_UN)
+
+   def stats(self):
+      return {
+         'calls': self.calls,
+         'shared': self.shared,
+         'in_flight': len(self._calls),
+         'cross_process': bool(self.lockDir and fcntl is not None)
+      }
@@ -1,9 +1,15 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, current_app
 
-from fopd import db, bcrypt
+from fopd import db, passwords
 from fopd.models import Student, Teacher
+from fopd import queries, auth
+from fopd.loader import load
+from fopd import versions, validators, caching
+from fopd.pagination import paginate
+from fopd import serializers
+from fopd.serializers import jsonify
 
-import uuid, datetime
+import uuid, datetime, csv, io
 
 students = Blueprint('students', __name__)
 
@@ -15,7 +21,7 @@ SUCCESS_CODE = 200
 @students.route('/api/student/<student_id>', methods = ['DELETE'])
 def delete_student_account(student_id):
     """delete student account by id"""
-    student = Student.query.filter_by(public_id = student_id).first()
+    student = load(Student, student_id)
 
     if student:
         db.session.delete(student)
@@ -31,9 +37,11 @@ def delete_student_account(student_id):
         }), ERROR_CODE
 
 @students.route('/api/student/teacher/<teacher_id>', methods = ['GET'])
+@versions.conditional(validators.get_all_students_by_teacher)
+@caching.cached(Teacher, Student)
 def get_all_students_by_teacher(teacher_id):
     """get all students with teacher_id"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
 
     if not teacher:
         return jsonify({
@@ -41,34 +49,26 @@ def get_all_students_by_teacher(teacher_id):
             'message': f'Account id `{teacher_id} `does not exist'
         }), ERROR_CODE
     
+    query, fields = serializers.student.select(queries.teacher_students(teacher))
+    students, page = paginate(query, Student.id)
+
     # format output
-    output = []
-    for student in teacher.students:
-        student_output = {
-            'fname': student.fname,
-            'lname': student.lname,
-            'username': student.username,
-            'id': student.public_id
-        }
-        output.append(student_output)
+    output = serializers.student.dump_many(students, fields)
     
     return jsonify({
         'status': 'success',
         'length': len(output),
         'students': output,
-        'teacher': {
-            'fname': teacher.fname,
-            'lname': teacher.lname,
-            'username': teacher.username,
-            'public_id': teacher.public_id
-        }
+        'teacher': serializers.teacher_public_id.dump(teacher),
+        **page
     }), SUCCESS_CODE
 
 
 @students.route('/api/student/<student_id>', methods = ['GET'])
+@versions.conditional(validators.get_student_by_id)
 def get_student_by_id(student_id):
     """get student by id"""
-    student = Student.query.filter_by(public_id = student_id).first()
+    student = load(Student, student_id)
     
     if not student:
         return jsonify({
@@ -79,18 +79,7 @@ def get_student_by_id(student_id):
 
     return jsonify({
         'status': 'message',
-        'student': {
-            'fname': student.fname,
-            'lname': student.lname,
-            'username': student.username,
-            'id': student.public_id,
-            'teacher': {
-                'fname': student.teacher.fname,
-                'lname': student.teacher.lname,
-                'username': student.teacher.username,
-                'id': student.teacher.public_id  
-            }
-        }
+        'student': serializers.student_detail.dump(student)
     }), SUCCESS_CODE
 
 
@@ -135,8 +124,7 @@ def register_student_account():
             'message': 'Username already exists under another student'
         }), ERROR_CODE
 
-    encoded_password = password.encode('utf-8')
-    hashed_password = bcrypt.generate_password_hash(encoded_password).decode('utf-8') # password
+    hashed_password = passwords.hash(password)
 
     student = Student(
         username = username,
@@ -147,12 +135,7 @@ def register_student_account():
     )
     student.teacher = teacher
 
-    output = {
-        "username": student.username,
-        "id": student.public_id,
-        "fname": student.fname,
-        "lname": student.lname
-    }
+    output = serializers.student.dump(student)
     try:
         db.session.add(student)
         db.session.commit()
@@ -169,6 +152,156 @@ def register_student_account():
             'student': {}
         }), ERROR_CODE
 
+def read_roster():
+    """(teacher_username, rows) from a json body, a text/csv body or a csv file uploaded as `roster`"""
+    if request.is_json:
+        info = request.json or {}
+        if isinstance(info, list):
+            return request.args.get('teacher_username', None), info
+        return info.get('teacher_username', request.args.get('teacher_username', None)), info.get('students', [])
+
+    roster = request.files.get('roster', None)
+    if roster:
+        try:
+            text = roster.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ValueError('Roster file must be utf-8 encoded csv')
+    elif request.mimetype == 'text/csv':
+        text = request.get_data(as_text = True)
+    else:
+        return None, None
+
+    # header row names the columns: username,password,fname,lname
+    teacher_username = request.form.get('teacher_username', request.args.get('teacher_username', None))
+    try:
+        return teacher_username, list(csv.DictReader(io.StringIO(text)))
+    except csv.Error as e:
+        raise ValueError(f'Roster is not valid csv: {e}')
+
+def check_roster_row(row):
+    """why a roster row cannot be registered, None when it can"""
+    username, password = row.get('username'), row.get('password')
+    if not username or not password:
+        return 'No username or password provided'
+    if not isinstance(username, str) or not isinstance(password, str):
+        return 'Username and password must be text'
+    if not username.strip():
+        return 'No username or password provided'
+    if len(username.strip()) > Student.username.type.length:
+        return 'Username is too long'
+
+    for column in ('fname', 'lname'):
+        value = row.get(column)
+        if value is None or value == '':
+            continue
+        if not isinstance(value, str):
+            return f'{column} must be text'
+        if len(value) > getattr(Student, column).type.length:
+            return f'{column} is too long, at most {getattr(Student, column).type.length} characters'
+    return None
+
+@students.route('/api/auth/register/students/bulk', methods = ['POST'])
+def register_student_accounts():
+    """register a roster of students under one teacher, returns a report per row"""
+    try:
+        teacher_username, rows = read_roster()
+    except ValueError as e:
+        return jsonify({
+            'status': 'fail',
+            'message': str(e)
+        }), ERROR_CODE
+
+    if rows is None:
+        return jsonify({
+            'status': 'fail',
+            'message': 'No roster provided, send json or csv'
+        }), ERROR_CODE
+
+    if not isinstance(rows, list):
+        return jsonify({
+            'status': 'fail',
+            'message': 'Roster must be a list of students'
+        }), ERROR_CODE
+
+    max_rows = current_app.config['BULK_REGISTER_MAX_ROWS']
+    if len(rows) > max_rows:
+        return jsonify({
+            'status': 'fail',
+            'message': f'Roster has {len(rows)} students, at most {max_rows} can be registered at once'
+        }), ERROR_CODE
+
+    teacher = Teacher.query.filter_by(username = teacher_username).first()
+    if not teacher:
+        return jsonify({
+            'status': 'fail',
+            'message': 'Unable to create accounts'
+        }), ERROR_CODE
+
+    report = []
+    for number, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            row = {}
+        username = str(row.get('username') or '').strip()
+        report.append({'row': number, 'username': username, 'status': 'fail'})
+        message = check_roster_row(row)
+        if message:
+            report[-1]['message'] = message
+
+    # one query for every username already taken
+    usernames = [entry['username'] for entry in report if 'message' not in entry]
+    existing, _ = queries.students_by_username(usernames)
+    taken = {student.username for student in existing}
+
+    accepted, seen = [], set()
+    for entry, row in zip(report, rows):
+        if 'message' in entry:
+            continue
+        if entry['username'] in taken:
+            entry['message'] = 'Username already exists under another student'
+        elif entry['username'] in seen:
+            entry['message'] = 'Username appears more than once in the roster'
+        else:
+            seen.add(entry['username'])
+            accepted.append((entry, row))
+
+    hashed_passwords = passwords.hashMany(row['password'] for _, row in accepted)
+
+    mappings = []
+    for (entry, row), hashed_password in zip(accepted, hashed_passwords):
+        entry['id'] = str(uuid.uuid4())
+        mappings.append({
+            'username': entry['username'],
+            'password': hashed_password,
+            'fname': row.get('fname') or 'No name',
+            'lname': row.get('lname') or 'No name',
+            'public_id': entry['id'],
+            'teacher_id': teacher.id
+        })
+
+    try:
+        db.session.bulk_insert_mappings(Student, mappings)
+        versions.touch(Student) # bulk inserts skip the flush that records the written tables
+        db.session.commit()
+    except Exception as e:
+        print(e)
+        db.session.rollback()
+        return jsonify({
+            'status': 'fail',
+            'message': 'Unable to create accounts, no student was registered'
+        }), ERROR_CODE
+
+    for entry, _ in accepted:
+        entry['status'] = 'success'
+
+    return jsonify({
+        'status': 'success',
+        'message': f'Registered {len(accepted)} of {len(rows)} students',
+        'num_created': len(accepted),
+        'num_failed': len(rows) - len(accepted),
+        'teacher': serializers.teacher.dump(teacher),
+        'students': report
+    }), SUCCESS_CODE
+
 
 @students.route('/api/account/student/<student_id>', methods = ['PUT', 'POST'])
 def update_student_account(student_id):
@@ -188,7 +321,7 @@ def update_student_account(student_id):
     teacher_username = update_info.get('teacher_username', None)
 
     # check if account exists
-    student = Student.query.filter_by(public_id = student_id).first()
+    student = load(Student, student_id)
     if not student:
         return jsonify({
             'status': 'fail',
@@ -211,8 +344,7 @@ def update_student_account(student_id):
         student.username = username
 
     if password:
-        encoded_password = password.encode('utf-8')
-        student.password = bcrypt.generate_password_hash(encoded_password).decode('utf-8')
+        student.password = passwords.hash(password)
     
     if fname:
         student.fname = fname
@@ -220,12 +352,7 @@ def update_student_account(student_id):
     if lname:
         student.lname = lname
 
-    output = {
-        "username": student.username,
-        "id": student.public_id,
-        "fname": student.fname,
-        "lname": student.lname
-    }
+    output = serializers.student.dump(student)
     try:
         db.session.add(student)
         db.session.commit()
@@ -270,25 +397,24 @@ def student_login():
             'message': f'Invalid username `{username}`'
         }), ERROR_CODE
 
-    encoded_password = password.encode('utf-8')
-    if bcrypt.check_password_hash(student.password, encoded_password): # password
-        token = 'token'
+    matches, new_hash = passwords.verify(password, student.password)
+    if matches:
+        if new_hash:
+            # the stored hash has an old cost, a failed update is retried on the next login
+            try:
+                student.password = new_hash
+                db.session.commit()
+            except Exception as e:
+                print(e)
+                db.session.rollback()
+
         return jsonify({
             'status': 'success',
             'message': 'Logged in',
-            'token': str(uuid.uuid1()),
-            'student': {
-                'fname': student.fname,
-                'lname': student.lname,
-                'username': student.username,
-                'id': student.public_id
-            },
-            'teacher': {
-                'fname': student.teacher.fname,
-                'lname': student.teacher.lname,
-                'username': student.teacher.username,
-                'id': student.teacher.public_id
-            }
+            'token': auth.issue_token(student),
+            'expires_in': current_app.config['ACCESS_TOKEN_SECONDS'],
+            'student': serializers.student.dump(student),
+            'teacher': serializers.teacher.dump(student.teacher)
         }), SUCCESS_CODE
 
     return jsonify({
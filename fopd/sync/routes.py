@@ -0,0 +1,86 @@
+from flask import Blueprint, request, current_app
+
+from fopd.models import Student
+from fopd import queries
+from fopd.loader import load
+from fopd import serializers
+from fopd.serializers import jsonify
+
+import datetime
+
+sync = Blueprint('sync', __name__)
+
+ERROR_CODE = 400
+SUCCESS_CODE = 200
+
+# key of the rows of each table in the sync output
+SECTIONS = {
+    'experiment': 'experiments',
+    'assignment': 'assignments',
+    'observation': 'observations',
+    'observation_response': 'observation_responses',
+    'assignment_responses': 'assignment_responses'
+}
+
+### Sync
+def read_token(token):
+    """time a sync token stands for, None without a token. raises ValueError on a malformed one"""
+    if not token:
+        return None
+    since = datetime.datetime.fromisoformat(token)
+    # tokens are naive utc, an offset would not compare with the stored times
+    if since.tzinfo is not None:
+        raise ValueError(f'Sync token `{token}` has a time zone')
+    return since
+
+@sync.route('/api/sync/student/<student_id>', methods = ['GET'])
+def sync_student(student_id):
+    """what a student's client has to fetch since its last sync (?since=<sync_token>): the experiments,
+    assignments and observations it can see and its own responses that changed, and under `deleted` the ids
+    to drop. dropping an experiment drops its observations too. without a token, or with one older than the
+    kept tombstones, everything is sent with `full` set and the client replaces its copy"""
+    student = load(Student, student_id)
+    if not student:
+        return jsonify({
+            'status': 'fail',
+            'message': f'Account id `{student_id}` does not exist'
+        }), ERROR_CODE
+
+    try:
+        since = read_token(request.args.get('since', None))
+    except ValueError:
+        return jsonify({
+            'status': 'fail',
+            'message': 'Invalid sync token, sync again without one'
+        }), ERROR_CODE
+
+    # taken before reading so nothing committed meanwhile falls between two syncs
+    started = datetime.datetime.utcnow()
+    full = since is None or since < started - datetime.timedelta(days = current_app.config['SYNC_TOMBSTONE_DAYS'])
+    # rows flushed before a sync but committed after it carry an older updated_at, look back a little
+    window = None if full else since - datetime.timedelta(seconds = current_app.config['SYNC_OVERLAP_SECONDS'])
+
+    output = {
+        'experiments': serializers.student_experiment.dump_many(queries.student_experiments_since(student, window)),
+        'assignments': serializers.assignment_summary.dump_many(queries.student_assignments_since(student, window)),
+        'observations': serializers.observation.dump_many(queries.student_observations_since(student, window)),
+        'observation_responses': serializers.observation_response_sync.dump_many(queries.student_observation_responses_since(student, window)),
+        'assignment_responses': serializers.assignment_response.dump_many(queries.student_assignment_responses_since(student, window))
+    }
+
+    deleted = {section: {} for section in SECTIONS.values()}
+    if not full:
+        # a row deleted for the student and given back since is listed with the changed rows only
+        current = {(section, row['id']) for section, rows in output.items() for row in rows}
+        for table_name, public_id in queries.student_tombstones_since(student, window):
+            section = SECTIONS.get(table_name)
+            if section and (section, public_id) not in current:
+                deleted[section][public_id] = True
+
+    return jsonify({
+        'status': 'success',
+        'full': full,
+        'sync_token': started.isoformat(),
+        **output,
+        'deleted': {section: list(ids) for section, ids in deleted.items()}
+    }), SUCCESS_CODE
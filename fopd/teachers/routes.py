@@ -1,7 +1,13 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, current_app
 
-from fopd import db, bcrypt
+from fopd import db, passwords
 from fopd.models import Teacher, Student
+from fopd import queries, auth
+from fopd.loader import load
+from fopd import versions, validators
+from fopd.pagination import paginate
+from fopd import serializers
+from fopd.serializers import jsonify
 
 import uuid
 
@@ -13,30 +19,26 @@ SUCCESS_CODE = 200
 ### Teacher
 
 @teachers.route('/api/teacher', methods = ['GET'])
+@versions.conditional(validators.get_all_teachers)
 def get_all_teachers():
-    teachers = Teacher.query.all()
+    query, fields = serializers.teacher_public_id.select(queries.teachers())
+    teachers, page = paginate(query, Teacher.id)
 
     # format output
-    output = []
-    for teacher in teachers:
-        teacher_output = {
-            'fname': teacher.fname,
-            'lname': teacher.lname,
-            'username': teacher.username,
-            'public_id': teacher.public_id
-        }
-        output.append(teacher_output)
+    output = serializers.teacher_public_id.dump_many(teachers, fields)
     
     return jsonify({
         'status': 'success',
         'length': len(output),
-        'teachers_list': output
+        'teachers_list': output,
+        **page
     }), SUCCESS_CODE
 
 @teachers.route('/api/teacher/<teacher_id>', methods = ['GET'])
+@versions.conditional(validators.get_teacher_by_id)
 def get_teacher_by_id(teacher_id):
     """get teacher by id"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
 
     if not teacher:
         return jsonify({
@@ -44,12 +46,7 @@ def get_teacher_by_id(teacher_id):
             'message': f'Account with id {teacher_id} does not exist'
         }), ERROR_CODE
 
-    output = {
-        "username": teacher.username,
-        "id": teacher.public_id,
-        "fname": teacher.fname,
-        "lname": teacher.lname
-    }
+    output = serializers.teacher.dump(teacher)
     return jsonify({
         'status': 'success',
         'teacher': output
@@ -73,7 +70,7 @@ def update_teacher_account(teacher_id):
     lname = update_info.get('lname', None)
 
     # check if account exists
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
     if not teacher:
         return jsonify({
             'status': 'fail',
@@ -85,8 +82,7 @@ def update_teacher_account(teacher_id):
         teacher.username = username
 
     if password:
-        encoded_password = password.encode('utf-8')
-        teacher.password = bcrypt.generate_password_hash(encoded_password).decode('utf-8')
+        teacher.password = passwords.hash(password)
     
     if fname:
         teacher.fname = fname
@@ -94,12 +90,7 @@ def update_teacher_account(teacher_id):
     if lname:
         teacher.lname = lname
 
-    output = {
-        "username": teacher.username,
-        "id": teacher.public_id,
-        "fname": teacher.fname,
-        "lname": teacher.lname
-    }
+    output = serializers.teacher.dump(teacher)
     try:
         db.session.add(teacher)
         db.session.commit()
@@ -141,8 +132,7 @@ def register_teacher_account():
     lname = account_info.get('lname', 'No name')
     public_id = str(uuid.uuid4())
 
-    encoded_password = password.encode('utf-8')
-    hashed_password = bcrypt.generate_password_hash(encoded_password).decode('utf-8') # password
+    hashed_password = passwords.hash(password)
 
     # check if teacher account already exists
     existing_teacher = Teacher.query.filter_by(username = username).first()
@@ -160,12 +150,7 @@ def register_teacher_account():
         public_id = public_id
     )
 
-    output = {
-        "username": teacher.username,
-        "id": teacher.public_id,
-        "fname": teacher.fname,
-        "lname": teacher.lname
-    }
+    output = serializers.teacher.dump(teacher)
     try:
         db.session.add(teacher)
         db.session.commit()
@@ -184,7 +169,7 @@ def register_teacher_account():
 @teachers.route('/api/teacher/<teacher_id>', methods = ['DELETE'])
 def delete_teacher_account(teacher_id):
     """delete teacher account"""
-    teacher = Teacher.query.filter_by(public_id = teacher_id).first()
+    teacher = load(Teacher, teacher_id)
 
     if teacher:
         db.session.delete(teacher)
@@ -229,19 +214,23 @@ def teacher_login():
             'message': f'Invalid username `{username}`'
         }), ERROR_CODE
 
-    encoded_password = password.encode('utf-8')
-    if bcrypt.check_password_hash(teacher.password, encoded_password): # password
-        token = 'token'
+    matches, new_hash = passwords.verify(password, teacher.password)
+    if matches:
+        if new_hash:
+            # the stored hash has an old cost, a failed update is retried on the next login
+            try:
+                teacher.password = new_hash
+                db.session.commit()
+            except Exception as e:
+                print(e)
+                db.session.rollback()
+
         return jsonify({
             'status': 'success',
             'message': 'Logged in',
-            'token': str(uuid.uuid1()),
-            'teacher': {
-                'fname': teacher.fname,
-                'lname': teacher.lname,
-                'username': teacher.username,
-                'id': teacher.public_id
-            }
+            'token': auth.issue_token(teacher),
+            'expires_in': current_app.config['ACCESS_TOKEN_SECONDS'],
+            'teacher': serializers.teacher.dump(teacher)
         }), SUCCESS_CODE
 
     return jsonify({
@@ -0,0 +1,187 @@
+from sqlalchemy import func
+
+from fopd.models import Teacher, Student, Device, Course, Experiment, Assignment, AssignmentResponse, Observation, ObservationResponse, student_experiments, student_assignments, collaborators
+from fopd.loader import load
+from fopd import auth
+
+### Validators
+# the state of the rows a read endpoint renders, for versions.conditional. one per view, named after it and
+# taking its arguments. rows the view loads anyway go through the loader, so the handler reuses them; the
+# rest is summed up by fingerprint(): inserts and deletes change the count, updates the newest updated_at
+
+def fingerprint(query, *models):
+    """(number of rows, newest updated_at of each model) over a query joining models"""
+    return tuple(query.order_by(None).with_entities(func.count(), *[func.max(model.updated_at) for model in models]).one())
+
+def stamps(*rows):
+    return tuple(row.updated_at if row is not None else None for row in rows)
+
+### Teachers
+
+def get_all_teachers():
+    return fingerprint(Teacher.query, Teacher)
+
+def get_teacher_by_id(teacher_id):
+    teacher = load(Teacher, teacher_id)
+    return stamps(teacher) if teacher else None
+
+### Students
+
+def get_all_students_by_teacher(teacher_id):
+    teacher = load(Teacher, teacher_id)
+    if not teacher:
+        return None
+    return stamps(teacher) + fingerprint(Student.query.filter_by(teacher_id = teacher.id), Student)
+
+def get_student_by_id(student_id):
+    student = load(Student, student_id)
+    return stamps(student, student.teacher) if student else None
+
+### Devices
+
+def get_all_teacher_devices(teacher_id):
+    teacher = auth.account(Teacher, teacher_id)
+    if not teacher:
+        return None
+    return fingerprint(Device.query.filter_by(teacher_id = teacher.id), Device)
+
+def get_specific_teacher_device(teacher_id, device_id):
+    teacher = load(Teacher, teacher_id)
+    device = load(Device, device_id)
+    if not teacher or not device:
+        return None
+    return stamps(teacher, device)
+
+### Courses
+
+def _course_students(course):
+    return fingerprint(Student.query.filter_by(course_id = course.id), Student)
+
+def get_teacher_courses(teacher_id):
+    teacher = auth.account(Teacher, teacher_id)
+    if not teacher:
+        return None
+    return fingerprint(Course.query
+        .filter_by(teacher_id = teacher.id)
+        .join(Course.teacher)
+        .outerjoin(Course.students), Course, Teacher, Student)
+
+def get_teacher_course_by_id(course_id, teacher_id):
+    teacher = load(Teacher, teacher_id)
+    course = load(Course, course_id)
+    if not teacher or not course:
+        return None
+    return stamps(teacher, course) + _course_students(course)
+
+def get_course_by_id(course_id):
+    course = load(Course, course_id)
+    if not course:
+        return None
+    return stamps(course, course.teacher) + _course_students(course)
+
+### Experiments
+
+def get_teacher_experiments(teacher_id):
+    teacher = auth.account(Teacher, teacher_id)
+    if not teacher:
+        return None
+    return fingerprint(Experiment.query
+        .filter_by(teacher_id = teacher.id)
+        .outerjoin(Experiment.students)
+        .join(Experiment.device), Experiment, Student, Device)
+
+def get_experiment_by_id(teacher_id, experiment_id):
+    teacher = load(Teacher, teacher_id)
+    experiment = load(Experiment, experiment_id)
+    if not teacher or not experiment:
+        return None
+    return stamps(teacher, experiment, experiment.device) + fingerprint(Student.query
+        .join(student_experiments, student_experiments.c.student_id == Student.id)
+        .filter(student_experiments.c.experiment_id == experiment.id), Student)
+
+def get_all_student_experiments(student_id):
+    student = load(Student, student_id)
+    if not student:
+        return None
+    return fingerprint(Experiment.query
+        .join(student_experiments, student_experiments.c.experiment_id == Experiment.id)
+        .filter(student_experiments.c.student_id == student.id)
+        .join(Experiment.teacher)
+        .join(Experiment.device), Experiment, Teacher, Device)
+
+### Assignments
+
+def get_all_student_assignments(student_id):
+    student = load(Student, student_id)
+    if not student:
+        return None
+    return stamps(student) + fingerprint(Assignment.query
+        .join(student_assignments, student_assignments.c.assignment_id == Assignment.id)
+        .filter(student_assignments.c.student_id == student.id), Assignment)
+
+def get_all_teacher_assignments(teacher_id):
+    teacher = load(Teacher, teacher_id)
+    if not teacher:
+        return None
+    return stamps(teacher) + fingerprint(Assignment.query
+        .filter_by(teacher_id = teacher.id)
+        .outerjoin(Assignment.students), Assignment, Student)
+
+def get_assignment_by_id(assignment_id):
+    assignment = load(Assignment, assignment_id)
+    if not assignment:
+        return None
+    return stamps(assignment, assignment.teacher) + fingerprint(Student.query
+        .join(student_assignments, student_assignments.c.student_id == Student.id)
+        .filter(student_assignments.c.assignment_id == assignment.id), Student)
+
+### Assignment responses
+
+def get_all_responses_by_assignment(assignment_id):
+    assignment = load(Assignment, assignment_id)
+    if not assignment:
+        return None
+    return stamps(assignment, assignment.teacher) + fingerprint(AssignmentResponse.query
+        .filter_by(assignment_id = assignment.id)
+        .join(AssignmentResponse.student), AssignmentResponse, Student)
+
+def get_student_assignment_responses_by_assignment_id(student_id, assignment_id):
+    student = load(Student, student_id)
+    assignment = load(Assignment, assignment_id)
+    if not student or not assignment:
+        return None
+    return stamps(student, assignment) + fingerprint(AssignmentResponse.query
+        .filter_by(assignment_id = assignment.id, student_id = student.id), AssignmentResponse)
+
+### Observations
+
+def get_all_observations_by_experiment(experiment_id):
+    experiment = load(Experiment, experiment_id)
+    if not experiment:
+        return None
+    return stamps(experiment) + fingerprint(Observation.query
+        .filter_by(experiment_id = experiment.id)
+        .outerjoin(Observation.student_collaborators), Observation, Student)
+
+def get_observation_by_id(observation_id):
+    observation = load(Observation, observation_id)
+    if not observation:
+        return None
+    return stamps(observation, observation.experiment) + fingerprint(Student.query
+        .join(collaborators, collaborators.c.student_id == Student.id)
+        .filter(collaborators.c.observation_id == observation.id), Student)
+
+def get_observation_response_by_id(observation_id, response_id):
+    observation = load(Observation, observation_id)
+    response = load(ObservationResponse, response_id)
+    if not observation or not response:
+        return None
+    return stamps(response, response.student)
+
+def get_all_observation_responses_for_observation(observation_id):
+    observation = load(Observation, observation_id)
+    if not observation:
+        return None
+    return stamps(observation) + fingerprint(ObservationResponse.query
+        .filter_by(observation_id = observation.id)
+        .outerjoin(ObservationResponse.student), ObservationResponse, Student)
@@ -0,0 +1,72 @@
+import datetime, hashlib
+from functools import wraps
+
+from flask import current_app, request, make_response, g
+from sqlalchemy import event
+
+from fopd import db
+
+### Written tables
+# the tables a transaction wrote, for the listeners that run on its commit (see fopd/caching.py)
+
+def written_tables(session):
+    """names of the tables the session's open transaction wrote so far"""
+    return session.info.setdefault('written_tables', set())
+
+def _after_flush(session, flush_context):
+    written = set(session.new) | set(session.deleted) | {obj for obj in session.dirty if session.is_modified(obj)}
+    written_tables(session).update(obj.__table__.name for obj in written)
+
+def touch(*models):
+    """record models written around the unit of work, e.g. with bulk_insert_mappings"""
+    written_tables(db.session).update(model.__table__.name for model in models)
+
+def _after_transaction_end(session, transaction):
+    # runs after the after_commit listeners, so they still see what was written
+    if transaction.parent is None:
+        session.info.pop('written_tables', None)
+
+def init_app(app):
+    if not event.contains(db.session, 'after_flush', _after_flush):
+        event.listen(db.session, 'after_flush', _after_flush)
+        event.listen(db.session, 'after_transaction_end', _after_transaction_end)
+
+### Conditional GET
+# a validator takes the view's arguments and returns the state of the rows the view renders (see
+# fopd/validators.py), None when the view is going to fail. nothing is locked or written to keep it
+
+def _validators(state):
+    """(etag, last modified) of the request's url over the state of the rows it renders"""
+    etag = hashlib.sha1(f'{request.full_path}|{state!r}'.encode('utf-8')).hexdigest()
+    stamps = [value for value in state if isinstance(value, datetime.datetime)]
+    return etag, max(stamps, default = None)
+
+def conditional(validator):
+    """answer If-None-Match with 304 while the rows `validator` describes are unchanged, without running the handler.
+    successful responses get a weak ETag, Last-Modified and `Cache-Control: private, no-cache` so clients revalidate.
+    the etag is left in g.etag for the response cache"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            g.etag = None
+            state = validator(**kwargs)
+            if state is None:
+                return f(*args, **kwargs)
+
+            etag, last_modified = _validators(state)
+            g.etag = etag
+
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status = 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag, weak = True)
+            response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
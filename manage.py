@@ -1,7 +1,10 @@
+import datetime
+
 from flask_migrate import Migrate, MigrateCommand
 from flask_script import Manager
 
 from fopd import create_app, db
+from fopd.services.ingest_worker import IngestWorker
 
 app = create_app()
 app.app_context().push()
@@ -14,6 +17,29 @@ manager.add_command('db', MigrateCommand)
 def run():
     app.run(debug = app.config['DEBUG'])
 
+@manager.option('--once', dest = 'once', action = 'store_true', default = False, help = 'run a single ingestion pass and exit')
+def ingest(once = False):
+    """poll the fopd server for new readings of every registered device"""
+    from fopd.external.routes import store
+
+    worker = IngestWorker(
+        store,
+        interval = app.config['INGEST_INTERVAL_SECONDS'],
+        backfillDays = app.config['INGEST_BACKFILL_DAYS']
+    )
+    if once:
+        print('Ingested readings:', worker.runOnce())
+    else:
+        worker.run()
+
+@manager.option('--days', dest = 'days', type = int, default = None, help = 'keep this many days, SYNC_TOMBSTONE_DAYS by default')
+def prune_tombstones(days = None):
+    """delete old tombstones of the offline sync, clients that last synced before them get a full sync"""
+    from fopd import changes
+
+    days = days if days is not None else app.config['SYNC_TOMBSTONE_DAYS']
+    print('Deleted tombstones:', changes.prune(datetime.datetime.utcnow() - datetime.timedelta(days = days)))
+
 if __name__ == "__main__":
     manager.run()
     
\ No newline at end of file
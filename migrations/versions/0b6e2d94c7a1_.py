@@ -0,0 +1,44 @@
+"""empty message
+
+Revision ID: 0b6e2d94c7a1
+Revises: f3c8a1d7e295
+Create Date: 2026-10-19 11:26:53.108354
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b6e2d94c7a1'
+down_revision = 'f3c8a1d7e295'
+branch_labels = None
+depends_on = None
+
+STAMPED_TABLES = ['teacher', 'student', 'device', 'course']
+
+VERSIONED_TABLES = ['teacher', 'student', 'device', 'course', 'experiment', 'assignment',
+                    'assignment_responses', 'observation', 'observation_response']
+
+
+def upgrade():
+    # conditional GETs fingerprint the rows they render instead of per-table counters, see fopd/validators.py
+    for table in STAMPED_TABLES:
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default='1970-01-01 00:00:00', nullable=False))
+        op.alter_column(table, 'updated_at', server_default=None)
+
+    op.drop_table('table_version')
+
+
+def downgrade():
+    op.create_table('table_version',
+    sa.Column('table_name', sa.String(length=64), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    values = ', '.join(f"('{table}', 0, CURRENT_TIMESTAMP)" for table in VERSIONED_TABLES)
+    op.execute(f'INSERT INTO table_version (table_name, version, updated_at) VALUES {values}')
+
+    for table in reversed(STAMPED_TABLES):
+        op.drop_column(table, 'updated_at')
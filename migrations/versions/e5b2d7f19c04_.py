@@ -0,0 +1,79 @@
+"""empty message
+
+Revision ID: e5b2d7f19c04
+Revises: c81e5b0f7a2d
+Create Date: 2026-10-18 14:03:27.918346
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b2d7f19c04'
+down_revision = 'c81e5b0f7a2d'
+branch_labels = None
+depends_on = None
+
+ASSOCIATIONS = [
+    ('student_assignments', 'assignment_id', 'student_id'),
+    ('student_experiments', 'experiment_id', 'student_id'),
+    ('collaborators', 'observation_id', 'student_id'),
+]
+
+FOREIGN_KEYS = [
+    ('student', 'teacher_id'),
+    ('student', 'course_id'),
+    ('device', 'teacher_id'),
+    ('course', 'teacher_id'),
+    ('experiment', 'teacher_id'),
+    ('experiment', 'device_id'),
+    ('assignment', 'teacher_id'),
+    ('assignment_responses', 'student_id'),
+    ('assignment_responses', 'assignment_id'),
+    ('observation', 'experiment_id'),
+    ('observation_response', 'student_id'),
+    ('observation_response', 'observation_id'),
+]
+
+
+def dedupe(table, parent, student):
+    """drop rows that link the same pair twice, keeping one copy"""
+    dialect = op.get_context().dialect.name
+    if dialect == 'postgresql':
+        op.execute(f'DELETE FROM {table} a USING {table} b '
+                   f'WHERE a.ctid < b.ctid AND a.{parent} = b.{parent} AND a.{student} = b.{student}')
+    elif dialect == 'sqlite':
+        op.execute(f'DELETE FROM {table} WHERE rowid NOT IN '
+                   f'(SELECT min(rowid) FROM {table} GROUP BY {parent}, {student})')
+    else:
+        # no row id to tell the copies apart, rebuild the table from its distinct pairs
+        op.execute(f'CREATE TABLE {table}_distinct AS SELECT DISTINCT {parent}, {student} FROM {table}')
+        op.execute(f'DELETE FROM {table}')
+        op.execute(f'INSERT INTO {table} ({parent}, {student}) SELECT {parent}, {student} FROM {table}_distinct')
+        op.drop_table(f'{table}_distinct')
+
+
+def upgrade():
+    # the association tables had no key, drop rows that were linked twice before adding one
+    for table, parent, student in ASSOCIATIONS:
+        dedupe(table, parent, student)
+
+    for table, parent, student in ASSOCIATIONS:
+        # batch mode so sqlite, which cannot alter constraints, recreates the table instead
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.create_primary_key(f'{table}_pkey', [parent, student])
+        op.create_index(op.f(f'ix_{table}_{student}'), table, [student], unique=False)
+
+    for table, column in FOREIGN_KEYS:
+        op.create_index(op.f(f'ix_{table}_{column}'), table, [column], unique=False)
+
+
+def downgrade():
+    for table, column in reversed(FOREIGN_KEYS):
+        op.drop_index(op.f(f'ix_{table}_{column}'), table_name=table)
+
+    for table, parent, student in reversed(ASSOCIATIONS):
+        op.drop_index(op.f(f'ix_{table}_{student}'), table_name=table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_constraint(f'{table}_pkey', type_='primary')
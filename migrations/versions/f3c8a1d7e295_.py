@@ -0,0 +1,37 @@
+"""empty message
+
+Revision ID: f3c8a1d7e295
+Revises: d9a4f2c6b1e8
+Create Date: 2026-10-19 10:04:18.771942
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8a1d7e295'
+down_revision = 'd9a4f2c6b1e8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # readings without a location get '', the unique constraint would let null locations repeat
+    op.execute("UPDATE reading SET subject_location_id = '' WHERE subject_location_id IS NULL")
+
+    # concurrent fetches of a window could store a reading twice, keep the first copy
+    # (the derived table lets mysql read the table it deletes from)
+    op.execute('DELETE FROM reading WHERE id NOT IN (SELECT id FROM '
+               '(SELECT min(id) AS id FROM reading GROUP BY device_id, ts, attribute, subject_location_id) AS keep)')
+
+    # batch mode so sqlite, which cannot alter columns or constraints, recreates the table instead
+    with op.batch_alter_table('reading') as batch_op:
+        batch_op.alter_column('subject_location_id', existing_type=sa.String(length=100), nullable=False)
+        batch_op.create_unique_constraint('uq_reading_device_ts_attribute_location', ['device_id', 'ts', 'attribute', 'subject_location_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('reading') as batch_op:
+        batch_op.drop_constraint('uq_reading_device_ts_attribute_location', type_='unique')
+        batch_op.alter_column('subject_location_id', existing_type=sa.String(length=100), nullable=True)